@@ -1,59 +1,453 @@
 import json
 import os
 import psycopg2
+import psycopg2.pool
+import time
+import random
 import hashlib
 import secrets
 import base64
-import boto3
-import urllib.request
+import io
+import csv
+import gzip
+import urllib.parse
+import http.client
+import threading
+import select
+from concurrent.futures import ThreadPoolExecutor
 
 CORS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, X-User-Id, X-Driver-Id, X-Auth-Token'
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, X-User-Id, X-Driver-Id, X-Auth-Token, Idempotency-Key'
 }
 SCHEMA = 't_p8223105_sochi_transfer_websi'
 
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_IDLE = float(os.environ.get('DB_POOL_PING_IDLE', '30'))
+DB_POOL_WAIT = float(os.environ.get('DB_POOL_WAIT', '3'))
+
+_pool = None
+_last_used = {}
+_checked_out = set()
+
+class PooledConn:
+    '''Соединение из пула: close() возвращает его в пул вместо разрыва'''
+
+    def __init__(self, conn):
+        self._conn = conn
+        _checked_out.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        _checked_out.discard(self)
+        if conn is not None:
+            _last_used[id(conn)] = time.monotonic()
+            _get_pool().putconn(conn, close=bool(conn.closed))
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def _is_alive(conn):
+    if conn.closed:
+        return False
+    last = _last_used.get(id(conn))
+    if last is None or time.monotonic() - last < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor(); cur.execute('SELECT 1'); cur.close(); conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+class PoolExhausted(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_WAIT — обработчик отвечает 503, а не 500'''
+
+def _checkout(pool):
+    '''getconn() пула сразу падает с PoolError при DB_POOL_MAX занятых — ждём освобождения с коротким бэкоффом'''
+    deadline = time.monotonic() + DB_POOL_WAIT
+    delay = 0.01
+    while True:
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError:
+            if pool.closed or time.monotonic() >= deadline:
+                raise PoolExhausted('Все соединения с БД заняты')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
 def get_conn():
-    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+    '''Берёт соединение из пула тёплого контейнера; мёртвые соединения переоткрываются.
+    Одно соединение на запрос: хелперы получают cur обработчика, а не открывают своё'''
+    pool = _get_pool()
+    for _ in range(DB_POOL_MAX):
+        conn = _checkout(pool)
+        if _is_alive(conn):
+            return PooledConn(conn)
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return PooledConn(_checkout(pool))
+
+def release_conns():
+    '''Возвращает в пул соединения, которые обработчик не закрыл (ранний return, исключение)'''
+    for pc in list(_checked_out):
+        pc.close()
 
 def resp(status, body):
     return {'statusCode': status, 'headers': {'Content-Type': 'application/json', **CORS},
             'body': json.dumps(body, default=str), 'isBase64Encoded': False}
 
+SETTINGS_CHECK_INTERVAL = float(os.environ.get('SETTINGS_CHECK_INTERVAL', '5'))
+
+class SettingsCache:
+    '''Кэш site_settings на тёплый контейнер: перечитывается, только когда меняется версия в cache_versions'''
+
+    def __init__(self):
+        self.values = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    def snapshot(self, cur=None) -> dict:
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < SETTINGS_CHECK_INTERVAL:
+            return self.values
+        own = cur is None
+        if own:
+            conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT version FROM {SCHEMA}.cache_versions WHERE name='site_settings'")
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            if version != self.version:
+                cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings ORDER BY id")
+                self.values = {r[0]: r[1] for r in cur.fetchall()}
+                self.version = version
+            self.checked_at = now
+        finally:
+            if own:
+                cur.close(); conn.close()
+        return self.values
+
+    def invalidate(self):
+        self.version = None
+
+    def get(self, key: str, default: str = '', cur=None) -> str:
+        value = self.snapshot(cur).get(key)
+        return default if value is None or value == '' else value
+
+    def get_int(self, key: str, default: int = 0, cur=None) -> int:
+        try:
+            return int(self.get(key, str(default), cur))
+        except ValueError:
+            return default
+
+    def get_bool(self, key: str, default: bool = False, cur=None) -> bool:
+        return self.get(key, 'true' if default else 'false', cur) == 'true'
+
+    def subset(self, keys, cur=None) -> dict:
+        values = self.snapshot(cur)
+        return {k: values[k] for k in keys if k in values}
+
+settings_cache = SettingsCache()
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
+def idempotency_key(event) -> str:
+    headers = event.get('headers', {}) or {}
+    return (headers.get('Idempotency-Key') or headers.get('idempotency-key') or '').strip()[:200]
+
+def claim_idempotency_key(cur, scope: str, key: str, body: str):
+    '''Занимает ключ в транзакции бизнес-операции; если запрос с этим ключом уже выполнен — возвращает его ответ.
+    Параллельный повтор ждёт на первичном ключе, пока первый запрос не зафиксирует или не откатит транзакцию'''
+    fingerprint = hashlib.sha256((body or '').encode()).hexdigest()
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.idempotency_keys (scope, key, fingerprint, expires_at)
+        VALUES (%s, %s, %s, NOW() + make_interval(hours => %s))
+        ON CONFLICT (scope, key) DO UPDATE SET fingerprint=EXCLUDED.fingerprint, status_code=NULL, response=NULL,
+            created_at=NOW(), expires_at=EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < NOW()
+        RETURNING 1
+    ''', (scope, key, fingerprint, IDEMPOTENCY_TTL_HOURS))
+    if cur.fetchone():
+        return None
+    cur.execute(f"SELECT fingerprint, status_code, response FROM {SCHEMA}.idempotency_keys WHERE scope=%s AND key=%s", (scope, key))
+    stored_fingerprint, status_code, body = cur.fetchone()
+    if stored_fingerprint != fingerprint:
+        return resp(422, {'error': 'Ключ идемпотентности уже использован с другим запросом'})
+    if status_code is None:
+        return resp(409, {'error': 'Запрос с этим ключом ещё выполняется'})
+    return {'statusCode': status_code, 'headers': {'Content-Type': 'application/json', 'Idempotent-Replayed': 'true', **CORS},
+            'body': body, 'isBase64Encoded': False}
+
+def store_idempotent_response(cur, scope: str, key: str, response: dict) -> dict:
+    '''Сохраняет ответ в той же транзакции, что и бизнес-изменения'''
+    cur.execute(f"UPDATE {SCHEMA}.idempotency_keys SET status_code=%s, response=%s WHERE scope=%s AND key=%s",
+                (response['statusCode'], response['body'], scope, key))
+    return response
+
+SYNC_OVERLAP_SECONDS = 5
+TOMBSTONE_TTL_DAYS = 30
+
+def since_clause(params, column, joiner='WHERE'):
+    '''Условие для ?since=: только строки, изменённые после токена синхронизации'''
+    since = params.get('since')
+    if not since:
+        return '', []
+    return f' {joiner} {column} > %s', [since]
+
+def sync_meta(cur, params, table=None):
+    '''sync_token для следующего ?since= (с запасом на долгие транзакции) и id удалённых строк'''
+    meta = {}
+    since = params.get('since')
+    if since and table:
+        cur.execute(f"SELECT row_id FROM {SCHEMA}.deleted_rows WHERE table_name=%s AND deleted_at > %s", (table, since))
+        meta['deleted'] = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT LOCALTIMESTAMP - make_interval(secs => %s)", (SYNC_OVERLAP_SECONDS,))
+    meta['sync_token'] = cur.fetchone()[0].isoformat()
+    return meta
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '6'))
+
+_s3_client = None
+_s3_lock = threading.Lock()
+_upload_executor = None
+
+def get_s3():
+    '''Один boto3-клиент на тёплый контейнер: создание клиента дороже самой загрузки фото'''
+    global _s3_client
+    if _s3_client is None:
+        with _s3_lock:
+            if _s3_client is None:
+                import boto3  # botocore грузится ~0.5 с — только при загрузке документов
+                _s3_client = boto3.client('s3',
+                    endpoint_url='https://bucket.poehali.dev',
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+                )
+    return _s3_client
+
 def upload_s3(b64data, filename, folder):
-    s3 = boto3.client('s3',
-        endpoint_url='https://bucket.poehali.dev',
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    )
     if ',' in b64data:
         b64data = b64data.split(',', 1)[1]
     data = base64.b64decode(b64data)
     key = f'{folder}/{filename}'
-    s3.put_object(Bucket='files', Key=key, Body=data, ContentType='image/jpeg')
+    get_s3().put_object(Bucket='files', Key=key, Body=data, ContentType='image/jpeg')
     return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
 
+def upload_driver_files(did: int, files: dict, car_photos: list):
+    '''Параллельно загружает документы и фото авто водителя; возвращает (urls документов, urls фото, ошибки по файлам)'''
+    global _upload_executor
+    jobs = [(field, b64, f"{did}_{field}.jpg") for field, b64 in (files or {}).items() if b64 and field in DRIVER_DOC_FIELDS]
+    jobs += [(f'car_photo_{i}', b64, f"{did}_car_{i}.jpg") for i, b64 in enumerate((car_photos or [])[:5]) if b64]
+    if not jobs:
+        return {}, [], []
+    if _upload_executor is None:
+        _upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+    futures = [(name, _upload_executor.submit(upload_s3, b64, filename, 'drivers')) for name, b64, filename in jobs]
+    doc_urls, car_urls, errors = {}, [], []
+    for name, fut in futures:
+        try:
+            url = fut.result()
+        except Exception as e:
+            errors.append({'file': name, 'error': type(e).__name__})
+            continue
+        if name.startswith('car_photo_'):
+            car_urls.append(url)
+        else:
+            doc_urls[name] = url
+    return doc_urls, car_urls, errors
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = 0.2
+HTTP_POOL_SIZE = 4
+HTTP_BREAKER_THRESHOLD = int(os.environ.get('HTTP_BREAKER_THRESHOLD', '5'))
+HTTP_BREAKER_COOLDOWN = float(os.environ.get('HTTP_BREAKER_COOLDOWN', '30'))
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+class CircuitOpen(Exception):
+    '''Хост помечен нездоровым: запрос не отправляется до конца паузы'''
+
+class HttpClient:
+    '''Исходящие запросы к провайдерам: keep-alive пул на хост, раздельные таймауты соединения и чтения,
+    ретраи с джиттером и circuit breaker — после HTTP_BREAKER_THRESHOLD ошибок подряд хост пропускается
+    HTTP_BREAKER_COOLDOWN секунд, затем ровно одна пробная попытка решает, закрыть ли автомат'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.failures = {}
+        self.open_until = {}
+        self.probing = set()
+
+    def is_open(self, host: str) -> bool:
+        with self.lock:
+            return self.failures.get(host, 0) >= HTTP_BREAKER_THRESHOLD and (
+                self.open_until.get(host, 0) > time.monotonic() or host in self.probing)
+
+    def _admit(self, host: str):
+        '''Закрыт — пропускает; открыт — CircuitOpen до конца паузы; полуоткрыт — пропускает одну пробу, остальным CircuitOpen'''
+        with self.lock:
+            if self.failures.get(host, 0) < HTTP_BREAKER_THRESHOLD:
+                return
+            if self.open_until.get(host, 0) > time.monotonic() or host in self.probing:
+                raise CircuitOpen(host)
+            self.probing.add(host)
+
+    def _acquire(self, scheme: str, host: str):
+        with self.lock:
+            conns = self.idle.get((scheme, host)) or []
+            while conns:
+                conn = conns.pop()
+                # Читаемый простаивающий сокет — сервер уже закрыл соединение: запрос в него не отправляем
+                if conn.sock is not None and not select.select([conn.sock], [], [], 0)[0]:
+                    return conn, True
+                conn.close()
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return cls(host, timeout=HTTP_CONNECT_TIMEOUT), False
+
+    def _release(self, scheme: str, host: str, conn):
+        with self.lock:
+            conns = self.idle.setdefault((scheme, host), [])
+            if len(conns) < HTTP_POOL_SIZE:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def _record(self, host: str, ok: bool):
+        with self.lock:
+            self.probing.discard(host)
+            if ok:
+                self.failures.pop(host, None); self.open_until.pop(host, None)
+                return
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= HTTP_BREAKER_THRESHOLD:
+                self.open_until[host] = time.monotonic() + HTTP_BREAKER_COOLDOWN
+
+    def _send(self, scheme: str, host: str, method: str, path: str, body, headers: dict, read_timeout: float):
+        '''Одна попытка; у исключения атрибут request_sent — успел ли запрос уйти на сервер'''
+        while True:
+            conn, reused = self._acquire(scheme, host)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(read_timeout)
+                conn.request(method, path, body=body, headers=headers)
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused:
+                    # Сервер закрыл простаивающее соединение, запрос не ушёл — это не сбой провайдера
+                    continue
+                e.request_sent = False
+                raise
+            try:
+                r = conn.getresponse()
+                data = r.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                e.request_sent = True
+                raise
+            if r.will_close:
+                conn.close()
+            else:
+                self._release(scheme, host, conn)
+            return r.status, data
+
+    def request(self, method: str, url: str, body: bytes = None, headers: dict = None,
+                retries: int = HTTP_RETRIES, read_timeout: float = HTTP_READ_TIMEOUT, idempotent: bool = None):
+        '''Возвращает (status, body); при открытом автомате — CircuitOpen. Ошибка до отправки и 429 повторяются всегда,
+        5xx, обрыв и таймаут чтения после отправки — только для идемпотентных запросов (GET/HEAD/PUT/DELETE
+        или с Idempotence-Key): иначе повтор мог бы создать второй платёж или сообщение'''
+        u = urllib.parse.urlsplit(url)
+        path = (u.path or '/') + (f'?{u.query}' if u.query else '')
+        headers = headers or {}
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS or any(k.lower() == 'idempotence-key' for k in headers)
+        attempt = 0
+        while True:
+            self._admit(u.netloc)
+            try:
+                status, data = self._send(u.scheme, u.netloc, method, path, body, headers, read_timeout)
+            except Exception as e:
+                self._record(u.netloc, False)
+                sent = getattr(e, 'request_sent', True)
+                if not isinstance(e, (http.client.HTTPException, OSError)) or attempt >= retries or (sent and not idempotent):
+                    raise
+            else:
+                if status < 500 and status != 429:
+                    self._record(u.netloc, True)
+                    return status, data
+                self._record(u.netloc, False)
+                if attempt >= retries or (status != 429 and not idempotent):
+                    return status, data
+            time.sleep(random.uniform(0, HTTP_BACKOFF * 2 ** attempt))
+            attempt += 1
+
+http_client = HttpClient()
+
+DRIVER_DOC_FIELDS = ('passport_photo', 'license_front', 'license_back', 'car_tech_passport_front', 'car_tech_passport_back')
+
+def is_own_upload(url, folder: str) -> bool:
+    '''Принимаем только адреса файлов проекта из нужной папки, а не произвольные ссылки'''
+    prefix = f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID', '')}/bucket/{folder}/"
+    return isinstance(url, str) and url.startswith(prefix) and '..' not in url
+
 def send_notification(text):
     token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
     chat_id = os.environ.get('TELEGRAM_CHAT_ID', '')
     if not token or not chat_id:
         return
     payload = json.dumps({'chat_id': chat_id, 'text': text, 'parse_mode': 'Markdown'}).encode()
-    req = urllib.request.Request(
-        f'https://api.telegram.org/bot{token}/sendMessage',
-        data=payload,
-        headers={'Content-Type': 'application/json'}
-    )
     try:
-        urllib.request.urlopen(req, timeout=5)
+        http_client.request('POST', f'https://api.telegram.org/bot{token}/sendMessage', payload,
+                            {'Content-Type': 'application/json'}, retries=0, read_timeout=5)
     except Exception:
         pass
 
 
+RESET_CODE_TTL_MINUTES = int(os.environ.get('RESET_CODE_TTL_MINUTES', '15'))
+RESET_CODE_MAX_ATTEMPTS = 5
+
+def sweep_reset_codes(cur):
+    cur.execute(f"DELETE FROM {SCHEMA}.password_reset_codes WHERE expires_at < NOW()")
+    return cur.rowcount
+
+def issue_reset_code(cur, account_type, phone):
+    code = str(100000 + secrets.randbelow(900000))
+    sweep_reset_codes(cur)
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.password_reset_codes (account_type, phone, code, attempts, expires_at)
+        VALUES (%s, %s, %s, 0, NOW() + make_interval(mins => %s))
+        ON CONFLICT (phone, account_type) DO UPDATE
+        SET code=EXCLUDED.code, attempts=0, expires_at=EXCLUDED.expires_at, created_at=NOW()
+    ''', (account_type, phone, code, RESET_CODE_TTL_MINUTES))
+    return code
+
+def consume_reset_code(cur, account_type, phone, code):
+    '''Проверяет код и тратит попытку; верный код удаляется. Вызывающий обязан сделать commit в любом случае'''
+    cur.execute(f'''
+        UPDATE {SCHEMA}.password_reset_codes SET attempts=attempts+1
+        WHERE phone=%s AND account_type=%s AND expires_at > NOW() AND attempts < %s
+        RETURNING code
+    ''', (phone, account_type, RESET_CODE_MAX_ATTEMPTS))
+    row = cur.fetchone()
+    if not row or not secrets.compare_digest(row[0], code):
+        return False
+    cur.execute(f"DELETE FROM {SCHEMA}.password_reset_codes WHERE phone=%s AND account_type=%s", (phone, account_type))
+    return True
+
+
 # ===== ADMIN AUTH =====
 def handle_admin(method, event, params, data):
     if method == 'POST':
@@ -227,16 +621,11 @@ def handle_users(method, event, params, data, headers):
             phone = data.get('phone', '').strip()
             if not phone:
                 return resp(400, {'error': 'Телефон обязателен'})
-            import random
-            code = str(random.randint(100000, 999999))
             conn = get_conn(); cur = conn.cursor()
             cur.execute(f"SELECT id FROM {SCHEMA}.users WHERE phone=%s", (phone,))
             if not cur.fetchone():
                 cur.close(); conn.close(); return resp(404, {'error': 'Пользователь не найден'})
-            cur.execute(f'''
-                INSERT INTO {SCHEMA}.site_settings (key, value) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value
-            ''', (f'reset_code_{phone}', code))
+            code = issue_reset_code(cur, 'user', phone)
             conn.commit(); cur.close(); conn.close()
             return resp(200, {'message': 'Код отправлен', 'code': code})
         elif action == 'confirm_reset':
@@ -246,13 +635,10 @@ def handle_users(method, event, params, data, headers):
             if not phone or not code or not new_password:
                 return resp(400, {'error': 'Телефон, код и новый пароль обязательны'})
             conn = get_conn(); cur = conn.cursor()
-            cur.execute(f"SELECT value FROM {SCHEMA}.site_settings WHERE key=%s", (f'reset_code_{phone}',))
-            row = cur.fetchone()
-            if not row or row[0] != code:
-                cur.close(); conn.close(); return resp(400, {'error': 'Неверный или истёкший код'})
+            if not consume_reset_code(cur, 'user', phone, code):
+                conn.commit(); cur.close(); conn.close(); return resp(400, {'error': 'Неверный или истёкший код'})
             cur.execute(f"UPDATE {SCHEMA}.users SET password_hash=%s,updated_at=NOW() WHERE phone=%s",
                         (hash_password(new_password), phone))
-            cur.execute(f"DELETE FROM {SCHEMA}.site_settings WHERE key=%s", (f'reset_code_{phone}',))
             conn.commit(); cur.close(); conn.close()
             return resp(200, {'message': 'Пароль изменён'})
     elif method == 'GET':
@@ -293,6 +679,36 @@ def handle_users(method, event, params, data, headers):
     return resp(405, {'error': 'Method not allowed'})
 
 
+def claim_order(cur, driver_id, order_id=None):
+    '''Закрепляет свободный заказ за водителем одним запросом. После ожидания блокировки строки
+    условие driver_id IS NULL перепроверяется, поэтому из гонки выходит ровно один победитель.
+    Без order_id берётся самый старый свободный заказ, занятые другими транзакциями строки пропускаются'''
+    if order_id is None:
+        target = f'''(SELECT id FROM {SCHEMA}.orders WHERE driver_id IS NULL AND status_id=1
+                      ORDER BY created_at, id LIMIT 1 FOR UPDATE SKIP LOCKED)'''
+    else:
+        target = '%(order_id)s'
+    cur.execute(f'''
+        WITH drv AS (
+            SELECT id, COALESCE(commission_rate, 15) AS rate FROM {SCHEMA}.drivers WHERE id=%(driver_id)s
+        ), claimed AS (
+            UPDATE {SCHEMA}.orders o
+            SET driver_id=drv.id, status_id=2,
+                commission_amount=ROUND(COALESCE(o.price, 0) * drv.rate / 100, 2),
+                driver_amount=COALESCE(o.price, 0) - ROUND(COALESCE(o.price, 0) * drv.rate / 100, 2),
+                updated_at=NOW()
+            FROM drv
+            WHERE o.id={target} AND o.driver_id IS NULL AND o.status_id=1
+            RETURNING o.id, o.commission_amount, o.driver_amount
+        ), counted AS (
+            UPDATE {SCHEMA}.drivers d SET total_orders=d.total_orders+1
+            FROM claimed WHERE d.id=%(driver_id)s
+        )
+        SELECT id, commission_amount, driver_amount FROM claimed
+    ''', {'driver_id': int(driver_id), 'order_id': int(order_id) if order_id is not None else None})
+    return cur.fetchone()
+
+
 # ===== DRIVERS =====
 def handle_drivers(method, event, params, data, headers):
     driver_id = headers.get('X-Driver-Id') or params.get('driver_id')
@@ -325,10 +741,8 @@ def handle_drivers(method, event, params, data, headers):
                 return resp(400, {'error': 'Телефон, имя и пароль обязательны'})
             conn = get_conn(); cur = conn.cursor()
             # Проверка лимита регистрации
-            cur.execute(f"SELECT value FROM {SCHEMA}.site_settings WHERE key='driver_registration_limit'")
-            limit_row = cur.fetchone()
-            if limit_row and limit_row[0] and limit_row[0] != '0' and limit_row[0] != '':
-                limit = int(limit_row[0])
+            limit = settings_cache.get_int('driver_registration_limit', 0, cur)
+            if limit:
                 cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.drivers")
                 total = cur.fetchone()[0]
                 if total >= limit:
@@ -348,36 +762,28 @@ def handle_drivers(method, event, params, data, headers):
                   driver_type, car_category))
             did = cur.fetchone()[0]
             conn.commit()
-            # Загрузка документов (опционально, не блокирует регистрацию)
-            try:
-                files = data.get('files', {})
-                updates = []; vals = []
-                for field, b64 in files.items():
-                    if b64 and field in ['passport_photo','license_front','license_back','car_tech_passport_front','car_tech_passport_back']:
-                        url = upload_s3(b64, f"{did}_{field}.jpg", 'drivers')
-                        updates.append(f"{field}_url=%s"); vals.append(url)
-                if updates:
-                    vals.append(did)
-                    cur.execute(f"UPDATE {SCHEMA}.drivers SET {','.join(updates)} WHERE id=%s", vals)
-                    conn.commit()
-                car_photos = data.get('car_photos', [])
-                if car_photos:
-                    urls = []
-                    for i, b64 in enumerate(car_photos[:5]):
-                        if b64:
-                            urls.append(upload_s3(b64, f"{did}_car_{i}.jpg", 'drivers'))
-                    if urls:
-                        cur.execute(f"UPDATE {SCHEMA}.drivers SET car_photos_urls=%s WHERE id=%s", (json.dumps(urls), did))
-                        conn.commit()
-            except Exception:
-                pass  # Документы можно загрузить позже
+            # Документы: адреса из ?resource=uploads (tariffs) или base64, загружаемые параллельно.
+            # Ошибки загрузки не блокируют регистрацию — документы можно прислать позже
+            doc_urls = {k: v for k, v in (data.get('file_urls') or {}).items() if k in DRIVER_DOC_FIELDS and is_own_upload(v, 'drivers')}
+            car_urls = [u for u in (data.get('car_photo_urls') or [])[:5] if is_own_upload(u, 'drivers')]
+            uploaded_docs, uploaded_car, upload_errors = upload_driver_files(did, data.get('files'), data.get('car_photos'))
+            doc_urls.update(uploaded_docs)
+            car_urls = (car_urls + uploaded_car)[:5]
+            if doc_urls or car_urls:
+                sets = [f'{k}_url=%s' for k in doc_urls] + (['car_photos_urls=%s'] if car_urls else [])
+                cur.execute(f"UPDATE {SCHEMA}.drivers SET {','.join(sets)} WHERE id=%s",
+                            list(doc_urls.values()) + ([json.dumps(car_urls)] if car_urls else []) + [did])
+                conn.commit()
             cur.close(); conn.close()
             try:
                 send_notification(f"🚗 *Новый водитель #{did}*\n{name} · {phone}\n{data.get('car_brand','')} {data.get('car_model','')}")
             except Exception:
                 pass
             token = secrets.token_urlsafe(32)
-            return resp(201, {'token': token, 'driver': {'id': did, 'name': name, 'phone': phone, 'status': 'pending'}})
+            result = {'token': token, 'driver': {'id': did, 'name': name, 'phone': phone, 'status': 'pending'}}
+            if upload_errors:
+                result['upload_errors'] = upload_errors
+            return resp(201, result)
         elif action == 'login':
             phone = data.get('phone','').strip()
             password = data.get('password','')
@@ -395,37 +801,26 @@ def handle_drivers(method, event, params, data, headers):
             cur.execute(f"UPDATE {SCHEMA}.drivers SET is_online=%s WHERE id=%s", (data.get('is_online', False), int(driver_id)))
             conn.commit(); cur.close(); conn.close()
             return resp(200, {'message': 'Статус обновлён'})
-        elif action == 'accept_order' and driver_id:
-            order_id = data.get('order_id')
+        elif action in ('accept_order', 'claim_next') and driver_id:
+            order_id = data.get('order_id') if action == 'accept_order' else None
+            if action == 'accept_order' and not order_id:
+                return resp(400, {'error': 'order_id обязателен'})
             conn = get_conn(); cur = conn.cursor()
-            cur.execute(f"SELECT id,price FROM {SCHEMA}.orders WHERE id=%s AND driver_id IS NULL AND status_id=1", (order_id,))
-            row = cur.fetchone()
-            if not row:
-                cur.close(); conn.close(); return resp(400, {'error': 'Заказ уже принят или не найден'})
-            cur.execute(f"SELECT commission_rate FROM {SCHEMA}.drivers WHERE id=%s", (int(driver_id),))
-            commission_rate = float((cur.fetchone() or [15])[0])
-            price = float(row[1] or 0)
-            commission = round(price * commission_rate / 100, 2)
-            driver_amount = price - commission
-            cur.execute(f"UPDATE {SCHEMA}.orders SET driver_id=%s,status_id=2,commission_amount=%s,driver_amount=%s,updated_at=NOW() WHERE id=%s",
-                        (int(driver_id), commission, driver_amount, order_id))
-            cur.execute(f"UPDATE {SCHEMA}.drivers SET total_orders=total_orders+1 WHERE id=%s", (int(driver_id),))
+            row = claim_order(cur, driver_id, order_id)
             conn.commit(); cur.close(); conn.close()
-            return resp(200, {'message': 'Заказ принят', 'commission': commission, 'driver_amount': driver_amount})
+            if not row:
+                return resp(400, {'error': 'Заказ уже принят или не найден' if order_id else 'Свободных заказов нет'})
+            oid, commission, driver_amount = row
+            return resp(200, {'message': 'Заказ принят', 'order_id': oid, 'commission': float(commission), 'driver_amount': float(driver_amount)})
         elif action == 'request_reset':
             phone = data.get('phone', '').strip()
             if not phone:
                 return resp(400, {'error': 'Телефон обязателен'})
-            import random
-            code = str(random.randint(100000, 999999))
             conn = get_conn(); cur = conn.cursor()
             cur.execute(f"SELECT id FROM {SCHEMA}.drivers WHERE phone=%s", (phone,))
             if not cur.fetchone():
                 cur.close(); conn.close(); return resp(404, {'error': 'Водитель не найден'})
-            cur.execute(f'''
-                INSERT INTO {SCHEMA}.site_settings (key, value) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value
-            ''', (f'reset_code_driver_{phone}', code))
+            code = issue_reset_code(cur, 'driver', phone)
             conn.commit(); cur.close(); conn.close()
             return resp(200, {'message': 'Код отправлен', 'code': code})
         elif action == 'confirm_reset':
@@ -435,13 +830,10 @@ def handle_drivers(method, event, params, data, headers):
             if not phone or not code or not new_password:
                 return resp(400, {'error': 'Телефон, код и новый пароль обязательны'})
             conn = get_conn(); cur = conn.cursor()
-            cur.execute(f"SELECT value FROM {SCHEMA}.site_settings WHERE key=%s", (f'reset_code_driver_{phone}',))
-            row = cur.fetchone()
-            if not row or row[0] != code:
-                cur.close(); conn.close(); return resp(400, {'error': 'Неверный или истёкший код'})
+            if not consume_reset_code(cur, 'driver', phone, code):
+                conn.commit(); cur.close(); conn.close(); return resp(400, {'error': 'Неверный или истёкший код'})
             cur.execute(f"UPDATE {SCHEMA}.drivers SET password_hash=%s,updated_at=NOW() WHERE phone=%s",
                         (hash_password(new_password), phone))
-            cur.execute(f"DELETE FROM {SCHEMA}.site_settings WHERE key=%s", (f'reset_code_driver_{phone}',))
             conn.commit(); cur.close(); conn.close()
             return resp(200, {'message': 'Пароль изменён'})
     elif method == 'GET':
@@ -468,19 +860,21 @@ def handle_drivers(method, event, params, data, headers):
             return resp(200, {'driver': dict(zip(cols, row))})
         elif action == 'orders' and driver_id:
             conn = get_conn(); cur = conn.cursor()
+            cond, vals = since_clause(params, 'o.updated_at', 'AND')
             cur.execute(f'''
                 SELECT o.id,o.from_location,o.to_location,o.pickup_datetime,o.passenger_name,o.passenger_phone,
                        o.price,o.driver_amount,o.commission_amount,o.transfer_type,o.car_class,o.passengers_count,o.notes,o.created_at,
                        s.name as status_name, s.color as status_color
                 FROM {SCHEMA}.orders o
                 LEFT JOIN {SCHEMA}.order_statuses s ON o.status_id=s.id
-                WHERE o.driver_id={int(driver_id)}
+                WHERE o.driver_id={int(driver_id)}{cond}
                 ORDER BY o.created_at DESC
-            ''')
+            ''', vals)
             cols = [d[0] for d in cur.description]
             orders = [dict(zip(cols, r)) for r in cur.fetchall()]
+            meta = sync_meta(cur, params)
             cur.close(); conn.close()
-            return resp(200, {'orders': orders})
+            return resp(200, {'orders': orders, **meta})
         elif action == 'available_orders':
             conn = get_conn(); cur = conn.cursor()
             cur.execute(f'''
@@ -495,11 +889,13 @@ def handle_drivers(method, event, params, data, headers):
             return resp(200, {'orders': orders})
         elif action == 'list':
             conn = get_conn(); cur = conn.cursor()
-            cur.execute(f"SELECT id,name,phone,email,car_brand,car_model,car_color,car_number,status,is_active,is_online,balance,commission_rate,rating,total_orders,driver_type,car_category,created_at FROM {SCHEMA}.drivers ORDER BY created_at DESC")
+            cond, vals = since_clause(params, 'updated_at')
+            cur.execute(f"SELECT id,name,phone,email,car_brand,car_model,car_color,car_number,status,is_active,is_online,balance,commission_rate,rating,total_orders,driver_type,car_category,created_at FROM {SCHEMA}.drivers{cond} ORDER BY created_at DESC", vals)
             cols = [d[0] for d in cur.description]
             drivers = [dict(zip(cols, r)) for r in cur.fetchall()]
+            meta = sync_meta(cur, params)
             cur.close(); conn.close()
-            return resp(200, {'drivers': drivers})
+            return resp(200, {'drivers': drivers, **meta})
     elif method == 'PUT':
         data_put = json.loads(event.get('body', '{}'))
         action = data_put.get('action', '')
@@ -577,11 +973,13 @@ def handle_reviews(method, event, params, data, headers):
             cur.close(); conn.close()
             return resp(200, {'reviews': rows})
         elif action == 'list':
-            cur.execute(f"SELECT r.id,r.author_name,r.rating,r.text,r.type,r.source,r.status,r.is_approved,r.created_at,r.driver_id,r.user_id,r.order_id,r.admin_reply,d.name as driver_name FROM {SCHEMA}.reviews r LEFT JOIN {SCHEMA}.drivers d ON r.driver_id=d.id ORDER BY r.created_at DESC")
+            cond, vals = since_clause(params, 'r.updated_at')
+            cur.execute(f"SELECT r.id,r.author_name,r.rating,r.text,r.type,r.source,r.status,r.is_approved,r.created_at,r.driver_id,r.user_id,r.order_id,r.admin_reply,d.name as driver_name FROM {SCHEMA}.reviews r LEFT JOIN {SCHEMA}.drivers d ON r.driver_id=d.id{cond} ORDER BY r.created_at DESC", vals)
             cols = [d[0] for d in cur.description]
             rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+            meta = sync_meta(cur, params, 'reviews')
             cur.close(); conn.close()
-            return resp(200, {'reviews': rows})
+            return resp(200, {'reviews': rows, **meta})
 
     elif method == 'POST':
         text = data.get('text', '').strip()
@@ -625,9 +1023,7 @@ def handle_settings(method, event, params, data):
     conn = get_conn(); cur = conn.cursor()
 
     if method == 'GET':
-        cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings ORDER BY id")
-        rows = cur.fetchall()
-        settings = {row[0]: row[1] for row in rows}
+        settings = settings_cache.snapshot(cur)
         cur.close(); conn.close()
         return resp(200, {'settings': settings})
 
@@ -637,12 +1033,82 @@ def handle_settings(method, event, params, data):
             cur.execute(f"INSERT INTO {SCHEMA}.site_settings (key,value,updated_at) VALUES (%s,%s,NOW()) ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value,updated_at=NOW()",
                         (str(key), str(value) if value is not None else ''))
         conn.commit(); cur.close(); conn.close()
+        settings_cache.invalidate()
         return resp(200, {'message': 'Настройки сохранены'})
 
     cur.close(); conn.close()
     return resp(405, {'error': 'Method not allowed'})
 
 
+# ===== EXPORT =====
+# Та же выгрузка есть в orders/index.py: функции деплоятся по отдельности, правки вносить в обе
+EXPORT_BATCH = int(os.environ.get('EXPORT_BATCH', '2000'))
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+
+def date_range_clause(params, column: str):
+    '''Фильтр выгрузки по ?date_from=&date_to= (включительно)'''
+    where, values = [], []
+    if params.get('date_from'):
+        where.append(f'{column} >= %s'); values.append(params['date_from'])
+    if params.get('date_to'):
+        where.append(f'{column} < %s::date + 1'); values.append(params['date_to'])
+    return (' WHERE ' + ' AND '.join(where)) if where else '', values
+
+def export_response(conn, name: str, sql: str, values: list, params: dict) -> dict:
+    """Выгрузка через именованный серверный курсор: строки читаются пачками по EXPORT_BATCH
+    и сразу пишутся в CSV или NDJSON (?format=ndjson), при ?gzip=1 — в сжатый поток.
+    Буфер больше EXPORT_MAX_BYTES — 413: без gzip предлагаем сжатие, со сжатием — диапазон короче"""
+    fmt = 'ndjson' if params.get('format') == 'ndjson' else 'csv'
+    gz = params.get('gzip') in ('1', 'true')
+    raw = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=raw, mode='wb') if gz else raw
+    out = io.TextIOWrapper(sink, encoding='utf-8', newline='')
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer:
+        out.write('\ufeff')
+    cur = conn.cursor(name=f'export_{name}_{secrets.token_hex(4)}')
+    too_large = False
+    try:
+        cur.execute(sql, values)
+        cols = None
+        while True:
+            batch = cur.fetchmany(EXPORT_BATCH)
+            if cols is None:
+                cols = [d[0] for d in cur.description]
+                if writer:
+                    writer.writerow(cols)
+            if not batch:
+                break
+            for row in batch:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(dict(zip(cols, row)), default=str, ensure_ascii=False) + '\n')
+            out.flush()
+            if raw.tell() > EXPORT_MAX_BYTES:
+                too_large = True
+                break
+    finally:
+        cur.close(); conn.rollback(); conn.close()
+    if too_large:
+        raw.close()
+        return resp(413, {'error': 'Выгрузка слишком большая: сократите период' if gz else 'Выгрузка слишком большая: добавьте gzip=1 или сократите период'})
+    out.flush(); out.detach()
+    if gz:
+        sink.close()
+    filename = f'{name}.{fmt}' + ('.gz' if gz else '')
+    content_type = 'application/gzip' if gz else ('text/csv; charset=utf-8' if writer else 'application/x-ndjson')
+    # Тело собирается прямо из буфера BytesIO без промежуточной копии getvalue(); буфер освобождается сразу.
+    # base64 (+33%) — только для gzip, текстовая выгрузка уходит как есть
+    with raw.getbuffer() as view:
+        body = base64.b64encode(view) if gz else str(view, 'utf-8')
+    raw.close()
+    return {'statusCode': 200,
+            'headers': {'Content-Type': content_type, 'Content-Disposition': f'attachment; filename="{filename}"', **CORS},
+            'body': body.decode('ascii') if gz else body,
+            'isBase64Encoded': gz}
+
+
 def handle_balance(method, event, params, data, headers):
     user_id = headers.get('X-User-Id') or params.get('user_id')
     driver_id = headers.get('X-Driver-Id') or params.get('driver_id')
@@ -663,23 +1129,50 @@ def handle_balance(method, event, params, data, headers):
             cur.close(); conn.close()
             return resp(200, {'transactions': rows})
         elif action == 'withdrawals':
-            cur.execute(f"SELECT w.id,w.amount,w.requisites,w.status,w.admin_note,w.created_at,u.name as user_name,u.phone as user_phone,d.name as driver_name,d.phone as driver_phone FROM {SCHEMA}.withdrawal_requests w LEFT JOIN {SCHEMA}.users u ON w.user_id=u.id LEFT JOIN {SCHEMA}.drivers d ON w.driver_id=d.id ORDER BY w.created_at DESC")
+            cond, vals = since_clause(params, 'w.updated_at')
+            cur.execute(f"SELECT w.id,w.amount,w.requisites,w.status,w.admin_note,w.created_at,u.name as user_name,u.phone as user_phone,d.name as driver_name,d.phone as driver_phone FROM {SCHEMA}.withdrawal_requests w LEFT JOIN {SCHEMA}.users u ON w.user_id=u.id LEFT JOIN {SCHEMA}.drivers d ON w.driver_id=d.id{cond} ORDER BY w.created_at DESC", vals)
             cols = [d[0] for d in cur.description]
             rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+            meta = sync_meta(cur, params)
             cur.close(); conn.close()
-            return resp(200, {'withdrawals': rows})
+            return resp(200, {'withdrawals': rows, **meta})
+        elif action == 'export':
+            # Журнал операций по балансу за период: ?date_from=&date_to=, format=csv|ndjson, gzip=1
+            cond, vals = date_range_clause(params, 't.created_at')
+            if user_id:
+                cond += (' AND ' if cond else ' WHERE ') + 't.user_id=%s'; vals.append(int(user_id))
+            elif driver_id:
+                cond += (' AND ' if cond else ' WHERE ') + 't.driver_id=%s'; vals.append(int(driver_id))
+            cur.close()
+            return export_response(conn, 'transactions', f'''
+                SELECT t.id, t.created_at, t.type, t.amount, t.status, t.description,
+                       t.user_id, u.name as user_name, u.phone as user_phone,
+                       t.driver_id, d.name as driver_name, d.phone as driver_phone
+                FROM {SCHEMA}.balance_transactions t
+                LEFT JOIN {SCHEMA}.users u ON t.user_id=u.id
+                LEFT JOIN {SCHEMA}.drivers d ON t.driver_id=d.id{cond}
+                ORDER BY t.created_at, t.id
+            ''', vals, params)
         elif action == 'deposits':
-            cur.execute(f"SELECT dp.id,dp.amount,dp.payment_method,dp.status,dp.admin_note,dp.created_at,u.name as user_name,u.phone as user_phone,d.name as driver_name,d.phone as driver_phone FROM {SCHEMA}.deposit_requests dp LEFT JOIN {SCHEMA}.users u ON dp.user_id=u.id LEFT JOIN {SCHEMA}.drivers d ON dp.driver_id=d.id ORDER BY dp.created_at DESC")
+            cond, vals = since_clause(params, 'dp.updated_at')
+            cur.execute(f"SELECT dp.id,dp.amount,dp.payment_method,dp.status,dp.admin_note,dp.created_at,u.name as user_name,u.phone as user_phone,d.name as driver_name,d.phone as driver_phone FROM {SCHEMA}.deposit_requests dp LEFT JOIN {SCHEMA}.users u ON dp.user_id=u.id LEFT JOIN {SCHEMA}.drivers d ON dp.driver_id=d.id{cond} ORDER BY dp.created_at DESC", vals)
             cols = [d[0] for d in cur.description]
             rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+            meta = sync_meta(cur, params)
             cur.close(); conn.close()
-            return resp(200, {'deposits': rows})
+            return resp(200, {'deposits': rows, **meta})
 
     elif method == 'POST':
         action = data.get('action', 'withdraw')
         amount = float(data.get('amount', 0))
         uid = int(user_id) if user_id else None
         did = int(driver_id) if driver_id else None
+        idem_key = idempotency_key(event) if action in ('withdraw', 'deposit') else ''
+        if idem_key:
+            replay = claim_idempotency_key(cur, f'balance_{action}', idem_key, event.get('body'))
+            if replay:
+                cur.close(); conn.close()
+                return replay
 
         if action == 'withdraw':
             requisites = data.get('requisites', '').strip()
@@ -696,9 +1189,11 @@ def handle_balance(method, event, params, data, headers):
                 return resp(400, {'error': 'Недостаточно средств'})
             cur.execute(f"INSERT INTO {SCHEMA}.withdrawal_requests (user_id,driver_id,amount,requisites,status) VALUES (%s,%s,%s,%s,'pending') RETURNING id",
                         (uid, did, amount, requisites))
-            wid = cur.fetchone()[0]
+            response = resp(201, {'id': cur.fetchone()[0], 'message': 'Заявка на вывод создана'})
+            if idem_key:
+                store_idempotent_response(cur, 'balance_withdraw', idem_key, response)
             conn.commit(); cur.close(); conn.close()
-            return resp(201, {'id': wid, 'message': 'Заявка на вывод создана'})
+            return response
 
         elif action == 'deposit':
             payment_method = data.get('payment_method', '').strip()
@@ -707,9 +1202,11 @@ def handle_balance(method, event, params, data, headers):
                 return resp(400, {'error': 'Сумма обязательна'})
             cur.execute(f"INSERT INTO {SCHEMA}.deposit_requests (user_id,driver_id,amount,payment_method,status) VALUES (%s,%s,%s,%s,'pending') RETURNING id",
                         (uid, did, amount, payment_method))
-            dep_id = cur.fetchone()[0]
+            response = resp(201, {'id': cur.fetchone()[0], 'message': 'Заявка на пополнение создана'})
+            if idem_key:
+                store_idempotent_response(cur, 'balance_deposit', idem_key, response)
             conn.commit(); cur.close(); conn.close()
-            return resp(201, {'id': dep_id, 'message': 'Заявка на пополнение создана'})
+            return response
 
     elif method == 'PUT':
         action = data.get('action', '')
@@ -821,8 +1318,23 @@ def handle_managers(method, event, params, data):
     return resp(405, {'error': 'Method not allowed'})
 
 
+# ===== MAINTENANCE =====
+def handle_maintenance(method, event, params, data):
+    '''Периодическая уборка просроченных записей — вызывается по таймеру'''
+    if method != 'POST':
+        return resp(405, {'error': 'Method not allowed'})
+    conn = get_conn(); cur = conn.cursor()
+    result = {'reset_codes': sweep_reset_codes(cur)}
+    cur.execute(f"DELETE FROM {SCHEMA}.deleted_rows WHERE deleted_at < LOCALTIMESTAMP - make_interval(days => %s)", (TOMBSTONE_TTL_DAYS,))
+    result['tombstones'] = cur.rowcount
+    cur.execute(f"DELETE FROM {SCHEMA}.idempotency_keys WHERE expires_at < NOW()")
+    result['idempotency_keys'] = cur.rowcount
+    conn.commit(); cur.close(); conn.close()
+    return resp(200, {'swept': result})
+
+
 def handler(event: dict, context) -> dict:
-    '''Мультироутер авторизации: admin, users, drivers, reviews, settings, balance, managers — по параметру ?resource='''
+    '''Мультироутер авторизации: admin, users, drivers, reviews, settings, balance, managers, maintenance — по параметру ?resource='''
     if event.get('httpMethod') == 'OPTIONS':
         return {'statusCode': 200, 'headers': {**CORS, 'Access-Control-Max-Age': '86400'}, 'body': ''}
 
@@ -850,7 +1362,13 @@ def handler(event: dict, context) -> dict:
             return handle_balance(method, event, params, data, headers)
         elif resource == 'managers':
             return handle_managers(method, event, params, data)
+        elif resource == 'maintenance':
+            return handle_maintenance(method, event, params, data)
         else:
             return handle_admin(method, event, params, data)
+    except PoolExhausted as e:
+        return resp(503, {'error': str(e)})
     except Exception as e:
-        return resp(500, {'error': str(e)})
\ No newline at end of file
+        return resp(500, {'error': str(e)})
+    finally:
+        release_conns()
@@ -0,0 +1,176 @@
+'''Гонка водителей за заказы: claim_order из auth/index.py под конкуренцией на реальной БД.
+
+    DATABASE_URL=... python3 backend/claim_race_test.py [--drivers 50] [--orders 10] [--json]
+
+Создаёт временных водителей и свободные заказы, затем потоки-водители одновременно (через Barrier) пытаются принять
+каждый заказ (accept_order), а после сброса — разбирают их через claim_next. Проверяется, что у каждого заказа ровно
+один победитель, driver_id в БД совпадает с победителем, а total_orders водителей вырос ровно на число заказов.
+Фаза claim_next пропускается, если в БД есть чужие свободные заказы: SKIP LOCKED взял бы и их.
+Временные строки удаляются в конце. Код выхода 1 при нарушении инварианта.'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+
+import psycopg2
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+def load_auth():
+    spec = importlib.util.spec_from_file_location('auth_index', os.path.join(BACKEND, 'auth', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def setup(conn, schema: str, drivers: int, orders: int):
+    '''Временные водители и заказы; created_at в прошлом, чтобы claim_next брал их первыми'''
+    tag = 'race-' + secrets.token_hex(3)
+    cur = conn.cursor()
+    cur.execute(f'''
+        INSERT INTO {schema}.drivers (phone, name, password_hash, status, is_active, total_orders)
+        SELECT %s || '-' || g, %s, 'x', 'approved', true, 0 FROM generate_series(1, %s) g RETURNING id
+    ''', (tag, tag, drivers))
+    driver_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(f'''
+        INSERT INTO {schema}.orders (from_location, to_location, pickup_datetime, passenger_name, price, status_id, created_at)
+        SELECT %s, %s, NOW() + INTERVAL '1 day', %s, 1000, 1, TIMESTAMP '2000-01-01' + g * INTERVAL '1 second'
+        FROM generate_series(1, %s) g RETURNING id
+    ''', (tag, tag, tag, orders))
+    order_ids = [r[0] for r in cur.fetchall()]
+    conn.commit(); cur.close()
+    return driver_ids, order_ids
+
+def reset_orders(conn, schema: str, order_ids):
+    cur = conn.cursor()
+    cur.execute(f"UPDATE {schema}.orders SET driver_id=NULL, status_id=1, commission_amount=0, driver_amount=0 WHERE id = ANY(%s)",
+                (order_ids,))
+    conn.commit(); cur.close()
+
+def total_orders(conn, schema: str, driver_ids) -> int:
+    cur = conn.cursor()
+    cur.execute(f"SELECT COALESCE(SUM(total_orders), 0) FROM {schema}.drivers WHERE id = ANY(%s)", (driver_ids,))
+    total = int(cur.fetchone()[0]); conn.commit(); cur.close()
+    return total
+
+def foreign_free_orders(conn, schema: str, order_ids) -> int:
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {schema}.orders WHERE driver_id IS NULL AND status_id=1 AND NOT (id = ANY(%s))", (order_ids,))
+    count = cur.fetchone()[0]; conn.commit(); cur.close()
+    return count
+
+def race(auth, driver_ids, order_ids, mode: str):
+    '''Каждый поток — отдельное соединение и отдельный водитель; возвращает список (order_id, driver_id) побед и ошибки'''
+    barrier = threading.Barrier(len(driver_ids))
+    wins, errors, lock = [], [], threading.Lock()
+
+    def claimant(driver_id):
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor()
+        targets = order_ids[:]
+        random.shuffle(targets)
+        try:
+            barrier.wait()
+            if mode == 'accept_order':
+                for oid in targets:
+                    row = auth.claim_order(cur, driver_id, oid)
+                    conn.commit()
+                    if row:
+                        with lock:
+                            wins.append((row[0], driver_id))
+            else:
+                while True:
+                    row = auth.claim_order(cur, driver_id)
+                    conn.commit()
+                    if not row:
+                        break
+                    with lock:
+                        wins.append((row[0], driver_id))
+        except Exception as e:
+            with lock:
+                errors.append(f'driver {driver_id}: {e!r}')
+        finally:
+            cur.close(); conn.close()
+
+    threads = [threading.Thread(target=claimant, args=(d,)) for d in driver_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return wins, errors
+
+def check(conn, schema: str, order_ids, wins, errors) -> list:
+    problems = list(errors)
+    by_order = {}
+    for oid, did in wins:
+        by_order.setdefault(oid, []).append(did)
+    for oid in order_ids:
+        winners = by_order.get(oid, [])
+        if len(winners) != 1:
+            problems.append(f'order {oid}: {len(winners)} winners {winners}')
+    strays = sorted(set(by_order) - set(order_ids))
+    if strays:
+        problems.append(f'claimed foreign orders {strays}')
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, driver_id, status_id FROM {schema}.orders WHERE id = ANY(%s)", (order_ids,))
+    for oid, did, status_id in cur.fetchall():
+        winners = by_order.get(oid, [])
+        if status_id != 2 or [did] != winners:
+            problems.append(f'order {oid}: db driver_id={did} status_id={status_id}, winners {winners}')
+    conn.commit(); cur.close()
+    return problems
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Concurrent claim_order race test')
+    parser.add_argument('--drivers', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='машиночитаемый отчёт')
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        print('DATABASE_URL не задан', file=sys.stderr)
+        return 2
+
+    auth = load_auth()
+    schema = auth.SCHEMA
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    driver_ids, order_ids = setup(conn, schema, args.drivers, args.orders)
+    reports = []
+    try:
+        for mode in ('accept_order', 'claim_next'):
+            if mode == 'claim_next':
+                if foreign_free_orders(conn, schema, order_ids):
+                    reports.append({'mode': mode, 'skipped': 'в БД есть чужие свободные заказы'})
+                    continue
+                reset_orders(conn, schema, order_ids)
+            before = total_orders(conn, schema, driver_ids)
+            wins, errors = race(auth, driver_ids, order_ids, mode)
+            problems = check(conn, schema, order_ids, wins, errors)
+            counted = total_orders(conn, schema, driver_ids) - before
+            if counted != len(order_ids):
+                problems.append(f'total_orders grew by {counted}, expected {len(order_ids)}')
+            reports.append({'mode': mode, 'claims': len(wins), 'problems': problems})
+    finally:
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM {schema}.orders WHERE id = ANY(%s)", (order_ids,))
+        cur.execute(f"DELETE FROM {schema}.drivers WHERE id = ANY(%s)", (driver_ids,))
+        conn.commit(); cur.close(); conn.close()
+
+    failed = any(r.get('problems') for r in reports)
+    if args.json:
+        print(json.dumps({'drivers': args.drivers, 'orders': args.orders, 'runs': reports}, indent=2))
+    else:
+        for r in reports:
+            if 'skipped' in r:
+                print(f"{r['mode']:<13} skipped: {r['skipped']}")
+                continue
+            status = 'ok' if not r['problems'] else 'FAIL'
+            print(f"{r['mode']:<13} {args.drivers} drivers x {args.orders} orders, {r['claims']} claims  {status}")
+            for p in r['problems']:
+                print(f'  {p}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
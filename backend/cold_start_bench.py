@@ -0,0 +1,109 @@
+'''Замер холодного старта функций: время импорта index.py и первого ответа handler в свежем процессе.
+
+    python3 backend/cold_start_bench.py [--runs 5] [--budget-ms 150] [--json]
+
+Первый ответ — OPTIONS (без БД); если задан DATABASE_URL, дополнительно первый GET-тест из tests.json функции.
+Код выхода 1, если медиана импорта+первого ответа превышает бюджет или при импорте уже загружены тяжёлые модули
+(boto3, smtplib, Pillow) — их место в ветках, которые их используют.'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import urllib.parse
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS = ('auth', 'fleet', 'orders', 'statuses', 'tariffs')
+HEAVY_MODULES = ('boto3', 'botocore', 'smtplib', 'email.mime', 'PIL')
+DEFAULT_BUDGET_MS = float(os.environ.get('COLD_START_BUDGET_MS', '150'))
+
+PROBE = r'''
+import importlib.util, json, sys, time
+path, heavy, get_event = sys.argv[1], json.loads(sys.argv[2]), json.loads(sys.argv[3])
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location('index', path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+t1 = time.perf_counter()
+loaded = sorted(m for m in heavy if m in sys.modules)
+module.handler({'httpMethod': 'OPTIONS', 'queryStringParameters': {}, 'headers': {}}, None)
+t2 = time.perf_counter()
+result = {'import_ms': (t1 - t0) * 1000, 'options_ms': (t2 - t1) * 1000, 'heavy': loaded}
+if get_event:
+    r = module.handler(get_event, None)
+    result['get_ms'] = (time.perf_counter() - t2) * 1000
+    result['get_status'] = r.get('statusCode')
+print(json.dumps(result))
+'''
+
+def first_get_event(name: str):
+    '''Первый GET-тест из tests.json функции как типичный запрос; None без DATABASE_URL'''
+    if not os.environ.get('DATABASE_URL'):
+        return None
+    try:
+        with open(os.path.join(BACKEND, name, 'tests.json')) as f:
+            tests = json.load(f).get('tests', [])
+    except (OSError, ValueError):
+        return None
+    for t in tests:
+        if t.get('method') == 'GET':
+            query = urllib.parse.urlsplit(t.get('path', '/')).query
+            return {'httpMethod': 'GET', 'queryStringParameters': dict(urllib.parse.parse_qsl(query)), 'headers': {}}
+    return None
+
+def probe(name: str, get_event):
+    out = subprocess.run([sys.executable, '-c', PROBE, os.path.join(BACKEND, name, 'index.py'),
+                          json.dumps(HEAVY_MODULES), json.dumps(get_event)],
+                         capture_output=True, text=True, cwd=os.path.join(BACKEND, name))
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f'exit {out.returncode}')
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def bench(name: str, runs: int) -> dict:
+    get_event = first_get_event(name)
+    samples = [probe(name, get_event) for _ in range(runs)]
+    report = {'function': name,
+              'import_ms': statistics.median(s['import_ms'] for s in samples),
+              'options_ms': statistics.median(s['options_ms'] for s in samples),
+              'heavy': sorted({m for s in samples for m in s['heavy']})}
+    report['cold_start_ms'] = report['import_ms'] + report['options_ms']
+    if get_event:
+        report['get_ms'] = statistics.median(s['get_ms'] for s in samples)
+        report['get_status'] = samples[-1]['get_status']
+    return report
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Cold-start benchmark for backend functions')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--json', action='store_true', help='машиночитаемый отчёт')
+    parser.add_argument('functions', nargs='*', default=FUNCTIONS)
+    args = parser.parse_args()
+
+    reports, failed = [], False
+    for name in args.functions:
+        try:
+            r = bench(name, args.runs)
+        except RuntimeError as e:
+            r = {'function': name, 'error': str(e)}
+        r['ok'] = 'error' not in r and not r['heavy'] and r['cold_start_ms'] <= args.budget_ms
+        failed |= not r['ok']
+        reports.append(r)
+
+    if args.json:
+        print(json.dumps({'budget_ms': args.budget_ms, 'functions': reports}, indent=2))
+    else:
+        print(f"{'function':<10} {'import':>9} {'options':>9} {'cold':>9} {'get':>9}  status")
+        for r in reports:
+            if 'error' in r:
+                print(f"{r['function']:<10} {'—':>9} {'—':>9} {'—':>9} {'—':>9}  FAIL: {r['error']}")
+                continue
+            get = f"{r['get_ms']:.1f}" if 'get_ms' in r else '—'
+            status = 'ok' if r['ok'] else ('FAIL: eager ' + ', '.join(r['heavy']) if r['heavy'] else 'FAIL: over budget')
+            print(f"{r['function']:<10} {r['import_ms']:>9.1f} {r['options_ms']:>9.1f} {r['cold_start_ms']:>9.1f} {get:>9}  {status}")
+        print(f"budget: {args.budget_ms:.0f} ms (import + first response, median of {args.runs})")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+'''Замер создания заказа: прежняя последовательность запросов против одного вызова create_order() (V0021).
+
+    DATABASE_URL=... python3 backend/create_order_bench.py [--runs 200] [--warmup 10] [--cash] [--json]
+
+Прежний путь — как в orders/index.py до V0021: SELECT баланса, UPDATE users, INSERT orders, INSERT balance_transactions,
+INSERT outbox; новый — SELECT create_order(...). Оба пути оплачиваются с баланса (--cash — без списания), каждая
+итерация — отдельная транзакция, которая откатывается, поэтому на реальной БД не остаётся заказов и уведомлений.
+Временный пользователь удаляется в конце. Печатает число round trip на заказ (execute + rollback) и p50/p99 задержки.
+Код выхода 1, если новый путь медленнее прежнего по p99.'''
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import time
+
+import psycopg2
+
+SCHEMA = 't_p8223105_sochi_transfer_websi'
+NOTIFY_FIELDS = ('from_location', 'to_location', 'pickup_datetime', 'passenger_name', 'passenger_phone',
+                 'passengers_count', 'transfer_type', 'car_class', 'payment_type', 'price')
+
+class CountingCursor:
+    '''Курсор, считающий обращения к серверу'''
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.round_trips = 0
+
+    def execute(self, query, params=None):
+        self.round_trips += 1
+        self.cur.execute(query, params)
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def rollback(self):
+        self.round_trips += 1
+        self.conn.rollback()
+
+def sample_order(user_id: int, from_balance: bool) -> dict:
+    return {'from_location': 'Аэропорт Сочи', 'to_location': 'Красная Поляна', 'pickup_datetime': '2030-01-01 10:00',
+            'flight_number': 'SU1000', 'passenger_name': 'bench', 'passenger_phone': '+70000000000', 'passenger_email': '',
+            'passengers_count': 2, 'luggage_count': 1, 'tariff_id': None, 'fleet_id': None, 'status_id': 1,
+            'price': 3500.0, 'notes': '', 'transfer_type': 'individual', 'car_class': 'comfort',
+            'payment_type': 'prepay', 'payment_from_balance': from_balance, 'user_id': user_id}
+
+def legacy_path(cur: CountingCursor, order: dict):
+    user_id, price = order['user_id'], order['price']
+    if order['payment_from_balance']:
+        cur.execute(f"SELECT balance FROM {SCHEMA}.users WHERE id=%s", (user_id,))
+        if float(cur.fetchone()[0]) < price:
+            raise RuntimeError('bench user balance exhausted')
+        cur.execute(f"UPDATE {SCHEMA}.users SET balance=balance-%s WHERE id=%s", (price, user_id))
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.orders (
+            from_location, to_location, pickup_datetime, flight_number,
+            passenger_name, passenger_phone, passenger_email,
+            passengers_count, luggage_count, tariff_id, fleet_id,
+            status_id, price, notes, transfer_type, car_class, payment_type, prepay_amount, user_id, payment_from_balance
+        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id
+    ''', (order['from_location'], order['to_location'], order['pickup_datetime'], order['flight_number'],
+          order['passenger_name'], order['passenger_phone'], order['passenger_email'],
+          order['passengers_count'], order['luggage_count'], order['tariff_id'], order['fleet_id'],
+          order['status_id'], price, order['notes'], order['transfer_type'], order['car_class'],
+          order['payment_type'], round(price * 0.3), user_id, order['payment_from_balance']))
+    oid = cur.fetchone()[0]
+    if order['payment_from_balance']:
+        cur.execute(f"INSERT INTO {SCHEMA}.balance_transactions (user_id,amount,type,description,status) VALUES (%s,%s,'payment','Оплата заказа #%s','completed')",
+                    (user_id, -price, oid))
+    payload = json.dumps({k: order.get(k) for k in NOTIFY_FIELDS}, default=str)
+    cur.execute(f"INSERT INTO {SCHEMA}.notification_outbox (channel, order_id, payload) VALUES ('telegram',%s,%s), ('email',%s,%s)",
+                (oid, payload, oid, payload))
+    return oid
+
+def function_path(cur: CountingCursor, order: dict):
+    payload = json.dumps({k: order.get(k) for k in NOTIFY_FIELDS}, default=str)
+    cur.execute(f"SELECT order_id, prepay_amount FROM {SCHEMA}.create_order(%s, %s, %s)",
+                (order['user_id'], json.dumps({k: v for k, v in order.items() if k != 'user_id'}), payload))
+    oid = cur.fetchone()[0]
+    if oid is None:
+        raise RuntimeError('bench user balance exhausted')
+    return oid
+
+def bench(conn, paths: dict, order: dict, runs: int, warmup: int) -> dict:
+    '''Пути чередуются на каждой итерации, чтобы прогрев кэшей БД не играл в пользу одного из них'''
+    latencies = {name: [] for name in paths}
+    trips = {name: 0 for name in paths}
+    for i in range(warmup + runs):
+        for name, path in paths.items():
+            cur = CountingCursor(conn)
+            t0 = time.perf_counter()
+            path(cur, order)
+            cur.rollback()
+            elapsed = (time.perf_counter() - t0) * 1000
+            cur.cur.close()
+            if i >= warmup:
+                latencies[name].append(elapsed)
+                trips[name] = max(trips[name], cur.round_trips)
+    report = {}
+    for name, values in latencies.items():
+        values.sort()
+        report[name] = {'round_trips': trips[name], 'p50_ms': statistics.median(values),
+                        'p99_ms': values[min(len(values) - 1, int(len(values) * 0.99))], 'mean_ms': statistics.fmean(values)}
+    return report
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Legacy statement sequence vs create_order() benchmark')
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--cash', action='store_true', help='заказ без оплаты с баланса')
+    parser.add_argument('--json', action='store_true', help='машиночитаемый отчёт')
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        print('DATABASE_URL не задан', file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.users (phone, name, password_hash, balance) VALUES (%s, 'bench', 'x', 1000000) RETURNING id
+    ''', ('bench-' + secrets.token_hex(4),))
+    user_id = cur.fetchone()[0]
+    conn.commit(); cur.close()
+    order = sample_order(user_id, not args.cash)
+    try:
+        report = bench(conn, {'legacy': legacy_path, 'create_order': function_path}, order, args.runs, args.warmup)
+    finally:
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM {SCHEMA}.users WHERE id=%s", (user_id,))
+        conn.commit(); cur.close(); conn.close()
+
+    ok = report['create_order']['p99_ms'] <= report['legacy']['p99_ms']
+    if args.json:
+        print(json.dumps({'runs': args.runs, 'from_balance': not args.cash, **report, 'ok': ok}, indent=2))
+    else:
+        print(f"{'path':<14} {'trips':>6} {'p50':>9} {'p99':>9} {'mean':>9}")
+        for name, r in report.items():
+            print(f"{name:<14} {r['round_trips']:>6} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['mean_ms']:>9.2f}")
+        print(f"{args.runs} orders per path, {'balance' if not args.cash else 'cash'} payment, each transaction rolled back")
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
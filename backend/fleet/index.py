@@ -1,8 +1,11 @@
 import json
 import os
 import base64
-import boto3
+import hashlib
+import io
 import psycopg2
+import psycopg2.pool
+import time
 
 SCHEMA = 't_p8223105_sochi_transfer_websi'
 CORS = {
@@ -15,8 +18,203 @@ def resp(status, body):
     return {'statusCode': status, 'headers': {'Content-Type': 'application/json', **CORS},
             'body': json.dumps(body, default=str), 'isBase64Encoded': False}
 
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_IDLE = float(os.environ.get('DB_POOL_PING_IDLE', '30'))
+DB_POOL_WAIT = float(os.environ.get('DB_POOL_WAIT', '3'))
+
+_pool = None
+_last_used = {}
+_checked_out = set()
+
+class PooledConn:
+    '''Соединение из пула: close() возвращает его в пул вместо разрыва'''
+
+    def __init__(self, conn):
+        self._conn = conn
+        _checked_out.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        _checked_out.discard(self)
+        if conn is not None:
+            _last_used[id(conn)] = time.monotonic()
+            _get_pool().putconn(conn, close=bool(conn.closed))
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def _is_alive(conn):
+    if conn.closed:
+        return False
+    last = _last_used.get(id(conn))
+    if last is None or time.monotonic() - last < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor(); cur.execute('SELECT 1'); cur.close(); conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+class PoolExhausted(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_WAIT — обработчик отвечает 503, а не 500'''
+
+def _checkout(pool):
+    '''getconn() пула сразу падает с PoolError при DB_POOL_MAX занятых — ждём освобождения с коротким бэкоффом'''
+    deadline = time.monotonic() + DB_POOL_WAIT
+    delay = 0.01
+    while True:
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError:
+            if pool.closed or time.monotonic() >= deadline:
+                raise PoolExhausted('Все соединения с БД заняты')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
 def get_conn():
-    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+    '''Берёт соединение из пула тёплого контейнера; мёртвые соединения переоткрываются.
+    Одно соединение на запрос: хелперы получают cur обработчика, а не открывают своё'''
+    pool = _get_pool()
+    for _ in range(DB_POOL_MAX):
+        conn = _checkout(pool)
+        if _is_alive(conn):
+            return PooledConn(conn)
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return PooledConn(_checkout(pool))
+
+def release_conns():
+    '''Возвращает в пул соединения, которые обработчик не закрыл (ранний return, исключение)'''
+    for pc in list(_checked_out):
+        pc.close()
+
+REFERENCE_MAX_AGE = int(os.environ.get('REFERENCE_MAX_AGE', '60'))
+
+def reference_etag(cur, table: str, params: dict):
+    '''Сильный ETag справочника: версия таблицы в cache_versions (её поднимает триггер) + параметры запроса'''
+    cur.execute(f"SELECT version FROM {SCHEMA}.cache_versions WHERE name=%s", (table,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    query = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+    return f'"{table}-{row[0]}-{query}"'
+
+def is_not_modified(event: dict, etag) -> bool:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    tags = [t.strip() for t in (headers.get('if-none-match') or '').split(',')]
+    return bool(etag) and (etag in tags or '*' in tags)
+
+def cache_headers(etag, public: bool) -> dict:
+    '''Публичные выборки кэширует CDN; админские экраны каждый раз ревалидируются и получают 304'''
+    if not etag:
+        return {}
+    control = f'public, max-age={REFERENCE_MAX_AGE}, stale-while-revalidate={REFERENCE_MAX_AGE * 5}' if public else 'no-cache'
+    return {'ETag': etag, 'Cache-Control': control}
+
+def not_modified(etag, public: bool):
+    return {'statusCode': 304, 'headers': {**CORS, **cache_headers(etag, public)}, 'body': '', 'isBase64Encoded': False}
+
+def cached_resp(body, etag, public: bool):
+    r = resp(200, body)
+    r['headers'].update(cache_headers(etag, public))
+    return r
+
+# ===== IMAGES =====
+IMAGE_WIDTHS = (320, 768, 1600)
+IMAGE_FORMATS = (('webp', 'WEBP', 'image/webp'), ('jpg', 'JPEG', 'image/jpeg'))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '80'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '3'))
+
+_s3_client = None
+_image_pool = None
+
+def get_s3():
+    '''Один boto3-клиент на тёплый контейнер'''
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client('s3',
+            endpoint_url='https://bucket.poehali.dev',
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+    return _s3_client
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID', '')}/bucket/{key}"
+
+def decode_data_url(b64data: str):
+    '''base64 или data URL -> (байты, content type); тип берётся из заголовка data URL'''
+    content_type = 'image/jpeg'
+    if ',' in b64data:
+        header, b64data = b64data.split(',', 1)
+        if header.startswith('data:') and ';' in header:
+            content_type = header[5:].split(';', 1)[0] or content_type
+    return base64.b64decode(b64data), content_type
+
+def render_variant(raw: bytes, width: int):
+    '''Работает в процессе пула: уменьшает картинку до width по ширине без EXIF; (ширина, [(ext, content type, байты)])'''
+    from PIL import Image, ImageOps
+    img = Image.open(io.BytesIO(raw))
+    img.draft('RGB', (width, width))  # JPEG сразу декодируется в уменьшенном масштабе
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((width, width * 10), Image.LANCZOS)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'P') else 'RGB')
+    files = []
+    for ext, fmt, content_type in IMAGE_FORMATS:
+        frame = img.convert('RGB') if fmt == 'JPEG' else img
+        buf = io.BytesIO()
+        frame.save(buf, fmt, quality=IMAGE_QUALITY, optimize=True)  # exif не передаём — метаданные и GPS не попадают в файл
+        files.append((ext, content_type, buf.getvalue()))
+    return img.width, files
+
+def image_variants(url):
+    '''Варианты картинки из бакета проекта: {'webp': {'320': url, ...}, 'jpg': {...}}; None — отдаём оригинал'''
+    global _image_pool
+    prefix = cdn_url('')
+    if not isinstance(url, str) or not url.startswith(prefix):
+        return None
+    key = url[len(prefix):]
+    from concurrent.futures.process import ProcessPoolExecutor, BrokenProcessPool
+    try:
+        raw = get_s3().get_object(Bucket='files', Key=key)['Body'].read()
+        if _image_pool is None:
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        rendered = list(_image_pool.map(render_variant, [raw] * len(IMAGE_WIDTHS), IMAGE_WIDTHS))
+    except BrokenProcessPool:
+        _image_pool = None
+        return None
+    except Exception:
+        return None  # не картинка, битый файл или нет Pillow
+    base = key.rsplit('.', 1)[0]
+    variants = {}
+    for width, files in rendered:
+        for ext, content_type, body in files:
+            if str(width) in variants.get(ext, {}):
+                continue  # исходник уже меньше этой ширины
+            vkey = f'{base}_{width}.{ext}'
+            get_s3().put_object(Bucket='files', Key=vkey, Body=body, ContentType=content_type,
+                                CacheControl='public, max-age=31536000, immutable')
+            variants.setdefault(ext, {})[str(width)] = cdn_url(vkey)
+    return variants
+
+def image_variants_json(cur, table: str, row_id, url):
+    '''Значение колонки image_variants: варианты пересчитываются, только если у строки сменилась картинка'''
+    if row_id:
+        cur.execute(f"SELECT image_url, image_variants FROM {SCHEMA}.{table} WHERE id=%s", (int(row_id),))
+        row = cur.fetchone()
+        if row and row[0] == url and row[1]:
+            return json.dumps(row[1])
+    variants = image_variants(url)
+    return json.dumps(variants) if variants else None
 
 def handler(event: dict, context) -> dict:
     '''API для управления автопарком'''
@@ -32,12 +230,15 @@ def handler(event: dict, context) -> dict:
 
         if method == 'GET':
             active_only = params.get('active', 'false') == 'true'
+            etag = reference_etag(cur, 'fleet', params)
+            if is_not_modified(event, etag):
+                cur.close(); conn.close(); return not_modified(etag, active_only)
             q = f"SELECT * FROM {SCHEMA}.fleet" + (" WHERE is_active=true" if active_only else "") + " ORDER BY id"
             cur.execute(q)
             cols = [d[0] for d in cur.description]
             fleet = [dict(zip(cols, r)) for r in cur.fetchall()]
             cur.close(); conn.close()
-            return resp(200, {'fleet': fleet})
+            return cached_resp({'fleet': fleet}, etag, active_only)
 
         elif method == 'POST':
             data = json.loads(event.get('body', '{}'))
@@ -45,30 +246,24 @@ def handler(event: dict, context) -> dict:
             if data.get('action') == 'upload_photo':
                 cur.close(); conn.close()
                 try:
-                    s3 = boto3.client('s3',
-                        endpoint_url='https://bucket.poehali.dev',
-                        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-                        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-                    )
                     import uuid
                     ext = data.get('filename', 'photo.jpg').rsplit('.', 1)[-1].lower()
                     key = f'fleet/{uuid.uuid4()}.{ext}'
                     img_data = base64.b64decode(data.get('data', ''))
-                    s3.put_object(Bucket='files', Key=key, Body=img_data, ContentType=data.get('content_type', 'image/jpeg'))
-                    cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
-                    return resp(200, {'url': cdn_url})
+                    get_s3().put_object(Bucket='files', Key=key, Body=img_data, ContentType=data.get('content_type', 'image/jpeg'))
+                    return resp(200, {'url': cdn_url(key)})
                 except Exception as e:
                     return resp(500, {'error': str(e)})
 
             cur.execute(f'''
                 INSERT INTO {SCHEMA}.fleet (name, type, capacity, luggage_capacity, features,
-                                 image_url, image_emoji, is_active)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id
+                                 image_url, image_variants, image_emoji, is_active)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id
             ''', (
                 data.get('name'), data.get('type'), data.get('capacity'),
                 data.get('luggage_capacity'), data.get('features', []),
-                data.get('image_url'), data.get('image_emoji', '🚗'),
-                data.get('is_active', True)
+                data.get('image_url'), image_variants_json(cur, 'fleet', None, data.get('image_url')),
+                data.get('image_emoji', '🚗'), data.get('is_active', True)
             ))
             fleet_id = cur.fetchone()[0]
             conn.commit(); cur.close(); conn.close()
@@ -76,16 +271,17 @@ def handler(event: dict, context) -> dict:
 
         elif method == 'PUT':
             data = json.loads(event.get('body', '{}'))
+            variants = image_variants_json(cur, 'fleet', data.get('id'), data.get('image_url'))
             cur.execute(f'''
                 UPDATE {SCHEMA}.fleet
                 SET name=%s, type=%s, capacity=%s, luggage_capacity=%s,
-                    features=%s, image_url=%s, image_emoji=%s, is_active=%s,
+                    features=%s, image_url=%s, image_variants=%s, image_emoji=%s, is_active=%s,
                     updated_at=CURRENT_TIMESTAMP
                 WHERE id=%s
             ''', (
                 data.get('name'), data.get('type'), data.get('capacity'),
                 data.get('luggage_capacity'), data.get('features'),
-                data.get('image_url'), data.get('image_emoji'),
+                data.get('image_url'), variants, data.get('image_emoji'),
                 data.get('is_active'), data.get('id')
             ))
             conn.commit(); cur.close(); conn.close()
@@ -100,5 +296,9 @@ def handler(event: dict, context) -> dict:
         cur.close(); conn.close()
         return resp(405, {'error': 'Method not allowed'})
 
+    except PoolExhausted as e:
+        return resp(503, {'error': str(e)})
     except Exception as e:
         return resp(500, {'error': str(e)})
+    finally:
+        release_conns()
@@ -0,0 +1,159 @@
+'''Проверка HttpClient (orders/index.py и auth/index.py) на локальном stub-сервере: ретраи и circuit breaker.
+
+    python3 backend/http_client_stub_test.py [--json] [orders auth]
+
+БД и сеть не нужны: сервер на http.server в потоке считает полученные запросы. Проверяется, что POST без
+Idempotence-Key не отправляется повторно после обрыва, таймаута чтения или 5xx, а GET и POST с ключом повторяются;
+что закрытое сервером keep-alive соединение не съедает POST; что после паузы полуоткрытый автомат пропускает ровно одну
+пробу, успешная проба его закрывает, а неудачная — снова открывает. Код выхода 1 при любом расхождении.'''
+import argparse
+import collections
+import http.server
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS = ('orders', 'auth')
+READ_TIMEOUT = 0.3
+COOLDOWN = 0.3
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    '''Поведение по пути: /ok, /slow, /status/<код>, /drop (обрыв без ответа), /hang (ответ позже таймаута),
+    /stale (ответ без Connection: close, после которого сервер закрывает соединение)'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        path = self.path.split('?')[0]
+        self.server.hits[path] += 1
+        if path == '/drop':
+            self.close_connection = True
+            return
+        if path == '/hang':
+            time.sleep(READ_TIMEOUT * 4)
+        if path == '/slow':
+            time.sleep(READ_TIMEOUT / 2)
+        code = int(path.rsplit('/', 1)[1]) if path.startswith('/status/') else 200
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+        if path == '/stale':
+            self.close_connection = True
+
+    do_GET = do_POST = _handle
+
+def load(name: str):
+    spec = importlib.util.spec_from_file_location(f'{name}_index', os.path.join(BACKEND, name, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.HTTP_BREAKER_COOLDOWN = COOLDOWN
+    module.HTTP_BACKOFF = 0.01
+    return module
+
+def attempt(client, method, url, **kwargs):
+    '''Код ответа или имя исключения'''
+    try:
+        return client.request(method, url, b'{}' if method == 'POST' else None, kwargs.pop('headers', None),
+                              read_timeout=READ_TIMEOUT, **kwargs)[0]
+    except Exception as e:
+        return type(e).__name__
+
+def scenarios(module, base: str, hits: collections.Counter):
+    '''Пары (название, ожидание, факт)'''
+    new = module.HttpClient
+    retries = 2
+
+    def case(name, method, path, expected_result, expected_hits, **kwargs):
+        before = hits[path]
+        result = attempt(new(), method, base + path, retries=retries, **kwargs)
+        return name, (expected_result, expected_hits), (result, hits[path] - before)
+
+    yield case('POST drop: no resend', 'POST', '/drop', 'RemoteDisconnected', 1)
+    yield case('GET drop: retried', 'GET', '/drop', 'RemoteDisconnected', retries + 1)
+    yield case('POST read timeout: no resend', 'POST', '/hang', 'TimeoutError', 1)
+    yield case('POST 500: no resend', 'POST', '/status/500', 500, 1)
+    yield case('POST 500 with Idempotence-Key: retried', 'POST', '/status/500', 500, retries + 1,
+               headers={'Idempotence-Key': 'k'})
+    yield case('POST 429: retried', 'POST', '/status/429', 429, retries + 1)
+
+    client = new()
+    client.request('POST', base + '/stale', b'{}', read_timeout=READ_TIMEOUT)
+    time.sleep(0.05)
+    before = hits['/ok']
+    yield 'POST after server closed keep-alive', (200, 1), (attempt(client, 'POST', base + '/ok'), hits['/ok'] - before)
+
+    client = new()
+    for _ in range(module.HTTP_BREAKER_THRESHOLD):
+        attempt(client, 'GET', base + '/status/503', retries=0)
+    before = hits['/ok']
+    yield 'open breaker: nothing sent', ('CircuitOpen', 0), (attempt(client, 'GET', base + '/ok'), hits['/ok'] - before)
+
+    time.sleep(COOLDOWN * 1.2)
+    results, lock = [], threading.Lock()
+
+    def racer():
+        r = attempt(client, 'GET', base + '/slow', retries=0)
+        with lock:
+            results.append(r)
+
+    before = hits['/slow']
+    threads = [threading.Thread(target=racer) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    yield 'half-open: single probe', ((1, 9), 1), ((results.count(200), results.count('CircuitOpen')), hits['/slow'] - before)
+    before = hits['/ok']
+    yield 'successful probe closes breaker', (200, 1), (attempt(client, 'GET', base + '/ok'), hits['/ok'] - before)
+
+    for _ in range(module.HTTP_BREAKER_THRESHOLD):
+        attempt(client, 'GET', base + '/status/503', retries=0)
+    time.sleep(COOLDOWN * 1.2)
+    attempt(client, 'GET', base + '/status/503', retries=0)
+    before = hits['/ok']
+    yield 'failed probe reopens breaker', ('CircuitOpen', 0), (attempt(client, 'GET', base + '/ok'), hits['/ok'] - before)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='HttpClient retry and circuit breaker test against a stub server')
+    parser.add_argument('--json', action='store_true', help='машиночитаемый отчёт')
+    parser.add_argument('functions', nargs='*', default=FUNCTIONS)
+    args = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.handle_error = lambda request, client_address: None
+    server.hits = collections.Counter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    reports = []
+    try:
+        for name in args.functions:
+            module = load(name)
+            for case, expected, actual in scenarios(module, base, server.hits):
+                reports.append({'function': name, 'case': case, 'expected': expected, 'actual': actual, 'ok': expected == actual})
+    finally:
+        server.shutdown()
+
+    failed = not all(r['ok'] for r in reports)
+    if args.json:
+        print(json.dumps({'cases': reports}, indent=2, default=str))
+    else:
+        for r in reports:
+            status = 'ok' if r['ok'] else f"FAIL: expected {r['expected']}, got {r['actual']}"
+            print(f"{r['function']:<8} {r['case']:<42} {status}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
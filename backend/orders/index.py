@@ -1,46 +1,387 @@
 import json
 import os
 import psycopg2
+import psycopg2.pool
+import time
+import math
+import random
 import secrets
-import urllib.request
+import urllib.parse
+import http.client
+import threading
+import select
 import hashlib
-import smtplib
 import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import datetime
+import io
+import csv
+import gzip
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 CORS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, X-User-Id, X-Driver-Id, X-Auth-Token, X-Session-Id'
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, X-User-Id, X-Driver-Id, X-Auth-Token, X-Session-Id, Last-Event-ID, Idempotency-Key'
 }
 SCHEMA = 't_p8223105_sochi_transfer_websi'
 
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_IDLE = float(os.environ.get('DB_POOL_PING_IDLE', '30'))
+DB_POOL_WAIT = float(os.environ.get('DB_POOL_WAIT', '3'))
+
+_pool = None
+_last_used = {}
+_checked_out = set()
+
+class PooledConn:
+    '''Соединение из пула: close() возвращает его в пул вместо разрыва'''
+
+    def __init__(self, conn):
+        self._conn = conn
+        _checked_out.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        _checked_out.discard(self)
+        if conn is not None:
+            _last_used[id(conn)] = time.monotonic()
+            _get_pool().putconn(conn, close=bool(conn.closed))
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def _is_alive(conn):
+    if conn.closed:
+        return False
+    last = _last_used.get(id(conn))
+    if last is None or time.monotonic() - last < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor(); cur.execute('SELECT 1'); cur.close(); conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+class PoolExhausted(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_WAIT — обработчик отвечает 503, а не 500'''
+
+def _checkout(pool):
+    '''getconn() пула сразу падает с PoolError при DB_POOL_MAX занятых — ждём освобождения с коротким бэкоффом'''
+    deadline = time.monotonic() + DB_POOL_WAIT
+    delay = 0.01
+    while True:
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError:
+            if pool.closed or time.monotonic() >= deadline:
+                raise PoolExhausted('Все соединения с БД заняты')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
 def get_conn():
-    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+    '''Берёт соединение из пула тёплого контейнера; мёртвые соединения переоткрываются.
+    Одно соединение на запрос: хелперы получают cur обработчика, а не открывают своё'''
+    pool = _get_pool()
+    for _ in range(DB_POOL_MAX):
+        conn = _checkout(pool)
+        if _is_alive(conn):
+            return PooledConn(conn)
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return PooledConn(_checkout(pool))
+
+def release_conns():
+    '''Возвращает в пул соединения, которые обработчик не закрыл (ранний return, исключение)'''
+    for pc in list(_checked_out):
+        pc.close()
 
 def resp(status, body):
     return {'statusCode': status, 'headers': {'Content-Type': 'application/json', **CORS},
             'body': json.dumps(body, default=str), 'isBase64Encoded': False}
 
-def get_site_settings():
+SETTINGS_CHECK_INTERVAL = float(os.environ.get('SETTINGS_CHECK_INTERVAL', '5'))
+
+class SettingsCache:
+    '''Кэш site_settings на тёплый контейнер: перечитывается, только когда меняется версия в cache_versions'''
+
+    def __init__(self):
+        self.values = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    def snapshot(self, cur=None) -> dict:
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < SETTINGS_CHECK_INTERVAL:
+            return self.values
+        own = cur is None
+        if own:
+            conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT version FROM {SCHEMA}.cache_versions WHERE name='site_settings'")
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            if version != self.version:
+                cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings ORDER BY id")
+                self.values = {r[0]: r[1] for r in cur.fetchall()}
+                self.version = version
+            self.checked_at = now
+        finally:
+            if own:
+                cur.close(); conn.close()
+        return self.values
+
+    def invalidate(self):
+        self.version = None
+
+    def get(self, key: str, default: str = '', cur=None) -> str:
+        value = self.snapshot(cur).get(key)
+        return default if value is None or value == '' else value
+
+    def get_int(self, key: str, default: int = 0, cur=None) -> int:
+        try:
+            return int(self.get(key, str(default), cur))
+        except ValueError:
+            return default
+
+    def get_bool(self, key: str, default: bool = False, cur=None) -> bool:
+        return self.get(key, 'true' if default else 'false', cur) == 'true'
+
+    def subset(self, keys, cur=None) -> dict:
+        values = self.snapshot(cur)
+        return {k: values[k] for k in keys if k in values}
+
+settings_cache = SettingsCache()
+
+class StatusNameCache:
+    '''Карта id→name статусов заказа на тёплый контейнер; перечитывается при смене версии order_statuses'''
+
+    def __init__(self):
+        self.names = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    def get(self, status_id, cur) -> str:
+        now = time.monotonic()
+        if self.version is None or now - self.checked_at >= SETTINGS_CHECK_INTERVAL:
+            cur.execute(f"SELECT version FROM {SCHEMA}.cache_versions WHERE name='order_statuses'")
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            if version != self.version:
+                cur.execute(f"SELECT id, name FROM {SCHEMA}.order_statuses")
+                self.names = {r[0]: r[1] for r in cur.fetchall()}
+                self.version = version
+            self.checked_at = now
+        return self.names.get(int(status_id))
+
+status_names = StatusNameCache()
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+
+def idempotency_key(event) -> str:
+    headers = event.get('headers', {}) or {}
+    return (headers.get('Idempotency-Key') or headers.get('idempotency-key') or '').strip()[:200]
+
+def claim_idempotency_key(cur, scope: str, key: str, body: str):
+    '''Занимает ключ в транзакции бизнес-операции; если запрос с этим ключом уже выполнен — возвращает его ответ.
+    Параллельный повтор ждёт на первичном ключе, пока первый запрос не зафиксирует или не откатит транзакцию'''
+    fingerprint = hashlib.sha256((body or '').encode()).hexdigest()
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.idempotency_keys (scope, key, fingerprint, expires_at)
+        VALUES (%s, %s, %s, NOW() + make_interval(hours => %s))
+        ON CONFLICT (scope, key) DO UPDATE SET fingerprint=EXCLUDED.fingerprint, status_code=NULL, response=NULL,
+            created_at=NOW(), expires_at=EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < NOW()
+        RETURNING 1
+    ''', (scope, key, fingerprint, IDEMPOTENCY_TTL_HOURS))
+    if cur.fetchone():
+        return None
+    cur.execute(f"SELECT fingerprint, status_code, response FROM {SCHEMA}.idempotency_keys WHERE scope=%s AND key=%s", (scope, key))
+    stored_fingerprint, status_code, body = cur.fetchone()
+    if stored_fingerprint != fingerprint:
+        return resp(422, {'error': 'Ключ идемпотентности уже использован с другим запросом'})
+    if status_code is None:
+        return resp(409, {'error': 'Запрос с этим ключом ещё выполняется'})
+    return {'statusCode': status_code, 'headers': {'Content-Type': 'application/json', 'Idempotent-Replayed': 'true', **CORS},
+            'body': body, 'isBase64Encoded': False}
+
+def store_idempotent_response(cur, scope: str, key: str, response: dict) -> dict:
+    '''Сохраняет ответ в той же транзакции, что и бизнес-изменения'''
+    cur.execute(f"UPDATE {SCHEMA}.idempotency_keys SET status_code=%s, response=%s WHERE scope=%s AND key=%s",
+                (response['statusCode'], response['body'], scope, key))
+    return response
+
+SYNC_OVERLAP_SECONDS = 5
+
+def since_clause(params, column, joiner='WHERE'):
+    '''Условие для ?since=: только строки, изменённые после токена синхронизации'''
+    since = params.get('since')
+    if not since:
+        return '', []
+    return f' {joiner} {column} > %s', [since]
+
+def sync_meta(cur, params, table=None):
+    '''sync_token для следующего ?since= (с запасом на долгие транзакции) и id удалённых строк'''
+    meta = {}
+    since = params.get('since')
+    if since and table:
+        cur.execute(f"SELECT row_id FROM {SCHEMA}.deleted_rows WHERE table_name=%s AND deleted_at > %s", (table, since))
+        meta['deleted'] = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT LOCALTIMESTAMP - make_interval(secs => %s)", (SYNC_OVERLAP_SECONDS,))
+    meta['sync_token'] = cur.fetchone()[0].isoformat()
+    return meta
+
+def get_site_settings(cur=None):
     try:
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings")
-        s = {r[0]: r[1] for r in cur.fetchall()}
-        cur.close(); conn.close()
-        return s
+        return settings_cache.snapshot(cur)
     except Exception:
         return {}
 
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = 0.2
+HTTP_POOL_SIZE = 4
+HTTP_BREAKER_THRESHOLD = int(os.environ.get('HTTP_BREAKER_THRESHOLD', '5'))
+HTTP_BREAKER_COOLDOWN = float(os.environ.get('HTTP_BREAKER_COOLDOWN', '30'))
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+class CircuitOpen(Exception):
+    '''Хост помечен нездоровым: запрос не отправляется до конца паузы'''
+
+class HttpClient:
+    '''Исходящие запросы к провайдерам: keep-alive пул на хост, раздельные таймауты соединения и чтения,
+    ретраи с джиттером и circuit breaker — после HTTP_BREAKER_THRESHOLD ошибок подряд хост пропускается
+    HTTP_BREAKER_COOLDOWN секунд, затем ровно одна пробная попытка решает, закрыть ли автомат'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.failures = {}
+        self.open_until = {}
+        self.probing = set()
+
+    def is_open(self, host: str) -> bool:
+        with self.lock:
+            return self.failures.get(host, 0) >= HTTP_BREAKER_THRESHOLD and (
+                self.open_until.get(host, 0) > time.monotonic() or host in self.probing)
+
+    def _admit(self, host: str):
+        '''Закрыт — пропускает; открыт — CircuitOpen до конца паузы; полуоткрыт — пропускает одну пробу, остальным CircuitOpen'''
+        with self.lock:
+            if self.failures.get(host, 0) < HTTP_BREAKER_THRESHOLD:
+                return
+            if self.open_until.get(host, 0) > time.monotonic() or host in self.probing:
+                raise CircuitOpen(host)
+            self.probing.add(host)
+
+    def _acquire(self, scheme: str, host: str):
+        with self.lock:
+            conns = self.idle.get((scheme, host)) or []
+            while conns:
+                conn = conns.pop()
+                # Читаемый простаивающий сокет — сервер уже закрыл соединение: запрос в него не отправляем
+                if conn.sock is not None and not select.select([conn.sock], [], [], 0)[0]:
+                    return conn, True
+                conn.close()
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return cls(host, timeout=HTTP_CONNECT_TIMEOUT), False
+
+    def _release(self, scheme: str, host: str, conn):
+        with self.lock:
+            conns = self.idle.setdefault((scheme, host), [])
+            if len(conns) < HTTP_POOL_SIZE:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def _record(self, host: str, ok: bool):
+        with self.lock:
+            self.probing.discard(host)
+            if ok:
+                self.failures.pop(host, None); self.open_until.pop(host, None)
+                return
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= HTTP_BREAKER_THRESHOLD:
+                self.open_until[host] = time.monotonic() + HTTP_BREAKER_COOLDOWN
+
+    def _send(self, scheme: str, host: str, method: str, path: str, body, headers: dict, read_timeout: float):
+        '''Одна попытка; у исключения атрибут request_sent — успел ли запрос уйти на сервер'''
+        while True:
+            conn, reused = self._acquire(scheme, host)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(read_timeout)
+                conn.request(method, path, body=body, headers=headers)
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused:
+                    # Сервер закрыл простаивающее соединение, запрос не ушёл — это не сбой провайдера
+                    continue
+                e.request_sent = False
+                raise
+            try:
+                r = conn.getresponse()
+                data = r.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                e.request_sent = True
+                raise
+            if r.will_close:
+                conn.close()
+            else:
+                self._release(scheme, host, conn)
+            return r.status, data
+
+    def request(self, method: str, url: str, body: bytes = None, headers: dict = None,
+                retries: int = HTTP_RETRIES, read_timeout: float = HTTP_READ_TIMEOUT, idempotent: bool = None):
+        '''Возвращает (status, body); при открытом автомате — CircuitOpen. Ошибка до отправки и 429 повторяются всегда,
+        5xx, обрыв и таймаут чтения после отправки — только для идемпотентных запросов (GET/HEAD/PUT/DELETE
+        или с Idempotence-Key): иначе повтор мог бы создать второй платёж или сообщение'''
+        u = urllib.parse.urlsplit(url)
+        path = (u.path or '/') + (f'?{u.query}' if u.query else '')
+        headers = headers or {}
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS or any(k.lower() == 'idempotence-key' for k in headers)
+        attempt = 0
+        while True:
+            self._admit(u.netloc)
+            try:
+                status, data = self._send(u.scheme, u.netloc, method, path, body, headers, read_timeout)
+            except Exception as e:
+                self._record(u.netloc, False)
+                sent = getattr(e, 'request_sent', True)
+                if not isinstance(e, (http.client.HTTPException, OSError)) or attempt >= retries or (sent and not idempotent):
+                    raise
+            else:
+                if status < 500 and status != 429:
+                    self._record(u.netloc, True)
+                    return status, data
+                self._record(u.netloc, False)
+                if attempt >= retries or (status != 429 and not idempotent):
+                    return status, data
+            time.sleep(random.uniform(0, HTTP_BACKOFF * 2 ** attempt))
+            attempt += 1
+
+http_client = HttpClient()
+
 def send_telegram_notification(data: dict, order_id: int):
     token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
     chat_id = os.environ.get('TELEGRAM_CHAT_ID', '')
     if not token or not chat_id:
-        return
+        return False
     transfer_type_labels = {'individual': 'Индивидуальный', 'group': 'Групповой'}
     car_class_labels = {'economy': 'Эконом', 'comfort': 'Комфорт', 'business': 'Бизнес', 'minivan': 'Минивэн'}
-    payment_labels = {'full': 'Полная оплата', 'prepay': 'Предоплата 30%', 'cash': 'Наличные'}
+    payment_labels = {'full': 'Полная оплата', 'prepay': 'Предоплата', 'cash': 'Наличные'}
     text = (
         f"🚗 *Новая заявка #{order_id}*\n\n"
         f"📍 {data.get('from_location')} → {data.get('to_location')}\n"
@@ -53,15 +394,12 @@ def send_telegram_notification(data: dict, order_id: int):
         f"💰 *{data.get('price', 0)} ₽*"
     )
     payload = json.dumps({'chat_id': chat_id, 'text': text, 'parse_mode': 'Markdown'}).encode()
-    req = urllib.request.Request(
-        f'https://api.telegram.org/bot{token}/sendMessage',
-        data=payload,
-        headers={'Content-Type': 'application/json'}
-    )
-    try:
-        urllib.request.urlopen(req, timeout=5)
-    except Exception:
-        pass
+    # Повторы делает outbox, здесь только одна попытка
+    status, body = http_client.request('POST', f'https://api.telegram.org/bot{token}/sendMessage', payload,
+                                       {'Content-Type': 'application/json'}, retries=0, read_timeout=5)
+    if status >= 400:
+        raise RuntimeError(f'Telegram {status}: {body[:200].decode(errors="replace")}')
+    return True
 
 def send_email_notification(data: dict, order_id: int, settings: dict):
     smtp_host = settings.get('smtp_host', '')
@@ -70,79 +408,213 @@ def send_email_notification(data: dict, order_id: int, settings: dict):
     notify_to = settings.get('email_notify_to', '')
     smtp_password = os.environ.get('SMTP_PASSWORD', '')
     if not smtp_host or not smtp_user or not smtp_password or not notify_to:
-        return
+        return False
     if settings.get('email_notify_new_order', 'true') != 'true':
-        return
-    try:
-        smtp_port = int(settings.get('smtp_port', '587') or '587')
-        transfer_type_labels = {'individual': 'Индивидуальный', 'group': 'Групповой'}
-        car_class_labels = {'economy': 'Эконом', 'comfort': 'Комфорт', 'business': 'Бизнес', 'minivan': 'Минивэн'}
-        payment_labels = {'full': 'Полная оплата', 'prepay': 'Предоплата', 'cash': 'Наличные'}
-        html = f"""
-        <html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: #f59e0b; padding: 20px; border-radius: 10px 10px 0 0;">
-            <h2 style="color: white; margin: 0;">🚗 Новая заявка #{order_id}</h2>
-        </div>
-        <div style="background: #fff; padding: 20px; border: 1px solid #e5e7eb; border-radius: 0 0 10px 10px;">
-            <table style="width: 100%; border-collapse: collapse;">
-                <tr><td style="padding: 8px; color: #6b7280;">Маршрут:</td><td style="padding: 8px; font-weight: bold;">{data.get('from_location')} → {data.get('to_location')}</td></tr>
-                <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Дата и время:</td><td style="padding: 8px;">{str(data.get('pickup_datetime', '')).replace('T', ' ')}</td></tr>
-                <tr><td style="padding: 8px; color: #6b7280;">Пассажир:</td><td style="padding: 8px;">{data.get('passenger_name')}</td></tr>
-                <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Телефон:</td><td style="padding: 8px;">{data.get('passenger_phone')}</td></tr>
-                <tr><td style="padding: 8px; color: #6b7280;">Пассажиров:</td><td style="padding: 8px;">{data.get('passengers_count', 1)}</td></tr>
-                <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Тип трансфера:</td><td style="padding: 8px;">{transfer_type_labels.get(data.get('transfer_type','individual'), 'Индивидуальный')}</td></tr>
-                <tr><td style="padding: 8px; color: #6b7280;">Класс авто:</td><td style="padding: 8px;">{car_class_labels.get(data.get('car_class','comfort'), 'Комфорт')}</td></tr>
-                <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Оплата:</td><td style="padding: 8px;">{payment_labels.get(data.get('payment_type','cash'), 'Наличные')}</td></tr>
-                <tr><td style="padding: 8px; color: #6b7280;">Сумма:</td><td style="padding: 8px; font-weight: bold; font-size: 18px; color: #f59e0b;">{data.get('price', 0)} ₽</td></tr>
-            </table>
-        </div>
-        </body></html>
-        """
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f'Новая заявка #{order_id} — {data.get("from_location")} → {data.get("to_location")}'
-        msg['From'] = f'{smtp_from} <{smtp_user}>'
-        msg['To'] = notify_to
-        msg.attach(MIMEText(html, 'html', 'utf-8'))
-        with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.sendmail(smtp_user, notify_to, msg.as_string())
-    except Exception:
-        pass
+        return False
+    smtp_port = int(settings.get('smtp_port', '587') or '587')
+    transfer_type_labels = {'individual': 'Индивидуальный', 'group': 'Групповой'}
+    car_class_labels = {'economy': 'Эконом', 'comfort': 'Комфорт', 'business': 'Бизнес', 'minivan': 'Минивэн'}
+    payment_labels = {'full': 'Полная оплата', 'prepay': 'Предоплата', 'cash': 'Наличные'}
+    html = f"""
+    <html><body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+    <div style="background: #f59e0b; padding: 20px; border-radius: 10px 10px 0 0;">
+        <h2 style="color: white; margin: 0;">🚗 Новая заявка #{order_id}</h2>
+    </div>
+    <div style="background: #fff; padding: 20px; border: 1px solid #e5e7eb; border-radius: 0 0 10px 10px;">
+        <table style="width: 100%; border-collapse: collapse;">
+            <tr><td style="padding: 8px; color: #6b7280;">Маршрут:</td><td style="padding: 8px; font-weight: bold;">{data.get('from_location')} → {data.get('to_location')}</td></tr>
+            <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Дата и время:</td><td style="padding: 8px;">{str(data.get('pickup_datetime', '')).replace('T', ' ')}</td></tr>
+            <tr><td style="padding: 8px; color: #6b7280;">Пассажир:</td><td style="padding: 8px;">{data.get('passenger_name')}</td></tr>
+            <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Телефон:</td><td style="padding: 8px;">{data.get('passenger_phone')}</td></tr>
+            <tr><td style="padding: 8px; color: #6b7280;">Пассажиров:</td><td style="padding: 8px;">{data.get('passengers_count', 1)}</td></tr>
+            <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Тип трансфера:</td><td style="padding: 8px;">{transfer_type_labels.get(data.get('transfer_type','individual'), 'Индивидуальный')}</td></tr>
+            <tr><td style="padding: 8px; color: #6b7280;">Класс авто:</td><td style="padding: 8px;">{car_class_labels.get(data.get('car_class','comfort'), 'Комфорт')}</td></tr>
+            <tr style="background: #f9fafb;"><td style="padding: 8px; color: #6b7280;">Оплата:</td><td style="padding: 8px;">{payment_labels.get(data.get('payment_type','cash'), 'Наличные')}</td></tr>
+            <tr><td style="padding: 8px; color: #6b7280;">Сумма:</td><td style="padding: 8px; font-weight: bold; font-size: 18px; color: #f59e0b;">{data.get('price', 0)} ₽</td></tr>
+        </table>
+    </div>
+    </body></html>
+    """
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f'Новая заявка #{order_id} — {data.get("from_location")} → {data.get("to_location")}'
+    msg['From'] = f'{smtp_from} <{smtp_user}>'
+    msg['To'] = notify_to
+    msg.attach(MIMEText(html, 'html', 'utf-8'))
+    with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as server:
+        server.starttls()
+        server.login(smtp_user, smtp_password)
+        server.sendmail(smtp_user, notify_to, msg.as_string())
+    return True
+
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BASE_DELAY = int(os.environ.get('OUTBOX_BASE_DELAY', '30'))
+OUTBOX_LEASE_SECONDS = 300
+NOTIFY_FIELDS = ('from_location', 'to_location', 'pickup_datetime', 'passenger_name', 'passenger_phone',
+                 'passengers_count', 'transfer_type', 'car_class', 'payment_type', 'price')
+
+def notification_payload(data: dict) -> str:
+    """Полезная нагрузка уведомлений о заказе; строки outbox пишет create_order() в той же транзакции, что и заказ"""
+    return json.dumps({k: data.get(k) for k in NOTIFY_FIELDS}, default=str)
+
+def deliver_outbox_item(channel: str, order_id: int, payload: dict, settings: dict) -> bool:
+    if channel == 'telegram':
+        return send_telegram_notification(payload, order_id)
+    if channel == 'email':
+        return send_email_notification(payload, order_id, settings)
+    raise ValueError(f'Неизвестный канал {channel}')
+
+def drain_outbox(limit: int = 20) -> dict:
+    """Доставляет очередные уведомления: ретраи с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS — dead"""
+    conn = get_conn(); cur = conn.cursor()
+    settings = get_site_settings(cur)
+    # Берём пачку в аренду: параллельный воркер пропустит заблокированные строки,
+    # а при падении воркера строки вернутся в очередь по истечении аренды
+    cur.execute(f'''
+        UPDATE {SCHEMA}.notification_outbox SET attempts=attempts+1,
+               next_attempt_at=NOW() + make_interval(secs => %s)
+        WHERE id IN (
+            SELECT id FROM {SCHEMA}.notification_outbox
+            WHERE status='pending' AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at, id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) RETURNING id, channel, order_id, payload, attempts
+    ''', (OUTBOX_LEASE_SECONDS, limit))
+    batch = cur.fetchall()
+    conn.commit()
+    result = {'sent': 0, 'skipped': 0, 'retry': 0, 'dead': 0}
+    for item_id, channel, order_id, payload, attempts in batch:
+        try:
+            delivered = deliver_outbox_item(channel, order_id, payload or {}, settings)
+            status = 'sent' if delivered else 'skipped'
+            cur.execute(f"UPDATE {SCHEMA}.notification_outbox SET status=%s, sent_at=NOW(), last_error=NULL WHERE id=%s",
+                        (status, item_id))
+        except Exception as e:
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                status = 'dead'
+                cur.execute(f"UPDATE {SCHEMA}.notification_outbox SET status='dead', last_error=%s WHERE id=%s",
+                            (str(e)[:1000], item_id))
+            else:
+                status = 'retry'
+                delay = OUTBOX_BASE_DELAY * (2 ** (attempts - 1))
+                cur.execute(f"UPDATE {SCHEMA}.notification_outbox SET last_error=%s, next_attempt_at=NOW() + make_interval(secs => %s) WHERE id=%s",
+                            (str(e)[:1000], delay, item_id))
+        conn.commit()
+        result[status] += 1
+    cur.close(); conn.close()
+    return result
+
+def handle_outbox(method, event):
+    params = event.get('queryStringParameters', {}) or {}
+    if method == 'POST':
+        limit = min(int(params.get('limit', 20) or 20), 100)
+        return resp(200, drain_outbox(limit))
+    elif method == 'GET':
+        conn = get_conn(); cur = conn.cursor()
+        cur.execute(f"SELECT status, COUNT(*) FROM {SCHEMA}.notification_outbox GROUP BY status")
+        counts = {r[0]: r[1] for r in cur.fetchall()}
+        cur.execute(f"SELECT id, channel, order_id, attempts, last_error, created_at FROM {SCHEMA}.notification_outbox WHERE status='dead' ORDER BY id DESC LIMIT 50")
+        cols = [d[0] for d in cur.description]
+        dead = [dict(zip(cols, r)) for r in cur.fetchall()]
+        cur.close(); conn.close()
+        return resp(200, {'counts': counts, 'dead': dead})
+    return resp(405, {'error': 'Method not allowed'})
+
+PUSH_WORKERS = int(os.environ.get('PUSH_WORKERS', '8'))
+PUSH_TIMEOUT = 5
+_push_executor = None
+_push_local = threading.local()
+
+def _push_connection(scheme: str, host: str):
+    """Keep-alive соединение с push-сервисом: своё на каждый поток пула и хост"""
+    conns = getattr(_push_local, 'conns', None)
+    if conns is None:
+        conns = _push_local.conns = {}
+    conn = conns.get((scheme, host))
+    if conn is None:
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        conn = conns[(scheme, host)] = cls(host, timeout=PUSH_TIMEOUT)
+    return conn
+
+def _post_push(endpoint: str, payload: bytes) -> int:
+    u = urllib.parse.urlsplit(endpoint)
+    path = (u.path or '/') + (f'?{u.query}' if u.query else '')
+    headers = {'Content-Type': 'application/json', 'TTL': '86400'}
+    for attempt in range(2):
+        conn = _push_connection(u.scheme, u.netloc)
+        try:
+            conn.request('POST', path, body=payload, headers=headers)
+            r = conn.getresponse()
+            r.read()
+            return r.status
+        except (http.client.HTTPException, OSError):
+            # Сервер мог закрыть простаивающее соединение — переподключаемся один раз
+            conn.close()
+            _push_local.conns.pop((u.scheme, u.netloc), None)
+            if attempt:
+                raise
+
+def send_push_bulk(messages: list) -> dict:
+    """Рассылает Web Push: messages — список (user_id, title, body, url).
+    Доставка идёт параллельно через ограниченный пул потоков, подписки с ответом 404/410 удаляются."""
+    global _push_executor
+    by_user = {}
+    for user_id, title, body, url in messages:
+        if user_id:
+            by_user.setdefault(int(user_id), []).append(
+                json.dumps({'title': title, 'body': body, 'url': url, 'tag': 'order-update'}).encode())
+    if not by_user:
+        return {'sent': 0, 'failed': 0, 'pruned': 0}
+    conn = get_conn(); cur = conn.cursor()
+    cur.execute(f"SELECT user_id, endpoint FROM {SCHEMA}.push_subscriptions WHERE user_id = ANY(%s)", (list(by_user),))
+    jobs = [(endpoint, payload) for user_id, endpoint in cur.fetchall() for payload in by_user[user_id]]
+    if _push_executor is None:
+        _push_executor = ThreadPoolExecutor(max_workers=PUSH_WORKERS, thread_name_prefix='push')
+    futures = {_push_executor.submit(_post_push, endpoint, payload): endpoint for endpoint, payload in jobs}
+    sent = failed = 0
+    dead = set()
+    for fut, endpoint in futures.items():
+        try:
+            status = fut.result()
+        except Exception:
+            failed += 1
+            continue
+        if status in (404, 410):
+            dead.add(endpoint)
+        elif 200 <= status < 300:
+            sent += 1
+        else:
+            failed += 1
+    if dead:
+        cur.execute(f"DELETE FROM {SCHEMA}.push_subscriptions WHERE endpoint = ANY(%s)", (list(dead),))
+        conn.commit()
+    cur.close(); conn.close()
+    return {'sent': sent, 'failed': failed, 'pruned': len(dead)}
 
 def send_push_to_user(user_id: int, title: str, body: str, url: str = '/profile'):
     """Отправляет Web Push уведомление пользователю через все его подписки"""
     try:
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute(f"SELECT endpoint, p256dh, auth FROM {SCHEMA}.push_subscriptions WHERE user_id=%s", (user_id,))
-        subscriptions = cur.fetchall()
-        cur.close(); conn.close()
-        for endpoint, p256dh, auth_key in subscriptions:
-            try:
-                payload = json.dumps({'title': title, 'body': body, 'url': url, 'tag': 'order-update'}).encode()
-                req = urllib.request.Request(
-                    endpoint,
-                    data=payload,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'TTL': '86400',
-                    },
-                    method='POST'
-                )
-                urllib.request.urlopen(req, timeout=5)
-            except Exception:
-                pass
+        return send_push_bulk([(user_id, title, body, url)])
     except Exception:
-        pass
+        return None
 
 
-def generate_yookassa_payment(order_id: int, amount: float, description: str, return_url: str, settings: dict) -> dict:
+def yookassa_auth(settings: dict):
     shop_id = settings.get('yookassa_shop_id', '')
     secret_key = os.environ.get('YOOKASSA_SECRET_KEY', '')
     if not shop_id or not secret_key:
+        return None
+    return 'Basic ' + base64.b64encode(f'{shop_id}:{secret_key}'.encode()).decode()
+
+def generate_yookassa_payment(order_id: int, amount: float, description: str, return_url: str, settings: dict,
+                              idempotence_key: str = None) -> dict:
+    auth = yookassa_auth(settings)
+    if not auth:
         return {'error': 'ЮКасса не настроена'}
     try:
-        idempotence_key = secrets.token_urlsafe(16)
+        idempotence_key = idempotence_key or secrets.token_urlsafe(16)
         payload = json.dumps({
             'amount': {'value': f'{amount:.2f}', 'currency': 'RUB'},
             'capture': True,
@@ -150,24 +622,23 @@ def generate_yookassa_payment(order_id: int, amount: float, description: str, re
             'description': description,
             'metadata': {'order_id': order_id},
         }).encode()
-        import base64
-        credentials = base64.b64encode(f'{shop_id}:{secret_key}'.encode()).decode()
-        req = urllib.request.Request(
-            'https://api.yookassa.ru/v3/payments',
-            data=payload,
-            headers={
-                'Content-Type': 'application/json',
-                'Authorization': f'Basic {credentials}',
-                'Idempotence-Key': idempotence_key,
-            }
-        )
-        with urllib.request.urlopen(req, timeout=15) as response:
-            result = json.loads(response.read())
-            return {
-                'payment_id': result.get('id'),
-                'payment_url': result.get('confirmation', {}).get('confirmation_url'),
-                'status': result.get('status'),
-            }
+        # Ретраи безопасны: ЮКасса не создаёт второй платёж с тем же Idempotence-Key
+        status, body = http_client.request('POST', 'https://api.yookassa.ru/v3/payments', payload, {
+            'Content-Type': 'application/json',
+            'Authorization': auth,
+            'Idempotence-Key': idempotence_key,
+        })
+        result = json.loads(body)
+        if status >= 400:
+            return {'error': result.get('description') or f'ЮКасса вернула {status}'}
+        return {
+            'payment_id': result.get('id'),
+            'payment_url': result.get('confirmation', {}).get('confirmation_url'),
+            'status': result.get('status'),
+        }
+    except (CircuitOpen, http.client.HTTPException, OSError):
+        # Провайдер недоступен: заказ уже создан, ссылку на оплату пользователь получит позже
+        return {'status': 'awaiting_link', 'message': 'Платёжный сервис временно недоступен, ссылка на оплату появится в личном кабинете'}
     except Exception as e:
         return {'error': str(e)}
 
@@ -183,7 +654,7 @@ def generate_robokassa_payment(order_id: int, amount: float, description: str, s
         sign_str = f'{login}:{out_sum}:{inv_id}:{password1}'
         signature = hashlib.md5(sign_str.encode()).hexdigest()
         test_param = '&IsTest=1' if test_mode else ''
-        desc_enc = urllib.request.quote(description)
+        desc_enc = urllib.parse.quote(description)
         payment_url = (
             f'https://auth.robokassa.ru/Merchant/Index.aspx'
             f'?MerchantLogin={login}&OutSum={out_sum}&InvId={inv_id}'
@@ -194,6 +665,517 @@ def generate_robokassa_payment(order_id: int, amount: float, description: str, s
         return {'error': str(e)}
 
 
+# ===== PAYMENTS =====
+PAYMENT_LINK_BATCH = 20
+PAYMENT_LEASE_SECONDS = 60
+PAYMENT_MAX_ATTEMPTS = 8
+PAYMENT_SYNC_PAGES = 5
+PAYMENT_ORDER_STATUS = {'succeeded': 'paid', 'canceled': 'canceled'}
+
+def payment_amount(data: dict, prepay_amount) -> float:
+    '''К оплате: полная цена или prepay_amount заказа — его считает create_order() по payment_settings.prepay_percent,
+    тому же проценту, что показывает форма бронирования'''
+    if data.get('payment_type') == 'prepay':
+        return float(prepay_amount or 0)
+    return float(data.get('price', 0) or 0)
+
+def enqueue_payment(cur, order_id: int, data: dict, settings: dict, prepay_amount=0) -> dict:
+    """Регистрирует платёж заказа в транзакции бронирования. Ссылку Робокассы подписываем сразу,
+    платёж ЮКассы создаёт воркер — на пути бронирования запросов к провайдеру нет"""
+    provider = settings.get('payment_provider', 'none')
+    if data.get('payment_type') not in ('full', 'prepay') or provider not in ('yookassa', 'robokassa'):
+        return {}
+    amount = payment_amount(data, prepay_amount)
+    description = f'Трансфер {data.get("from_location")} → {data.get("to_location")}'
+    if provider == 'robokassa':
+        info = generate_robokassa_payment(order_id, amount, description, settings)
+        if info.get('error'):
+            return info
+        payment_id, status, url = str(order_id), 'pending', info['payment_url']
+    else:
+        info = {'status': 'awaiting_link', 'message': 'Ссылка на оплату формируется'}
+        payment_id, status, url = None, 'pending_link', None
+    cur.execute(f'''
+        WITH p AS (
+            INSERT INTO {SCHEMA}.order_payments (order_id, provider, provider_payment_id, idempotence_key, amount, description, status, payment_url)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s) RETURNING order_id
+        )
+        UPDATE {SCHEMA}.orders o SET payment_status='pending' FROM p WHERE o.id=p.order_id
+    ''', (order_id, provider, payment_id, secrets.token_urlsafe(16), amount, description, status, url))
+    return info
+
+def apply_payment_status(cur, provider: str, payment_id: str, status: str, amount: float = None) -> bool:
+    """Переводит платёж и заказ в итоговый статус. Идемпотентно: завершённый платёж не меняется,
+    повторный вебхук или сверка ничего не делают"""
+    order_status = PAYMENT_ORDER_STATUS.get(status)
+    if not order_status:
+        return False
+    cur.execute(f'''
+        WITH p AS (
+            UPDATE {SCHEMA}.order_payments SET status=%(status)s, updated_at=NOW(),
+                   paid_at=CASE WHEN %(status)s='succeeded' THEN NOW() END
+            WHERE provider=%(provider)s AND provider_payment_id=%(payment_id)s AND status IN ('pending_link', 'pending')
+              AND (%(amount)s::numeric IS NULL OR amount=%(amount)s::numeric)
+            RETURNING order_id
+        )
+        UPDATE {SCHEMA}.orders o SET payment_status=%(order_status)s, updated_at=CURRENT_TIMESTAMP
+        FROM p WHERE o.id=p.order_id RETURNING o.id
+    ''', {'status': status, 'provider': provider, 'payment_id': payment_id, 'amount': amount, 'order_status': order_status})
+    return cur.fetchone() is not None
+
+def create_payment_links(limit: int = PAYMENT_LINK_BATCH, order_id: int = None, conn=None) -> dict:
+    """Создаёт платежи ЮКассы для строк pending_link: аренда пачки через SKIP LOCKED, ретраи с экспоненциальной задержкой.
+    conn — соединение вызывающего обработчика; аренда коммитится до HTTP-запросов, транзакция во время них не висит"""
+    own = conn is None
+    if own:
+        conn = get_conn()
+    cur = conn.cursor()
+    settings = get_site_settings(cur)
+    cond, vals = ('AND order_id=%s', [order_id]) if order_id else ('', [])
+    cur.execute(f'''
+        UPDATE {SCHEMA}.order_payments SET attempts=attempts+1, next_attempt_at=NOW() + make_interval(secs => %s)
+        WHERE id IN (
+            SELECT id FROM {SCHEMA}.order_payments
+            WHERE status='pending_link' AND provider='yookassa' AND next_attempt_at <= NOW() {cond}
+            ORDER BY next_attempt_at, id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) RETURNING id, order_id, amount, description, idempotence_key, attempts
+    ''', [PAYMENT_LEASE_SECONDS] + vals + [limit])
+    batch = cur.fetchall()
+    conn.commit()
+    return_url = settings.get('site_url', 'https://transfer-abkhazia.ru') + '/profile'
+    result = {'created': 0, 'retry': 0, 'failed': 0}
+    for pid, oid, amount, description, key, attempts in batch:
+        info = generate_yookassa_payment(oid, float(amount), description, return_url, settings, key)
+        if info.get('payment_url'):
+            cur.execute(f"UPDATE {SCHEMA}.order_payments SET provider_payment_id=%s, payment_url=%s, status='pending', last_error=NULL, updated_at=NOW() WHERE id=%s",
+                        (info['payment_id'], info['payment_url'], pid))
+            status = 'created'
+        elif attempts >= PAYMENT_MAX_ATTEMPTS:
+            cur.execute(f"UPDATE {SCHEMA}.order_payments SET status='failed', last_error=%s, updated_at=NOW() WHERE id=%s",
+                        (info.get('error') or info.get('message'), pid))
+            status = 'failed'
+        else:
+            cur.execute(f"UPDATE {SCHEMA}.order_payments SET last_error=%s, next_attempt_at=NOW() + make_interval(secs => %s) WHERE id=%s",
+                        (info.get('error') or info.get('message'), OUTBOX_BASE_DELAY * (2 ** (attempts - 1)), pid))
+            status = 'retry'
+        conn.commit()
+        result[status] += 1
+    cur.close()
+    if own:
+        conn.close()
+    return result
+
+def sync_payment_statuses() -> dict:
+    """Пакетная сверка: один запрос списка платежей ЮКассы на 100 платежей вместо опроса каждого заказа.
+    При сбое ЮКассы возвращает частичный результат с error, страницы до сбоя уже закоммичены"""
+    conn = get_conn(); cur = conn.cursor()
+    auth = yookassa_auth(get_site_settings(cur))
+    cur.execute(f"SELECT provider_payment_id, created_at FROM {SCHEMA}.order_payments WHERE provider='yookassa' AND status='pending'")
+    pending = dict(cur.fetchall())
+    result = {'pending': len(pending), 'updated': 0}
+    if not pending or not auth:
+        cur.close(); conn.close()
+        return result
+    # Запас в сутки покрывает разницу часовых поясов между БД и API (created_at в UTC)
+    since = (min(pending.values()) - datetime.timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    query = {'created_at.gte': since, 'limit': 100}
+    for _ in range(PAYMENT_SYNC_PAGES):
+        # Недоступность ЮКассы — штатный случай для воркера: останавливаемся и отдаём то, что успели сверить
+        try:
+            status, body = http_client.request('GET', 'https://api.yookassa.ru/v3/payments?' + urllib.parse.urlencode(query),
+                                               headers={'Authorization': auth})
+        except (CircuitOpen, http.client.HTTPException, OSError):
+            result['error'] = 'ЮКасса недоступна'
+            break
+        if status >= 400:
+            result['error'] = f'ЮКасса ответила {status}'
+            break
+        page = json.loads(body)
+        for item in page.get('items', []):
+            if item.get('id') in pending and apply_payment_status(cur, 'yookassa', item['id'], item.get('status')):
+                result['updated'] += 1
+        conn.commit()
+        if not page.get('next_cursor'):
+            break
+        query['cursor'] = page['next_cursor']
+    cur.close(); conn.close()
+    return result
+
+def handle_payments(method, event):
+    '''Платежи: GET ?order_id= — статус и ссылка; POST — воркер (создание ссылок и сверка);
+    action=webhook — уведомления ЮКассы; action=result — ResultURL Робокассы'''
+    params = event.get('queryStringParameters', {}) or {}
+    action = params.get('action', 'sync')
+
+    if action == 'webhook' and method == 'POST':
+        # Тело уведомления не подписано — статус берём из API ЮКассы по id платежа
+        payment_id = (json.loads(event.get('body') or '{}').get('object') or {}).get('id')
+        auth = yookassa_auth(get_site_settings())
+        if not payment_id or not auth:
+            return resp(400, {'error': 'Некорректное уведомление'})
+        try:
+            status, body = http_client.request('GET', f'https://api.yookassa.ru/v3/payments/{urllib.parse.quote(payment_id)}',
+                                               headers={'Authorization': auth})
+        except (CircuitOpen, http.client.HTTPException, OSError):
+            return resp(503, {'error': 'ЮКасса недоступна'})
+        if status >= 400:
+            return resp(404 if status == 404 else 503, {'error': f'ЮКасса вернула {status}'})
+        conn = get_conn(); cur = conn.cursor()
+        updated = apply_payment_status(cur, 'yookassa', payment_id, json.loads(body).get('status'))
+        conn.commit(); cur.close(); conn.close()
+        return resp(200, {'updated': updated})
+
+    if action == 'result':
+        fields = dict(params)
+        if method == 'POST' and event.get('body'):
+            body = event['body']
+            if event.get('isBase64Encoded'):
+                body = base64.b64decode(body).decode()
+            fields.update(urllib.parse.parse_qsl(body))
+        out_sum, inv_id, signature = fields.get('OutSum', ''), fields.get('InvId', ''), fields.get('SignatureValue', '')
+        password2 = os.environ.get('ROBOKASSA_PASSWORD2', '')
+        expected = hashlib.md5(f'{out_sum}:{inv_id}:{password2}'.encode()).hexdigest()
+        if not password2 or not secrets.compare_digest(expected.lower(), signature.lower()):
+            return {'statusCode': 400, 'headers': {'Content-Type': 'text/plain', **CORS}, 'body': 'bad sign', 'isBase64Encoded': False}
+        conn = get_conn(); cur = conn.cursor()
+        apply_payment_status(cur, 'robokassa', inv_id, 'succeeded', float(out_sum))
+        conn.commit(); cur.close(); conn.close()
+        return {'statusCode': 200, 'headers': {'Content-Type': 'text/plain', **CORS}, 'body': f'OK{inv_id}', 'isBase64Encoded': False}
+
+    if method == 'GET':
+        order_id = params.get('order_id')
+        if not order_id:
+            return resp(400, {'error': 'order_id обязателен'})
+        conn = get_conn(); cur = conn.cursor()
+        query = f"SELECT id, provider, status, payment_url, amount, paid_at FROM {SCHEMA}.order_payments WHERE order_id=%s ORDER BY id DESC LIMIT 1"
+        cur.execute(query, (int(order_id),))
+        row = cur.fetchone()
+        if row and row[2] == 'pending_link':
+            # Клиент ждёт ссылку — не дожидаемся воркера; то же соединение, транзакция закрыта до HTTP
+            conn.commit()
+            create_payment_links(1, int(order_id), conn)
+            cur.execute(query, (int(order_id),))
+            row = cur.fetchone()
+        cols = [d[0] for d in cur.description]
+        cur.close(); conn.close()
+        return resp(200, {'payment': dict(zip(cols, row)) if row else None})
+
+    if method == 'POST':
+        return resp(200, {'links': create_payment_links(), 'statuses': sync_payment_statuses()})
+
+    return resp(405, {'error': 'Method not allowed'})
+
+
+FEED_CHANNEL = 'order_changes'
+FEED_BUFFER = 1000
+FEED_MAX_WAIT = float(os.environ.get('FEED_MAX_WAIT', '25'))
+
+class ChangeFeed:
+    '''Слушает NOTIFY order_changes на выделенном соединении и раздаёт события подписчикам long-poll'''
+
+    def __init__(self):
+        self.feed_id = None
+        self.seq = 0
+        self.events = deque(maxlen=FEED_BUFFER)
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def ensure_running(self):
+        with self.cond:
+            if self.feed_id is not None and self.thread is not None and self.thread.is_alive():
+                return
+            conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+            conn.autocommit = True
+            cur = conn.cursor(); cur.execute(f'LISTEN {FEED_CHANNEL}'); cur.close()
+            # Новый слушатель — новая нумерация: клиенты со старым курсором получат resync
+            self.feed_id = secrets.token_hex(4)
+            self.seq = 0
+            self.events.clear()
+            self.thread = threading.Thread(target=self._listen, args=(conn,), daemon=True, name='change-feed')
+            self.thread.start()
+
+    def _listen(self, conn):
+        try:
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                with self.cond:
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        try:
+                            event = json.loads(note.payload)
+                        except ValueError:
+                            continue
+                        self.seq += 1
+                        event['seq'] = self.seq
+                        self.events.append(event)
+                    self.cond.notify_all()
+        except Exception:
+            logging.getLogger('change-feed').exception('Слушатель ленты изменений остановлен')
+            # Лента мертва: ждущие просыпаются сразу и получают resync, следующий запрос поднимет новый слушатель
+            with self.cond:
+                if self.thread is threading.current_thread():
+                    self.feed_id = None
+                self.cond.notify_all()
+        finally:
+            conn.close()
+
+    def is_stale(self, after: int) -> bool:
+        return bool(self.events) and after < self.events[0]['seq'] - 1
+
+    def wait(self, after: int, match, timeout: float):
+        '''Ждёт событий с номером больше after, прошедших фильтр match; возвращает (события, последний номер).
+        Если слушатель упал во время ожидания — (None, номер): клиенту нужен resync'''
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            feed_id = self.feed_id
+            while True:
+                if self.feed_id != feed_id:
+                    return None, self.seq
+                found = [e for e in self.events if e['seq'] > after and match(e)]
+                remaining = deadline - time.monotonic()
+                if found or remaining <= 0:
+                    return found, self.seq
+                self.cond.wait(remaining)
+
+change_feed = ChangeFeed()
+
+def _csv_param(params, *names):
+    for name in names:
+        if params.get(name):
+            return {v.strip() for v in params[name].split(',') if v.strip()}
+    return set()
+
+def handle_feed(method, event):
+    '''Лента изменений: ?cursor= (или заголовок Last-Event-ID), фильтры table, car_class/car_category, status_id, driver_id'''
+    if method != 'GET':
+        return resp(405, {'error': 'Method not allowed'})
+    params = event.get('queryStringParameters', {}) or {}
+    headers = {k.lower(): v for k, v in (event.get('headers', {}) or {}).items()}
+    change_feed.ensure_running()
+
+    cursor = params.get('cursor') or headers.get('last-event-id') or ''
+    feed_id, _, after = cursor.partition(':')
+    resync = bool(cursor) and (feed_id != change_feed.feed_id or not after.isdigit() or change_feed.is_stale(int(after)))
+    tables = _csv_param(params, 'table')
+    classes = _csv_param(params, 'car_class', 'car_category')
+    statuses = {int(v) for v in _csv_param(params, 'status_id')}
+    driver_id = params.get('driver_id')
+
+    def match(e):
+        if tables and e.get('table') not in tables:
+            return False
+        if classes and e.get('car_class') not in classes:
+            return False
+        if statuses and e.get('status_id') not in statuses:
+            return False
+        if driver_id and str(e.get('driver_id')) != driver_id:
+            return False
+        return True
+
+    if resync or not cursor:
+        # Без курсора слушаем с текущего момента; после resync клиент дочитывает изменения через ?since=
+        events, last = [], change_feed.seq
+    else:
+        timeout = max(0.0, min(float(params.get('timeout') or FEED_MAX_WAIT), FEED_MAX_WAIT))
+        events, last = change_feed.wait(int(after), match, timeout)
+        if events is None:
+            change_feed.ensure_running()
+            resync, events, last = True, [], change_feed.seq
+    next_cursor = f'{change_feed.feed_id}:{last}'
+
+    if 'text/event-stream' in headers.get('accept', ''):
+        # EventSource переподключается после каждого ответа и присылает последний id в Last-Event-ID
+        chunks = ['retry: 500\n\n']
+        if resync:
+            chunks.append(f'event: resync\ndata: {{}}\n\n')
+        chunks += [f"id: {change_feed.feed_id}:{e['seq']}\nevent: change\ndata: {json.dumps(e, default=str)}\n\n" for e in events]
+        chunks.append(f'id: {next_cursor}\n\n')
+        return {'statusCode': 200, 'headers': {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', **CORS},
+                'body': ''.join(chunks), 'isBase64Encoded': False}
+    return resp(200, {'events': events, 'cursor': next_cursor, 'resync': resync})
+
+
+# ===== QUOTES =====
+# Та же матрица цен есть в tariffs/index.py: функции деплоятся по отдельности, правки вносить в обе
+QUOTE_TABLES = ('tariffs', 'car_classes', 'transfer_types', 'additional_services', 'site_settings')
+DEFAULT_GROUP_PRICE_PER_PERSON = 1500
+
+def round_price(value: float) -> int:
+    '''Округление как Math.round в форме бронирования (половина — вверх), а не банковское round()'''
+    return int(math.floor(value + 0.5))
+
+class PriceMatrix:
+    '''Матрица цен на тёплый контейнер: (тариф, класс авто, тип трансфера) -> базовая цена, плюс цены услуг.
+    Пересчитывается, только когда меняется версия одной из таблиц в cache_versions'''
+
+    def __init__(self):
+        self.base = {}
+        self.services = {}
+        self.versions = None
+        self.checked_at = 0.0
+
+    def refresh(self, cur=None):
+        now = time.monotonic()
+        if self.versions is not None and now - self.checked_at < SETTINGS_CHECK_INTERVAL:
+            return self
+        own = cur is None
+        if own:
+            conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT name, version FROM {SCHEMA}.cache_versions WHERE name = ANY(%s)", (list(QUOTE_TABLES),))
+            versions = dict(cur.fetchall())
+            if versions != self.versions:
+                self._build(cur)
+                self.versions = versions
+            self.checked_at = now
+        finally:
+            if own:
+                cur.close(); conn.close()
+        return self
+
+    def _build(self, cur):
+        cur.execute(f"SELECT id, price FROM {SCHEMA}.tariffs WHERE is_active=true")
+        tariffs = cur.fetchall()
+        cur.execute(f"SELECT value, price_multiplier FROM {SCHEMA}.car_classes WHERE is_active=true")
+        classes = cur.fetchall()
+        cur.execute(f"SELECT value FROM {SCHEMA}.transfer_types WHERE is_active=true")
+        types = [r[0] for r in cur.fetchall()]
+        cur.execute(f"SELECT id, price FROM {SCHEMA}.additional_services WHERE is_active=true")
+        services = {sid: float(price or 0) for sid, price in cur.fetchall()}
+        cur.execute(f"SELECT value FROM {SCHEMA}.site_settings WHERE key='group_transfer_price_per_person'")
+        row = cur.fetchone()
+        try:
+            group = float(row[0]) if row and row[0] else DEFAULT_GROUP_PRICE_PER_PERSON
+        except ValueError:
+            group = DEFAULT_GROUP_PRICE_PER_PERSON
+        # Групповой трансфер — цена за пассажира, остальные — тариф × множитель класса
+        base = {}
+        for tariff_id, price in tariffs:
+            for car_class, multiplier in classes:
+                individual = round_price(float(price or 0) * float(multiplier or 1))
+                for transfer_type in types:
+                    base[(tariff_id, car_class, transfer_type)] = (group, True) if transfer_type == 'group' else (individual, False)
+        self.base, self.services = base, services
+
+    def quote(self, tariff_id: int, car_class: str, transfer_type: str, passengers: int = 1, services=()):
+        '''Цена поездки; None — комбинации нет среди активных тарифов, классов, типов или услуг'''
+        entry = self.base.get((tariff_id, car_class, transfer_type))
+        if entry is None or any(sid not in self.services for sid in services):
+            return None
+        price, per_person = entry
+        base = round_price(price * max(1, passengers)) if per_person else price
+        extras = sum(self.services[sid] for sid in services)
+        return {'tariff_id': tariff_id, 'car_class': car_class, 'transfer_type': transfer_type, 'passengers': passengers,
+                'services': list(services), 'base_price': base, 'services_price': extras, 'price': base + extras}
+
+price_matrix = PriceMatrix()
+
+
+ORDERS_PAGE_SIZE = 100
+ORDERS_PAGE_MAX = 500
+
+def encode_cursor(created_at, row_id) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token: str):
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    created_at, row_id = raw.rsplit('|', 1)
+    return created_at, int(row_id)
+
+def list_orders(cur, params) -> dict:
+    """Список заказов для админки: keyset-пагинация по (created_at, id) и серверные фильтры"""
+    where, values = [], []
+    if params.get('status_id'):
+        where.append('o.status_id=%s'); values.append(int(params['status_id']))
+    if params.get('driver_id') == 'none':
+        where.append('o.driver_id IS NULL')
+    elif params.get('driver_id'):
+        where.append('o.driver_id=%s'); values.append(int(params['driver_id']))
+    if params.get('car_class'):
+        where.append('o.car_class=%s'); values.append(params['car_class'])
+    if params.get('payment_type'):
+        where.append('o.payment_type=%s'); values.append(params['payment_type'])
+    if params.get('date_from'):
+        where.append('o.created_at >= %s'); values.append(params['date_from'])
+    if params.get('date_to'):
+        where.append('o.created_at < %s::date + 1'); values.append(params['date_to'])
+    since = params.get('since')
+    if since:
+        # Дельта-синхронизация: всё изменённое после токена, без курсора страниц
+        where.append('o.updated_at > %s'); values.append(since)
+        order_by, limit = 'o.updated_at, o.id', ORDERS_PAGE_MAX
+    else:
+        if params.get('cursor'):
+            where.append('(o.created_at, o.id) < (%s, %s)'); values.extend(decode_cursor(params['cursor']))
+        order_by = 'o.created_at DESC, o.id DESC'
+        limit = max(1, min(int(params.get('limit') or ORDERS_PAGE_SIZE), ORDERS_PAGE_MAX))
+    cur.execute(f'''
+        SELECT o.id, o.from_location, o.to_location, o.pickup_datetime,
+               o.passenger_name, o.passenger_phone, o.price, o.created_at,
+               o.transfer_type, o.car_class, o.payment_type, o.prepay_amount,
+               o.passengers_count, o.flight_number, o.passenger_email, o.status_id,
+               o.notes, o.driver_id,
+               s.name as status_name, s.color as status_color,
+               t.city as tariff_city,
+               d.name as driver_name, d.phone as driver_phone
+        FROM {SCHEMA}.orders o
+        LEFT JOIN {SCHEMA}.order_statuses s ON o.status_id = s.id
+        LEFT JOIN {SCHEMA}.tariffs t ON o.tariff_id = t.id
+        LEFT JOIN {SCHEMA}.drivers d ON o.driver_id = d.id
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY {order_by}
+        LIMIT %s
+    ''', values + [limit + 1])
+    cols = [d[0] for d in cur.description]
+    rows = [dict(zip(cols, r)) for r in cur.fetchmany(limit)]
+    has_more = cur.fetchone() is not None
+    if since:
+        # Изменений больше, чем влезает в ответ — клиенту дешевле перечитать список целиком
+        return {'orders': [] if has_more else rows, 'resync': has_more, **sync_meta(cur, params)}
+    next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+    return {'orders': rows, 'next_cursor': next_cursor, **sync_meta(cur, params)}
+
+
+def update_orders_bulk(conn, cur, items: list):
+    """Массовая смена статуса/водителя: [{id, status_id, driver_id}] — один UPDATE в одной транзакции"""
+    rows = []
+    for item in items:
+        try:
+            rows.append({'id': int(item['id']),
+                         'status_id': int(item['status_id']) if item.get('status_id') else None,
+                         'driver_id': int(item['driver_id']) if item.get('driver_id') else None})
+        except (KeyError, ValueError, TypeError):
+            cur.close(); conn.close()
+            return resp(400, {'error': 'Каждая заявка должна содержать числовой id'})
+    if not rows:
+        cur.close(); conn.close()
+        return resp(400, {'error': 'Список заявок пуст'})
+    cur.execute(f'''
+        UPDATE {SCHEMA}.orders o SET status_id=COALESCE(v.status_id, o.status_id),
+               driver_id=COALESCE(v.driver_id, o.driver_id), updated_at=CURRENT_TIMESTAMP
+        FROM jsonb_to_recordset(%s::jsonb) AS v(id INTEGER, status_id INTEGER, driver_id INTEGER)
+        WHERE o.id=v.id
+        RETURNING o.id, o.user_id, v.status_id
+    ''', (json.dumps(rows),))
+    updated = cur.fetchall()
+    messages = []
+    for oid, user_id, status_id in updated:
+        name = status_names.get(status_id, cur) if user_id and status_id else None
+        if name:
+            messages.append((user_id, f'Статус заявки #{oid} изменён', f'Новый статус: {name}', '/profile'))
+    conn.commit(); cur.close(); conn.close()
+    if messages:
+        try:
+            send_push_bulk(messages)
+        except Exception:
+            pass
+    return resp(200, {'message': 'Заявки обновлены', 'updated': [r[0] for r in updated]})
+
+
 def handle_orders(method, event):
     conn = get_conn()
     cur = conn.cursor()
@@ -209,26 +1191,17 @@ def handle_orders(method, event):
                 LEFT JOIN {SCHEMA}.order_statuses s ON o.status_id = s.id
                 WHERE o.id = {int(order_id)}
             ''')
-        else:
-            cur.execute(f'''
-                SELECT o.id, o.from_location, o.to_location, o.pickup_datetime,
-                       o.passenger_name, o.passenger_phone, o.price, o.created_at,
-                       o.transfer_type, o.car_class, o.payment_type, o.prepay_amount,
-                       o.passengers_count, o.flight_number, o.passenger_email, o.status_id,
-                       o.notes, o.driver_id,
-                       s.name as status_name, s.color as status_color,
-                       t.city as tariff_city,
-                       d.name as driver_name, d.phone as driver_phone
-                FROM {SCHEMA}.orders o
-                LEFT JOIN {SCHEMA}.order_statuses s ON o.status_id = s.id
-                LEFT JOIN {SCHEMA}.tariffs t ON o.tariff_id = t.id
-                LEFT JOIN {SCHEMA}.drivers d ON o.driver_id = d.id
-                ORDER BY o.created_at DESC
-            ''')
-        cols = [d[0] for d in cur.description]
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+            cols = [d[0] for d in cur.description]
+            row = cur.fetchone()
+            cur.close(); conn.close()
+            return resp(200, {'orders': dict(zip(cols, row)) if row else None})
+        try:
+            page = list_orders(cur, params)
+        except (ValueError, UnicodeDecodeError):
+            cur.close(); conn.close()
+            return resp(400, {'error': 'Некорректные параметры списка'})
         cur.close(); conn.close()
-        return resp(200, {'orders': rows if not order_id else (rows[0] if rows else None)})
+        return resp(200, page)
 
     elif method == 'POST':
         data = json.loads(event.get('body', '{}'))
@@ -240,6 +1213,13 @@ def handle_orders(method, event):
             cur.close(); conn.close()
             return resp(401, {'error': 'Для оформления заказа необходимо войти в аккаунт'})
 
+        idem_key = idempotency_key(event)
+        if idem_key:
+            replay = claim_idempotency_key(cur, 'orders', idem_key, event.get('body'))
+            if replay:
+                cur.close(); conn.close()
+                return replay
+
         if not data.get('from_location') or not data.get('to_location'):
             cur.close(); conn.close()
             return resp(400, {'error': 'Укажите откуда и куда'})
@@ -250,99 +1230,90 @@ def handle_orders(method, event):
             cur.close(); conn.close()
             return resp(400, {'error': 'Укажите дату и время поездки'})
 
-        tariff_id = data.get('tariff_id')
         try:
-            tariff_id = int(tariff_id) if tariff_id else None
+            tariff_id = int(data.get('tariff_id'))
         except (ValueError, TypeError):
-            tariff_id = None
-
-        price = float(data.get('price', 0) or 0)
-        prepay_amount = round(price * 0.3) if data.get('payment_type') == 'prepay' else 0
-        payment_from_balance = data.get('payment_from_balance', False)
-        payment_type = data.get('payment_type', 'cash')
-
-        if payment_from_balance:
-            if price <= 0:
-                cur.close(); conn.close()
-                return resp(400, {'error': 'Некорректная сумма'})
-            cur.execute(f"SELECT balance FROM {SCHEMA}.users WHERE id=%s", (int(user_id),))
-            bal_row = cur.fetchone()
-            if not bal_row or float(bal_row[0]) < price:
-                cur.close(); conn.close()
-                return resp(400, {'error': 'Недостаточно средств на балансе'})
-            cur.execute(f"UPDATE {SCHEMA}.users SET balance=balance-%s WHERE id=%s", (price, int(user_id)))
+            cur.close(); conn.close()
+            return resp(400, {'error': 'Выберите тариф'})
 
-        cur.execute(f'''
-            INSERT INTO {SCHEMA}.orders (
-                from_location, to_location, pickup_datetime, flight_number,
-                passenger_name, passenger_phone, passenger_email,
-                passengers_count, luggage_count, tariff_id, fleet_id,
-                status_id, price, notes, transfer_type, car_class, payment_type, prepay_amount, user_id, payment_from_balance
-            ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id
-        ''', (
-            data.get('from_location'), data.get('to_location'), data.get('pickup_datetime'),
-            data.get('flight_number'), data.get('passenger_name'), data.get('passenger_phone'),
-            data.get('passenger_email'), int(data.get('passengers_count', 1) or 1), int(data.get('luggage_count', 0) or 0),
-            tariff_id, data.get('fleet_id'), int(data.get('status_id', 1) or 1),
-            price, data.get('notes'),
-            data.get('transfer_type', 'individual'), data.get('car_class', 'comfort'),
-            payment_type, prepay_amount,
-            int(user_id), payment_from_balance
-        ))
-        oid = cur.fetchone()[0]
+        try:
+            fleet_id = int(data.get('fleet_id')) if data.get('fleet_id') else None
+        except (ValueError, TypeError):
+            fleet_id = None
 
-        if payment_from_balance:
-            cur.execute(f"INSERT INTO {SCHEMA}.balance_transactions (user_id,amount,type,description,status) VALUES (%s,%s,'payment','Оплата заказа #%s','completed')",
-                        (int(user_id), -price, oid))
+        # Цену считает сервер по матрице; цена клиента только сверяется, чтобы он увидел изменение до оплаты.
+        # Дальше (списание с баланса, уведомления, платёж) используется только серверная цена
+        try:
+            services = tuple(int(s) for s in data.get('services') or [])
+        except (ValueError, TypeError):
+            services = None
+        quote = price_matrix.refresh(cur).quote(
+            tariff_id, data.get('car_class', 'comfort'), data.get('transfer_type', 'individual'),
+            int(data.get('passengers_count', 1) or 1), services) if services is not None else None
+        if quote is None:
+            cur.close(); conn.close()
+            return resp(400, {'error': 'Тариф, класс авто, тип трансфера или услуга недоступны'})
+        try:
+            client_price = float(data.get('price'))
+        except (ValueError, TypeError):
+            client_price = None
+        if client_price is None or abs(quote['price'] - client_price) > 0.01:
+            cur.close(); conn.close()
+            return resp(409, {'error': 'Цена изменилась, проверьте сумму', 'quote': quote})
+        price = quote['price']
+        data = {**data, 'price': price}
+        payment_from_balance = bool(data.get('payment_from_balance', False))
+        if payment_from_balance and price <= 0:
+            cur.close(); conn.close()
+            return resp(400, {'error': 'Некорректная сумма'})
 
+        order = {
+            'from_location': data.get('from_location'), 'to_location': data.get('to_location'),
+            'pickup_datetime': data.get('pickup_datetime'), 'flight_number': data.get('flight_number'),
+            'passenger_name': data.get('passenger_name'), 'passenger_phone': data.get('passenger_phone'),
+            'passenger_email': data.get('passenger_email'),
+            'passengers_count': int(data.get('passengers_count', 1) or 1), 'luggage_count': int(data.get('luggage_count', 0) or 0),
+            'tariff_id': tariff_id, 'fleet_id': fleet_id, 'status_id': int(data.get('status_id', 1) or 1),
+            'price': price, 'notes': data.get('notes'),
+            'transfer_type': data.get('transfer_type', 'individual'), 'car_class': data.get('car_class', 'comfort'),
+            'payment_type': data.get('payment_type', 'cash'), 'payment_from_balance': payment_from_balance,
+        }
+        site_settings = get_site_settings(cur)
+        # Списание баланса (с блокировкой строки пользователя), заказ, журнал и outbox — один вызов
+        cur.execute(f"SELECT order_id, prepay_amount FROM {SCHEMA}.create_order(%s, %s, %s)",
+                    (int(user_id), json.dumps(order), notification_payload(data)))
+        oid, prepay_amount = cur.fetchone()
+        if oid is None:
+            conn.rollback(); cur.close(); conn.close()
+            return resp(400, {'error': 'Недостаточно средств на балансе'})
+        payment_info = enqueue_payment(cur, oid, data, site_settings, prepay_amount)
+        response = resp(201, {'id': oid, 'prepay_amount': prepay_amount, 'message': 'Заявка создана', **payment_info})
+        if idem_key:
+            store_idempotent_response(cur, 'orders', idem_key, response)
         conn.commit(); cur.close(); conn.close()
-
-        site_settings = get_site_settings()
-        send_telegram_notification(data, oid)
-        send_email_notification(data, oid, site_settings)
-
-        # Генерируем ссылку на оплату если выбран онлайн-провайдер
-        payment_info = {}
-        provider = site_settings.get('payment_provider', 'none')
-        if data.get('payment_type') in ('full', 'prepay') and provider != 'none':
-            pay_amount = float(data.get('price', 0))
-            if data.get('payment_type') == 'prepay':
-                prepay_pct = int(site_settings.get('prepay_percent', '30') or 30)
-                pay_amount = round(pay_amount * prepay_pct / 100, 2)
-            description = f'Трансфер {data.get("from_location")} → {data.get("to_location")}'
-            if provider == 'yookassa':
-                return_url = site_settings.get('site_url', 'https://transfer-abkhazia.ru') + '/profile'
-                payment_info = generate_yookassa_payment(oid, pay_amount, description, return_url, site_settings)
-            elif provider == 'robokassa':
-                payment_info = generate_robokassa_payment(oid, pay_amount, description, site_settings)
-
-        return resp(201, {'id': oid, 'message': 'Заявка создана', **payment_info})
+        return response
 
     elif method == 'PUT':
         data = json.loads(event.get('body', '{}'))
         order_id = data.get('id')
         new_status_id = data.get('status_id')
         driver_id = data.get('driver_id')
-        user_id_for_push = None
-        status_name_for_push = None
-        if order_id:
-            cur.execute(f"SELECT user_id FROM {SCHEMA}.orders WHERE id=%s", (int(order_id),))
-            row = cur.fetchone()
-            if row: user_id_for_push = row[0]
-        if new_status_id:
-            cur.execute(f"SELECT name FROM {SCHEMA}.order_statuses WHERE id=%s", (int(new_status_id),))
-            srow = cur.fetchone()
-            if srow: status_name_for_push = srow[0]
+        if isinstance(data.get('orders'), list):
+            return update_orders_bulk(conn, cur, data['orders'])
+        # UPDATE сразу возвращает получателя пуша, имя статуса берётся из кэша
         if driver_id and order_id:
             cur.execute(f'''
                 UPDATE {SCHEMA}.orders SET driver_id=%s, status_id=COALESCE(%s, status_id),
-                updated_at=CURRENT_TIMESTAMP WHERE id=%s
+                updated_at=CURRENT_TIMESTAMP WHERE id=%s RETURNING user_id
             ''', (int(driver_id), new_status_id, int(order_id)))
         else:
             cur.execute(f'''
                 UPDATE {SCHEMA}.orders SET status_id=%s, price=%s, notes=%s, updated_at=CURRENT_TIMESTAMP
-                WHERE id=%s
+                WHERE id=%s RETURNING user_id
             ''', (new_status_id, data.get('price'), data.get('notes'), order_id))
+        row = cur.fetchone()
+        user_id_for_push = row[0] if row else None
+        status_name_for_push = status_names.get(new_status_id, cur) if user_id_for_push and new_status_id else None
         conn.commit(); cur.close(); conn.close()
         if user_id_for_push and status_name_for_push:
             send_push_to_user(user_id_for_push, f'Статус заявки #{order_id} изменён', f'Новый статус: {status_name_for_push}', '/profile')
@@ -357,20 +1328,100 @@ def handle_orders(method, event):
     return resp(405, {'error': 'Method not allowed'})
 
 
-def handle_rideshares(method, event):
+# ===== RIDESHARE SEARCH =====
+RIDESHARES_PAGE_SIZE = 50
+RIDESHARES_PAGE_MAX = 200
+RIDESHARE_CACHE_SECONDS = 5
+RIDESHARE_CACHE_MAX = 256
+RIDESHARE_SEARCH_PARAMS = ('route_from', 'route_to', 'departure_from', 'departure_to', 'min_seats', 'car_class', 'limit', 'cursor')
+
+_rideshare_cache = {}
+
+def _like_prefix(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def search_rideshares(cur, params) -> dict:
+    """Публичный поиск поездок: префикс маршрута, окно отправления, свободные места, класс авто, keyset по (departure_datetime, id)"""
+    where = ["status='active'", 'departure_datetime > NOW()', '(expires_at IS NULL OR expires_at > NOW())']
+    values = []
+    if params.get('route_from'):
+        where.append('route_from ILIKE %s'); values.append(_like_prefix(params['route_from'].strip()))
+    if params.get('route_to'):
+        where.append('route_to ILIKE %s'); values.append(_like_prefix(params['route_to'].strip()))
+    if params.get('departure_from'):
+        where.append('departure_datetime >= %s'); values.append(params['departure_from'])
+    if params.get('departure_to'):
+        where.append('departure_datetime <= %s'); values.append(params['departure_to'])
+    if params.get('min_seats'):
+        where.append('seats_available >= %s'); values.append(int(params['min_seats']))
+    if params.get('car_class'):
+        where.append('car_class=%s'); values.append(params['car_class'])
+    if params.get('cursor'):
+        where.append('(departure_datetime, id) > (%s, %s)'); values.extend(decode_cursor(params['cursor']))
+    limit = max(1, min(int(params.get('limit') or RIDESHARES_PAGE_SIZE), RIDESHARES_PAGE_MAX))
+    cur.execute(f'''
+        SELECT id, route_from, route_to, departure_datetime, seats_total, seats_available,
+               price_per_seat, car_class, driver_name, notes, status, created_by_name, created_at
+        FROM {SCHEMA}.rideshares
+        WHERE {' AND '.join(where)}
+        ORDER BY departure_datetime ASC, id ASC
+        LIMIT %s
+    ''', values + [limit + 1])
+    cols = [d[0] for d in cur.description]
+    rows = [dict(zip(cols, r)) for r in cur.fetchmany(limit)]
+    has_more = cur.fetchone() is not None
+    next_cursor = encode_cursor(rows[-1]['departure_datetime'], rows[-1]['id']) if has_more else None
+    return {'rideshares': rows, 'next_cursor': next_cursor}
+
+def cached_rideshare_search(params) -> dict:
+    """Одинаковые запросы в пределах одного временного окна отдаются из памяти без обращения к БД"""
+    bucket = int(time.time() // RIDESHARE_CACHE_SECONDS)
+    key = (bucket,) + tuple((params.get(p) or '').strip() for p in RIDESHARE_SEARCH_PARAMS)
+    hit = _rideshare_cache.get(key)
+    if hit is not None:
+        return hit
     conn = get_conn()
     cur = conn.cursor()
+    try:
+        page = search_rideshares(cur, params)
+    finally:
+        cur.close(); conn.close()
+    for stale in [k for k in _rideshare_cache if k[0] != bucket]:
+        del _rideshare_cache[stale]
+    if len(_rideshare_cache) < RIDESHARE_CACHE_MAX:
+        _rideshare_cache[key] = page
+    return page
+
+
+def handle_rideshares(method, event):
     params = event.get('queryStringParameters', {}) or {}
+    if method == 'GET' and params.get('admin') != 'true' and not any(params.get(k) for k in ('cancel_token', 'action', 'id')):
+        # Публичный поиск: попадание в кэш обходится без подключения к БД
+        try:
+            return resp(200, cached_rideshare_search(params))
+        except (ValueError, UnicodeDecodeError):
+            return resp(400, {'error': 'Некорректные параметры поиска'})
+
+    conn = get_conn()
+    cur = conn.cursor()
 
     if method == 'GET':
         cancel_token = params.get('cancel_token')
         if cancel_token:
-            token = cancel_token.replace("'", "")
-            cur.execute(f"UPDATE {SCHEMA}.rideshare_bookings SET status='cancelled' WHERE cancel_token='{token}' AND status='confirmed' RETURNING rideshare_id, seats_count")
+            # Отмена и возврат мест одним запросом
+            cur.execute(f'''
+                WITH b AS (
+                    UPDATE {SCHEMA}.rideshare_bookings SET status='cancelled'
+                    WHERE cancel_token=%s AND status='confirmed'
+                    RETURNING rideshare_id, seats_count
+                ), r AS (
+                    UPDATE {SCHEMA}.rideshares rs SET seats_available=rs.seats_available+b.seats_count, updated_at=CURRENT_TIMESTAMP
+                    FROM b WHERE rs.id=b.rideshare_id
+                )
+                SELECT rideshare_id FROM b
+            ''', (cancel_token,))
             row = cur.fetchone()
-            if row:
-                cur.execute(f"UPDATE {SCHEMA}.rideshares SET seats_available=seats_available+{row[1]}, updated_at=CURRENT_TIMESTAMP WHERE id={row[0]}")
-            conn.commit(); cur.close(); conn.close()
+            conn.commit(); cur.close(); conn.close(); _rideshare_cache.clear()
             return resp(200, {'cancelled': bool(row), 'message': 'Запись отменена' if row else 'Токен не найден'})
 
         action = params.get('action')
@@ -421,22 +1472,19 @@ def handle_rideshares(method, event):
                 FROM {SCHEMA}.rideshares WHERE id={int(ride_id)}
             ''')
         elif is_admin:
+            cond, vals = since_clause(params, 'updated_at')
             cur.execute(f'''
                 SELECT id, route_from, route_to, departure_datetime, seats_total, seats_available,
                        price_per_seat, car_class, driver_name, driver_phone, driver_telegram, notes, status,
                        created_by_name, created_by_phone, created_by_user_id, expires_at, rideshare_driver_id, created_at
-                FROM {SCHEMA}.rideshares
+                FROM {SCHEMA}.rideshares{cond}
                 ORDER BY created_at DESC
-            ''')
-        else:
-            cur.execute(f'''
-                SELECT id, route_from, route_to, departure_datetime, seats_total, seats_available,
-                       price_per_seat, car_class, driver_name, notes, status, created_by_name, created_at
-                FROM {SCHEMA}.rideshares
-                WHERE status='active' AND departure_datetime > NOW()
-                AND (expires_at IS NULL OR expires_at > NOW())
-                ORDER BY departure_datetime ASC
-            ''')
+            ''', vals)
+            cols = [d[0] for d in cur.description]
+            rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+            meta = sync_meta(cur, params, 'rideshares')
+            cur.close(); conn.close()
+            return resp(200, {'rideshares': rows, **meta})
         cols = [d[0] for d in cur.description]
         rows = [dict(zip(cols, r)) for r in cur.fetchall()]
         cur.close(); conn.close()
@@ -449,22 +1497,40 @@ def handle_rideshares(method, event):
         if action == 'book':
             rid = int(data.get('rideshare_id', 0))
             seats = int(data.get('seats_count', 1))
-            cur.execute(f"SELECT seats_available FROM {SCHEMA}.rideshares WHERE id={rid} AND status='active'")
-            row = cur.fetchone()
-            if not row:
-                cur.close(); conn.close(); return resp(404, {'error': 'Поездка не найдена'})
-            if row[0] < seats:
-                cur.close(); conn.close(); return resp(400, {'error': 'Недостаточно мест'})
+            if seats < 1:
+                cur.close(); conn.close(); return resp(400, {'error': 'Некорректное количество мест'})
+            idem_key = idempotency_key(event)
+            if idem_key:
+                replay = claim_idempotency_key(cur, 'rideshare_book', idem_key, event.get('body'))
+                if replay:
+                    cur.close(); conn.close()
+                    return replay
             token = secrets.token_urlsafe(16)
             booking_user_id = int(data.get('user_id')) if data.get('user_id') else None
+            # Списание мест с проверкой остатка и запись брони — одним запросом: параллельные
+            # брони ждут блокировку строки поездки и перепроверяют seats_available
             cur.execute(f'''
+                WITH seat AS (
+                    UPDATE {SCHEMA}.rideshares SET seats_available=seats_available-%(seats)s, updated_at=CURRENT_TIMESTAMP
+                    WHERE id=%(rid)s AND status='active' AND seats_available >= %(seats)s
+                    RETURNING id
+                )
                 INSERT INTO {SCHEMA}.rideshare_bookings (rideshare_id, passenger_name, passenger_phone, passenger_email, seats_count, status, cancel_token, user_id)
-                VALUES (%s,%s,%s,%s,%s,'confirmed',%s,%s) RETURNING id
-            ''', (rid, data.get('passenger_name'), data.get('passenger_phone'), data.get('passenger_email',''), seats, token, booking_user_id))
-            bid = cur.fetchone()[0]
-            cur.execute(f"UPDATE {SCHEMA}.rideshares SET seats_available=seats_available-{seats}, updated_at=CURRENT_TIMESTAMP WHERE id={rid}")
-            conn.commit(); cur.close(); conn.close()
-            return resp(201, {'id': bid, 'cancel_token': token, 'message': 'Вы записаны!'})
+                SELECT id, %(name)s, %(phone)s, %(email)s, %(seats)s, 'confirmed', %(token)s, %(user_id)s FROM seat
+                RETURNING id
+            ''', {'rid': rid, 'seats': seats, 'name': data.get('passenger_name'), 'phone': data.get('passenger_phone'),
+                  'email': data.get('passenger_email', ''), 'token': token, 'user_id': booking_user_id})
+            row = cur.fetchone()
+            if not row:
+                cur.execute(f"SELECT 1 FROM {SCHEMA}.rideshares WHERE id=%s AND status='active'", (rid,))
+                found = cur.fetchone()
+                cur.close(); conn.close()
+                return resp(400, {'error': 'Недостаточно мест'}) if found else resp(404, {'error': 'Поездка не найдена'})
+            response = resp(201, {'id': row[0], 'cancel_token': token, 'message': 'Вы записаны!'})
+            if idem_key:
+                store_idempotent_response(cur, 'rideshare_book', idem_key, response)
+            conn.commit(); cur.close(); conn.close(); _rideshare_cache.clear()
+            return response
 
         else:
             seats_total = int(data.get('seats_total', 4))
@@ -485,7 +1551,7 @@ def handle_rideshares(method, event):
                 created_by_user_id, expires_at
             ))
             rid = cur.fetchone()[0]
-            conn.commit(); cur.close(); conn.close()
+            conn.commit(); cur.close(); conn.close(); _rideshare_cache.clear()
             return resp(201, {'id': rid, 'message': 'Поездка создана'})
 
     elif method == 'PUT':
@@ -523,7 +1589,7 @@ def handle_rideshares(method, event):
         set_clauses.append('updated_at=CURRENT_TIMESTAMP')
         values.append(rid)
         cur.execute(f"UPDATE {SCHEMA}.rideshares SET {', '.join(set_clauses)} WHERE id=%s", values)
-        conn.commit(); cur.close(); conn.close()
+        conn.commit(); cur.close(); conn.close(); _rideshare_cache.clear()
         return resp(200, {'message': 'Поездка обновлена'})
 
     elif method == 'DELETE':
@@ -533,7 +1599,7 @@ def handle_rideshares(method, event):
             cur.close(); conn.close()
             return resp(400, {'error': 'id обязателен'})
         cur.execute(f"DELETE FROM {SCHEMA}.rideshares WHERE id=%s", (rid,))
-        conn.commit(); cur.close(); conn.close()
+        conn.commit(); cur.close(); conn.close(); _rideshare_cache.clear()
         return resp(200, {'message': 'Поездка удалена'})
 
     return resp(405, {'error': 'Method not allowed'})
@@ -575,6 +1641,105 @@ def handle_payment_settings(method, event):
     return resp(405, {'error': 'Method not allowed'})
 
 
+# ===== IMAGES =====
+IMAGE_WIDTHS = (320, 768, 1600)
+IMAGE_FORMATS = (('webp', 'WEBP', 'image/webp'), ('jpg', 'JPEG', 'image/jpeg'))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '80'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '3'))
+
+_s3_client = None
+_image_pool = None
+
+def get_s3():
+    '''Один boto3-клиент на тёплый контейнер'''
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client('s3',
+            endpoint_url='https://bucket.poehali.dev',
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+    return _s3_client
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID', '')}/bucket/{key}"
+
+def decode_data_url(b64data: str):
+    '''base64 или data URL -> (байты, content type); тип берётся из заголовка data URL'''
+    content_type = 'image/jpeg'
+    if ',' in b64data:
+        header, b64data = b64data.split(',', 1)
+        if header.startswith('data:') and ';' in header:
+            content_type = header[5:].split(';', 1)[0] or content_type
+    return base64.b64decode(b64data), content_type
+
+def upload_image(b64data: str, folder: str) -> str:
+    '''Кладёт картинку из base64/data URL в бакет с её настоящим content type'''
+    data, content_type = decode_data_url(b64data)
+    ext = {'image/png': 'png', 'image/webp': 'webp'}.get(content_type, 'jpg')
+    key = f"{folder}/{secrets.token_hex(8)}.{ext}"
+    get_s3().put_object(Bucket='files', Key=key, Body=data, ContentType=content_type)
+    return cdn_url(key)
+
+def render_variant(raw: bytes, width: int):
+    '''Работает в процессе пула: уменьшает картинку до width по ширине без EXIF; (ширина, [(ext, content type, байты)])'''
+    from PIL import Image, ImageOps
+    img = Image.open(io.BytesIO(raw))
+    img.draft('RGB', (width, width))  # JPEG сразу декодируется в уменьшенном масштабе
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((width, width * 10), Image.LANCZOS)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'P') else 'RGB')
+    files = []
+    for ext, fmt, content_type in IMAGE_FORMATS:
+        frame = img.convert('RGB') if fmt == 'JPEG' else img
+        buf = io.BytesIO()
+        frame.save(buf, fmt, quality=IMAGE_QUALITY, optimize=True)  # exif не передаём — метаданные и GPS не попадают в файл
+        files.append((ext, content_type, buf.getvalue()))
+    return img.width, files
+
+def image_variants(url):
+    '''Варианты картинки из бакета проекта: {'webp': {'320': url, ...}, 'jpg': {...}}; None — отдаём оригинал'''
+    global _image_pool
+    prefix = cdn_url('')
+    if not isinstance(url, str) or not url.startswith(prefix):
+        return None
+    key = url[len(prefix):]
+    from concurrent.futures.process import ProcessPoolExecutor, BrokenProcessPool
+    try:
+        raw = get_s3().get_object(Bucket='files', Key=key)['Body'].read()
+        if _image_pool is None:
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        rendered = list(_image_pool.map(render_variant, [raw] * len(IMAGE_WIDTHS), IMAGE_WIDTHS))
+    except BrokenProcessPool:
+        _image_pool = None
+        return None
+    except Exception:
+        return None  # не картинка, битый файл или нет Pillow
+    base = key.rsplit('.', 1)[0]
+    variants = {}
+    for width, files in rendered:
+        for ext, content_type, body in files:
+            if str(width) in variants.get(ext, {}):
+                continue  # исходник уже меньше этой ширины
+            vkey = f'{base}_{width}.{ext}'
+            get_s3().put_object(Bucket='files', Key=vkey, Body=body, ContentType=content_type,
+                                CacheControl='public, max-age=31536000, immutable')
+            variants.setdefault(ext, {})[str(width)] = cdn_url(vkey)
+    return variants
+
+def image_variants_json(cur, table: str, row_id, url):
+    '''Значение колонки image_variants: варианты пересчитываются, только если у строки сменилась картинка'''
+    if row_id:
+        cur.execute(f"SELECT image_url, image_variants FROM {SCHEMA}.{table} WHERE id=%s", (int(row_id),))
+        row = cur.fetchone()
+        if row and row[0] == url and row[1]:
+            return json.dumps(row[1])
+    variants = image_variants(url)
+    return json.dumps(variants) if variants else None
+
+
 def handle_news(method, event):
     conn = get_conn()
     cur = conn.cursor()
@@ -589,69 +1754,53 @@ def handle_news(method, event):
     if method == 'GET':
         published_only = params.get('published', 'false') == 'true'
         if published_only:
-            cur.execute(f"SELECT id,title,summary,content,image_url,published_at,created_at FROM {SCHEMA}.news WHERE is_published=true ORDER BY published_at DESC LIMIT 20")
+            cur.execute(f"SELECT id,title,summary,content,image_url,image_variants,published_at,created_at FROM {SCHEMA}.news WHERE is_published=true ORDER BY published_at DESC LIMIT 20")
         else:
-            cur.execute(f"SELECT id,title,summary,content,image_url,is_published,published_at,created_at FROM {SCHEMA}.news ORDER BY created_at DESC")
+            cond, vals = since_clause(params, 'updated_at')
+            cur.execute(f"SELECT id,title,summary,content,image_url,image_variants,is_published,published_at,created_at FROM {SCHEMA}.news{cond} ORDER BY created_at DESC", vals)
         cols = [d[0] for d in cur.description]
         rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+        meta = {} if published_only else sync_meta(cur, params, 'news')
         cur.close(); conn.close()
-        return resp(200, {'news': rows})
+        return resp(200, {'news': rows, **meta})
 
     elif method == 'POST':
-        import base64, boto3, os as _os
         title = data.get('title', '').strip()
         if not title:
             cur.close(); conn.close()
             return resp(400, {'error': 'Заголовок обязателен'})
-        image_url = ''
+        image_url = data.get('image_url', '')
         if data.get('image_b64'):
-            b64 = data['image_b64']
-            if ',' in b64:
-                b64 = b64.split(',', 1)[1]
-            img_data = base64.b64decode(b64)
-            s3 = boto3.client('s3', endpoint_url='https://bucket.poehali.dev',
-                aws_access_key_id=_os.environ['AWS_ACCESS_KEY_ID'],
-                aws_secret_access_key=_os.environ['AWS_SECRET_ACCESS_KEY'])
-            key = f"news/{secrets.token_hex(8)}.jpg"
-            s3.put_object(Bucket='files', Key=key, Body=img_data, ContentType='image/jpeg')
-            image_url = f"https://cdn.poehali.dev/projects/{_os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+            image_url = upload_image(data['image_b64'], 'news')
+        variants = image_variants_json(cur, 'news', None, image_url)
         pub_at = 'NOW()' if data.get('is_published') else None
         if pub_at:
             cur.execute(f'''
-                INSERT INTO {SCHEMA}.news (title, content, image_url, is_published, published_at)
-                VALUES (%s, %s, %s, %s, NOW()) RETURNING id
-            ''', (title, data.get('content',''), image_url, True))
+                INSERT INTO {SCHEMA}.news (title, content, image_url, image_variants, is_published, published_at)
+                VALUES (%s, %s, %s, %s, %s, NOW()) RETURNING id
+            ''', (title, data.get('content',''), image_url, variants, True))
         else:
             cur.execute(f'''
-                INSERT INTO {SCHEMA}.news (title, content, image_url, is_published)
-                VALUES (%s, %s, %s, %s) RETURNING id
-            ''', (title, data.get('content',''), image_url, False))
+                INSERT INTO {SCHEMA}.news (title, content, image_url, image_variants, is_published)
+                VALUES (%s, %s, %s, %s, %s) RETURNING id
+            ''', (title, data.get('content',''), image_url, variants, False))
         nid = cur.fetchone()[0]
         conn.commit(); cur.close(); conn.close()
         return resp(201, {'id': nid, 'message': 'Новость создана'})
 
     elif method == 'PUT':
-        import base64, boto3, os as _os
         nid = data.get('id')
         image_url = data.get('image_url', '')
         if data.get('image_b64'):
-            b64 = data['image_b64']
-            if ',' in b64:
-                b64 = b64.split(',', 1)[1]
-            img_data = base64.b64decode(b64)
-            s3 = boto3.client('s3', endpoint_url='https://bucket.poehali.dev',
-                aws_access_key_id=_os.environ['AWS_ACCESS_KEY_ID'],
-                aws_secret_access_key=_os.environ['AWS_SECRET_ACCESS_KEY'])
-            key = f"news/{secrets.token_hex(8)}.jpg"
-            s3.put_object(Bucket='files', Key=key, Body=img_data, ContentType='image/jpeg')
-            image_url = f"https://cdn.poehali.dev/projects/{_os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+            image_url = upload_image(data['image_b64'], 'news')
         is_pub = data.get('is_published', False)
+        variants = image_variants_json(cur, 'news', nid, image_url)
         cur.execute(f'''
-            UPDATE {SCHEMA}.news SET title=%s, content=%s, image_url=%s,
+            UPDATE {SCHEMA}.news SET title=%s, content=%s, image_url=%s, image_variants=%s,
             is_published=%s, published_at=CASE WHEN %s THEN NOW() ELSE published_at END
             WHERE id=%s
         ''', (data.get('title'), data.get('content',''),
-              image_url, is_pub, is_pub, int(nid)))
+              image_url, variants, is_pub, is_pub, int(nid)))
         conn.commit(); cur.close(); conn.close()
         return resp(200, {'message': 'Новость обновлена'})
 
@@ -667,8 +1816,152 @@ def handle_news(method, event):
     return resp(405, {'error': 'Method not allowed'})
 
 
+# ===== STATS =====
+def handle_stats(method, event):
+    '''Сводка для дашборда из агрегатов order_stats_daily / balance_stats_daily: ?date_from=&date_to='''
+    if method != 'GET':
+        return resp(405, {'error': 'Method not allowed'})
+    params = event.get('queryStringParameters', {}) or {}
+    conn = get_conn(); cur = conn.cursor()
+    cond, vals = date_range_clause(params, 'day')
+    # Один проход по агрегатам: итоги и разрезы по статусу, классу, тарифу и дням
+    cur.execute(f'''
+        SELECT GROUPING(status_id, car_class, tariff_id, day) as g, status_id, car_class, tariff_id, day,
+               COALESCE(SUM(orders_count), 0), COALESCE(SUM(revenue), 0), COALESCE(SUM(commission), 0), COALESCE(SUM(driver_amount), 0)
+        FROM {SCHEMA}.order_stats_daily{cond}
+        GROUP BY GROUPING SETS ((), (status_id), (car_class), (tariff_id), (day))
+        ORDER BY day, status_id, car_class, tariff_id
+    ''', vals)
+    groups = {15: 'totals', 7: 'by_status', 11: 'by_car_class', 13: 'by_tariff', 14: 'by_day'}
+    keys = {'by_status': 'status_id', 'by_car_class': 'car_class', 'by_tariff': 'tariff_id', 'by_day': 'day'}
+    stats = {'totals': {'orders_count': 0, 'revenue': 0.0, 'commission': 0.0, 'driver_amount': 0.0},
+             'by_status': [], 'by_car_class': [], 'by_tariff': [], 'by_day': []}
+    for g, status_id, car_class, tariff_id, day, count, revenue, commission, driver_amount in cur.fetchall():
+        section = groups[g]
+        item = {'orders_count': int(count), 'revenue': float(revenue), 'commission': float(commission),
+                'driver_amount': float(driver_amount)}
+        if section == 'totals':
+            stats['totals'] = item
+            continue
+        value = {'status_id': status_id, 'car_class': car_class, 'tariff_id': tariff_id, 'day': day}[keys[section]]
+        item = {keys[section]: value or None, **item}
+        if section == 'by_status' and value:
+            item['status_name'] = status_names.get(value, cur)
+        stats[section].append(item)
+    cur.execute(f'''
+        SELECT type, status, account, SUM(tx_count), SUM(amount)
+        FROM {SCHEMA}.balance_stats_daily{cond}
+        GROUP BY type, status, account ORDER BY type, status, account
+    ''', vals)
+    stats['balance'] = [{'type': r[0], 'status': r[1], 'account': r[2], 'tx_count': int(r[3]), 'amount': float(r[4])}
+                        for r in cur.fetchall()]
+    cur.close(); conn.close()
+    return resp(200, stats)
+
+
+# ===== EXPORT =====
+# Та же выгрузка есть в auth/index.py: функции деплоятся по отдельности, правки вносить в обе
+EXPORT_BATCH = int(os.environ.get('EXPORT_BATCH', '2000'))
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+
+def date_range_clause(params, column: str):
+    '''Фильтр выгрузки по ?date_from=&date_to= (включительно)'''
+    where, values = [], []
+    if params.get('date_from'):
+        where.append(f'{column} >= %s'); values.append(params['date_from'])
+    if params.get('date_to'):
+        where.append(f'{column} < %s::date + 1'); values.append(params['date_to'])
+    return (' WHERE ' + ' AND '.join(where)) if where else '', values
+
+def export_response(conn, name: str, sql: str, values: list, params: dict) -> dict:
+    """Выгрузка через именованный серверный курсор: строки читаются пачками по EXPORT_BATCH
+    и сразу пишутся в CSV или NDJSON (?format=ndjson), при ?gzip=1 — в сжатый поток.
+    Буфер больше EXPORT_MAX_BYTES — 413: без gzip предлагаем сжатие, со сжатием — диапазон короче"""
+    fmt = 'ndjson' if params.get('format') == 'ndjson' else 'csv'
+    gz = params.get('gzip') in ('1', 'true')
+    raw = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=raw, mode='wb') if gz else raw
+    out = io.TextIOWrapper(sink, encoding='utf-8', newline='')
+    writer = csv.writer(out) if fmt == 'csv' else None
+    if writer:
+        out.write('\ufeff')
+    cur = conn.cursor(name=f'export_{name}_{secrets.token_hex(4)}')
+    too_large = False
+    try:
+        cur.execute(sql, values)
+        cols = None
+        while True:
+            batch = cur.fetchmany(EXPORT_BATCH)
+            if cols is None:
+                cols = [d[0] for d in cur.description]
+                if writer:
+                    writer.writerow(cols)
+            if not batch:
+                break
+            for row in batch:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(dict(zip(cols, row)), default=str, ensure_ascii=False) + '\n')
+            out.flush()
+            if raw.tell() > EXPORT_MAX_BYTES:
+                too_large = True
+                break
+    finally:
+        cur.close(); conn.rollback(); conn.close()
+    if too_large:
+        raw.close()
+        return resp(413, {'error': 'Выгрузка слишком большая: сократите период' if gz else 'Выгрузка слишком большая: добавьте gzip=1 или сократите период'})
+    out.flush(); out.detach()
+    if gz:
+        sink.close()
+    filename = f'{name}.{fmt}' + ('.gz' if gz else '')
+    content_type = 'application/gzip' if gz else ('text/csv; charset=utf-8' if writer else 'application/x-ndjson')
+    # Тело собирается прямо из буфера BytesIO без промежуточной копии getvalue(); буфер освобождается сразу.
+    # base64 (+33%) — только для gzip, текстовая выгрузка уходит как есть
+    with raw.getbuffer() as view:
+        body = base64.b64encode(view) if gz else str(view, 'utf-8')
+    raw.close()
+    return {'statusCode': 200,
+            'headers': {'Content-Type': content_type, 'Content-Disposition': f'attachment; filename="{filename}"', **CORS},
+            'body': body.decode('ascii') if gz else body,
+            'isBase64Encoded': gz}
+
+def handle_export(method, event):
+    '''Выгрузка для бухгалтерии: ?table=orders|bookings, date_from, date_to, format=csv|ndjson, gzip=1'''
+    if method != 'GET':
+        return resp(405, {'error': 'Method not allowed'})
+    params = event.get('queryStringParameters', {}) or {}
+    table = params.get('table', 'orders')
+    if table == 'orders':
+        cond, vals = date_range_clause(params, 'o.created_at')
+        sql = f'''
+            SELECT o.id, o.created_at, o.pickup_datetime, o.from_location, o.to_location,
+                   o.passenger_name, o.passenger_phone, o.passenger_email, o.passengers_count,
+                   o.transfer_type, o.car_class, o.price, o.payment_type, o.prepay_amount, o.payment_from_balance,
+                   o.commission_amount, o.driver_amount, s.name as status_name, d.name as driver_name, o.user_id
+            FROM {SCHEMA}.orders o
+            LEFT JOIN {SCHEMA}.order_statuses s ON o.status_id = s.id
+            LEFT JOIN {SCHEMA}.drivers d ON o.driver_id = d.id{cond}
+            ORDER BY o.created_at, o.id
+        '''
+    elif table == 'bookings':
+        cond, vals = date_range_clause(params, 'rb.created_at')
+        sql = f'''
+            SELECT rb.id, rb.created_at, rb.rideshare_id, rs.route_from, rs.route_to, rs.departure_datetime,
+                   rb.passenger_name, rb.passenger_phone, rb.passenger_email, rb.seats_count,
+                   rs.price_per_seat, rb.seats_count * rs.price_per_seat as total, rb.status, rb.user_id
+            FROM {SCHEMA}.rideshare_bookings rb
+            LEFT JOIN {SCHEMA}.rideshares rs ON rb.rideshare_id = rs.id{cond}
+            ORDER BY rb.created_at, rb.id
+        '''
+    else:
+        return resp(400, {'error': 'Неизвестная таблица выгрузки'})
+    return export_response(get_conn(), table, sql, vals, params)
+
+
 def handler(event: dict, context) -> dict:
-    '''Мультироутер API: orders, rideshares, payment_settings, news — по параметру ?resource='''
+    '''Мультироутер API: orders, rideshares, payment_settings, news, outbox, feed, export, stats, payments — по параметру ?resource='''
     method = event.get('httpMethod', 'GET')
 
     if method == 'OPTIONS':
@@ -684,8 +1977,22 @@ def handler(event: dict, context) -> dict:
             return handle_payment_settings(method, event)
         elif resource == 'news':
             return handle_news(method, event)
+        elif resource == 'outbox':
+            return handle_outbox(method, event)
+        elif resource == 'feed':
+            return handle_feed(method, event)
+        elif resource == 'export':
+            return handle_export(method, event)
+        elif resource == 'stats':
+            return handle_stats(method, event)
+        elif resource == 'payments':
+            return handle_payments(method, event)
         else:
             return handle_orders(method, event)
 
+    except PoolExhausted as e:
+        return resp(503, {'error': str(e)})
     except Exception as e:
-        return resp(500, {'error': str(e)})
\ No newline at end of file
+        return resp(500, {'error': str(e)})
+    finally:
+        release_conns()
@@ -0,0 +1,165 @@
+'''Гонка за места попутки: бронь и отмена через handler orders/index.py на реальной БД.
+
+    DATABASE_URL=... python3 backend/rideshare_race_test.py [--clients 100] [--seats 10] [--max-seats 2] [--json]
+
+Каждый клиент — отдельный процесс с собственным пулом, как параллельные контейнеры функции: handler и release_conns
+рассчитаны на один запрос за раз в процессе. Фаза book: все клиенты одновременно (через Barrier) бронируют одну поездку.
+Фаза churn: половина клиентов отменяет свои брони по cancel_token, остальные бронируют снова. Фоновый поток всё время
+опрашивает seats_available. Проверяется, что места не уходят в минус и не превышают seats_total, а после каждой фазы
+seats_available = seats_total - сумма мест подтверждённых броней. Временные строки удаляются в конце.
+Код выхода 1 при нарушении инварианта.'''
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+
+import psycopg2
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+SCHEMA = 't_p8223105_sochi_transfer_websi'
+
+def client(barrier, results, client_id: int, request: dict):
+    '''Процесс-клиент: загружает функцию orders, ждёт остальных и отправляет один запрос'''
+    spec = importlib.util.spec_from_file_location('orders_index', os.path.join(BACKEND, 'orders', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if request['action'] == 'book':
+        event = {'httpMethod': 'POST', 'queryStringParameters': {'resource': 'rideshares'}, 'headers': {},
+                 'body': json.dumps({'action': 'book', 'rideshare_id': request['rideshare_id'], 'seats_count': request['seats'],
+                                     'passenger_name': f'race {client_id}', 'passenger_phone': f'+7000{client_id:07d}'})}
+    else:
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'resource': 'rideshares', 'cancel_token': request['cancel_token']},
+                 'headers': {}}
+    barrier.wait()
+    try:
+        r = module.handler(event, None)
+        results.put({'client': client_id, **request, 'status': r['statusCode'], 'body': json.loads(r['body'] or '{}')})
+    except Exception as e:
+        results.put({'client': client_id, **request, 'status': None, 'error': repr(e)})
+
+def run_phase(requests: list) -> list:
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(len(requests))
+    results = ctx.Queue()
+    procs = [ctx.Process(target=client, args=(barrier, results, i, req)) for i, req in enumerate(requests)]
+    for p in procs:
+        p.start()
+    out = [results.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+class SeatMonitor:
+    '''Опрашивает seats_available в фоне и запоминает минимум и максимум за фазу'''
+
+    def __init__(self, rideshare_id: int):
+        self.rideshare_id = rideshare_id
+        self.low = self.high = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+
+    def _poll(self):
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn.autocommit = True
+        cur = conn.cursor()
+        while not self.stop.is_set():
+            cur.execute(f"SELECT seats_available FROM {SCHEMA}.rideshares WHERE id=%s", (self.rideshare_id,))
+            seats = cur.fetchone()[0]
+            self.low = seats if self.low is None else min(self.low, seats)
+            self.high = seats if self.high is None else max(self.high, seats)
+            time.sleep(0.002)
+        cur.close(); conn.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+def check(conn, rideshare_id: int, seats_total: int, monitor: SeatMonitor, results: list) -> list:
+    problems = [f"client {r['client']}: {r.get('error') or r['body']}" for r in results
+                if r['status'] not in (200, 201, 400)]
+    cur = conn.cursor()
+    cur.execute(f'''
+        SELECT rs.seats_available,
+               (SELECT COALESCE(SUM(seats_count), 0) FROM {SCHEMA}.rideshare_bookings WHERE rideshare_id=rs.id AND status='confirmed')
+        FROM {SCHEMA}.rideshares rs WHERE rs.id=%s
+    ''', (rideshare_id,))
+    available, booked = cur.fetchone()
+    conn.commit(); cur.close()
+    if monitor.low is not None and monitor.low < 0:
+        problems.append(f'seats_available went negative: {monitor.low}')
+    if monitor.high is not None and monitor.high > seats_total:
+        problems.append(f'seats_available exceeded seats_total: {monitor.high}')
+    if available < 0 or available != seats_total - booked:
+        problems.append(f'seats_available={available}, seats_total={seats_total}, confirmed seats={booked}')
+    return problems
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Concurrent rideshare booking race test')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--seats', type=int, default=10, help='seats_total поездки')
+    parser.add_argument('--max-seats', type=int, default=2, help='мест в одной брони: случайно от 1 до N')
+    parser.add_argument('--json', action='store_true', help='машиночитаемый отчёт')
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_URL'):
+        print('DATABASE_URL не задан', file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    tag = 'race-' + secrets.token_hex(3)
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.rideshares (route_from, route_to, departure_datetime, seats_total, seats_available, price_per_seat, status)
+        VALUES (%s, %s, NOW() + INTERVAL '1 day', %s, %s, 500, 'active') RETURNING id
+    ''', (tag, tag, args.seats, args.seats))
+    rideshare_id = cur.fetchone()[0]
+    conn.commit(); cur.close()
+
+    reports = []
+    try:
+        book = [{'action': 'book', 'rideshare_id': rideshare_id, 'seats': random.randint(1, args.max_seats)}
+                for _ in range(args.clients)]
+        with SeatMonitor(rideshare_id) as monitor:
+            results = run_phase(book)
+        reports.append({'phase': 'book', 'booked': sum(r['status'] == 201 for r in results),
+                        'problems': check(conn, rideshare_id, args.seats, monitor, results)})
+
+        tokens = [r['body']['cancel_token'] for r in results if r['status'] == 201]
+        churn = [{'action': 'cancel', 'cancel_token': t} for t in tokens[:max(1, len(tokens) // 2)]]
+        churn += [{'action': 'book', 'rideshare_id': rideshare_id, 'seats': random.randint(1, args.max_seats)}
+                  for _ in range(max(1, args.clients - len(churn)))]
+        random.shuffle(churn)
+        with SeatMonitor(rideshare_id) as monitor:
+            results = run_phase(churn)
+        reports.append({'phase': 'churn', 'booked': sum(r['status'] == 201 for r in results),
+                        'cancelled': sum(bool(r['body'].get('cancelled')) for r in results if r['status'] == 200),
+                        'problems': check(conn, rideshare_id, args.seats, monitor, results)})
+    finally:
+        cur = conn.cursor()
+        cur.execute(f"DELETE FROM {SCHEMA}.rideshare_bookings WHERE rideshare_id=%s", (rideshare_id,))
+        cur.execute(f"DELETE FROM {SCHEMA}.rideshares WHERE id=%s", (rideshare_id,))
+        conn.commit(); cur.close(); conn.close()
+
+    failed = any(r['problems'] for r in reports)
+    if args.json:
+        print(json.dumps({'clients': args.clients, 'seats': args.seats, 'phases': reports}, indent=2))
+    else:
+        for r in reports:
+            extra = f", {r['cancelled']} cancelled" if 'cancelled' in r else ''
+            status = 'ok' if not r['problems'] else 'FAIL'
+            print(f"{r['phase']:<6} {args.clients} clients, {args.seats} seats: {r['booked']} booked{extra}  {status}")
+            for p in r['problems']:
+                print(f'  {p}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,93 @@
 import json
 import os
 import psycopg2
+import psycopg2.pool
+import time
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_IDLE = float(os.environ.get('DB_POOL_PING_IDLE', '30'))
+DB_POOL_WAIT = float(os.environ.get('DB_POOL_WAIT', '3'))
+
+_pool = None
+_last_used = {}
+_checked_out = set()
+
+class PooledConn:
+    '''Соединение из пула: close() возвращает его в пул вместо разрыва'''
+
+    def __init__(self, conn):
+        self._conn = conn
+        _checked_out.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        _checked_out.discard(self)
+        if conn is not None:
+            _last_used[id(conn)] = time.monotonic()
+            _get_pool().putconn(conn, close=bool(conn.closed))
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def _is_alive(conn):
+    if conn.closed:
+        return False
+    last = _last_used.get(id(conn))
+    if last is None or time.monotonic() - last < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor(); cur.execute('SELECT 1'); cur.close(); conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+class PoolExhausted(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_WAIT — обработчик отвечает 503, а не 500'''
+
+def _checkout(pool):
+    '''getconn() пула сразу падает с PoolError при DB_POOL_MAX занятых — ждём освобождения с коротким бэкоффом'''
+    deadline = time.monotonic() + DB_POOL_WAIT
+    delay = 0.01
+    while True:
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError:
+            if pool.closed or time.monotonic() >= deadline:
+                raise PoolExhausted('Все соединения с БД заняты')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+def get_conn():
+    '''Берёт соединение из пула тёплого контейнера; мёртвые соединения переоткрываются.
+    Одно соединение на запрос: хелперы получают cur обработчика, а не открывают своё'''
+    pool = _get_pool()
+    for _ in range(DB_POOL_MAX):
+        conn = _checkout(pool)
+        if _is_alive(conn):
+            return PooledConn(conn)
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return PooledConn(_checkout(pool))
+
+def release_conns():
+    '''Возвращает в пул соединения, которые обработчик не закрыл (ранний return, исключение)'''
+    for pc in list(_checked_out):
+        pc.close()
+
+
+def statuses_etag(cur):
+    '''ETag справочника статусов: версия из cache_versions, её поднимает триггер на order_statuses'''
+    cur.execute("SELECT version FROM cache_versions WHERE name='order_statuses'")
+    row = cur.fetchone()
+    return f'"order_statuses-{row[0]}"' if row else None
+
 
 def handler(event: dict, context) -> dict:
     '''API для управления статусами заявок'''
@@ -19,11 +106,23 @@ def handler(event: dict, context) -> dict:
         }
     
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
+        conn = get_conn()
         cur = conn.cursor()
         
         if method == 'GET':
+            etag = statuses_etag(cur)
+            cache = {'ETag': etag, 'Cache-Control': 'no-cache'} if etag else {}
+            request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+            if etag and etag in [t.strip() for t in (request_headers.get('if-none-match') or '').split(',')]:
+                cur.close()
+                conn.close()
+                return {
+                    'statusCode': 304,
+                    'headers': {'Access-Control-Allow-Origin': '*', **cache},
+                    'body': '',
+                    'isBase64Encoded': False
+                }
+            
             cur.execute('SELECT * FROM order_statuses ORDER BY id')
             
             columns = [desc[0] for desc in cur.description]
@@ -39,7 +138,7 @@ def handler(event: dict, context) -> dict:
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **cache},
                 'body': json.dumps({'statuses': statuses}),
                 'isBase64Encoded': False
             }
@@ -108,6 +207,13 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
+    except PoolExhausted as e:
+        return {
+            'statusCode': 503,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         return {
             'statusCode': 500,
@@ -115,3 +221,5 @@ def handler(event: dict, context) -> dict:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    finally:
+        release_conns()
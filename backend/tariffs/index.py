@@ -1,8 +1,15 @@
 import json
 import os
 import psycopg2
+import psycopg2.pool
+import time
+import math
+import io
 import base64
-import boto3
+import hashlib
+import hmac
+import secrets
+import urllib.parse
 
 CORS = {
     'Access-Control-Allow-Origin': '*',
@@ -11,25 +18,583 @@ CORS = {
 }
 SCHEMA = 't_p8223105_sochi_transfer_websi'
 
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_IDLE = float(os.environ.get('DB_POOL_PING_IDLE', '30'))
+DB_POOL_WAIT = float(os.environ.get('DB_POOL_WAIT', '3'))
+
+_pool = None
+_last_used = {}
+_checked_out = set()
+
+class PooledConn:
+    '''Соединение из пула: close() возвращает его в пул вместо разрыва'''
+
+    def __init__(self, conn):
+        self._conn = conn
+        _checked_out.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        _checked_out.discard(self)
+        if conn is not None:
+            _last_used[id(conn)] = time.monotonic()
+            _get_pool().putconn(conn, close=bool(conn.closed))
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def _is_alive(conn):
+    if conn.closed:
+        return False
+    last = _last_used.get(id(conn))
+    if last is None or time.monotonic() - last < DB_POOL_PING_IDLE:
+        return True
+    try:
+        cur = conn.cursor(); cur.execute('SELECT 1'); cur.close(); conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+class PoolExhausted(Exception):
+    '''Все соединения пула заняты дольше DB_POOL_WAIT — обработчик отвечает 503, а не 500'''
+
+def _checkout(pool):
+    '''getconn() пула сразу падает с PoolError при DB_POOL_MAX занятых — ждём освобождения с коротким бэкоффом'''
+    deadline = time.monotonic() + DB_POOL_WAIT
+    delay = 0.01
+    while True:
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError:
+            if pool.closed or time.monotonic() >= deadline:
+                raise PoolExhausted('Все соединения с БД заняты')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
 def get_conn():
-    return psycopg2.connect(os.environ.get('DATABASE_URL'))
+    '''Берёт соединение из пула тёплого контейнера; мёртвые соединения переоткрываются.
+    Одно соединение на запрос: хелперы получают cur обработчика, а не открывают своё'''
+    pool = _get_pool()
+    for _ in range(DB_POOL_MAX):
+        conn = _checkout(pool)
+        if _is_alive(conn):
+            return PooledConn(conn)
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return PooledConn(_checkout(pool))
+
+def release_conns():
+    '''Возвращает в пул соединения, которые обработчик не закрыл (ранний return, исключение)'''
+    for pc in list(_checked_out):
+        pc.close()
 
 def resp(status, body):
     return {'statusCode': status, 'headers': {'Content-Type': 'application/json', **CORS},
             'body': json.dumps(body, default=str), 'isBase64Encoded': False}
 
-def upload_s3(b64data, filename, folder='files'):
-    s3 = boto3.client('s3',
-        endpoint_url='https://bucket.poehali.dev',
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    )
+SETTINGS_CHECK_INTERVAL = float(os.environ.get('SETTINGS_CHECK_INTERVAL', '5'))
+
+class SettingsCache:
+    '''Кэш site_settings на тёплый контейнер: перечитывается, только когда меняется версия в cache_versions'''
+
+    def __init__(self):
+        self.values = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    def snapshot(self, cur=None) -> dict:
+        now = time.monotonic()
+        if self.version is not None and now - self.checked_at < SETTINGS_CHECK_INTERVAL:
+            return self.values
+        own = cur is None
+        if own:
+            conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT version FROM {SCHEMA}.cache_versions WHERE name='site_settings'")
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            if version != self.version:
+                cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings ORDER BY id")
+                self.values = {r[0]: r[1] for r in cur.fetchall()}
+                self.version = version
+            self.checked_at = now
+        finally:
+            if own:
+                cur.close(); conn.close()
+        return self.values
+
+    def invalidate(self):
+        self.version = None
+
+    def get(self, key: str, default: str = '', cur=None) -> str:
+        value = self.snapshot(cur).get(key)
+        return default if value is None or value == '' else value
+
+    def get_int(self, key: str, default: int = 0, cur=None) -> int:
+        try:
+            return int(self.get(key, str(default), cur))
+        except ValueError:
+            return default
+
+    def get_bool(self, key: str, default: bool = False, cur=None) -> bool:
+        return self.get(key, 'true' if default else 'false', cur) == 'true'
+
+    def subset(self, keys, cur=None) -> dict:
+        values = self.snapshot(cur)
+        return {k: values[k] for k in keys if k in values}
+
+settings_cache = SettingsCache()
+
+REFERENCE_MAX_AGE = int(os.environ.get('REFERENCE_MAX_AGE', '60'))
+
+def reference_etag(cur, table: str, params: dict):
+    '''Сильный ETag справочника: версия таблицы в cache_versions (её поднимает триггер) + параметры запроса'''
+    cur.execute(f"SELECT version FROM {SCHEMA}.cache_versions WHERE name=%s", (table,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    query = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+    return f'"{table}-{row[0]}-{query}"'
+
+def is_not_modified(event: dict, etag) -> bool:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    tags = [t.strip() for t in (headers.get('if-none-match') or '').split(',')]
+    return bool(etag) and (etag in tags or '*' in tags)
+
+def cache_headers(etag, public: bool) -> dict:
+    '''Публичные выборки кэширует CDN; админские экраны каждый раз ревалидируются и получают 304'''
+    if not etag:
+        return {}
+    control = f'public, max-age={REFERENCE_MAX_AGE}, stale-while-revalidate={REFERENCE_MAX_AGE * 5}' if public else 'no-cache'
+    return {'ETag': etag, 'Cache-Control': control}
+
+def not_modified(etag, public: bool):
+    return {'statusCode': 304, 'headers': {**CORS, **cache_headers(etag, public)}, 'body': '', 'isBase64Encoded': False}
+
+def cached_resp(body, etag, public: bool):
+    r = resp(200, body)
+    r['headers'].update(cache_headers(etag, public))
+    return r
+
+SYNC_OVERLAP_SECONDS = 5
+
+def since_clause(params, column, joiner='WHERE'):
+    '''Условие для ?since=: только строки, изменённые после токена синхронизации'''
+    since = params.get('since')
+    if not since:
+        return '', []
+    return f' {joiner} {column} > %s', [since]
+
+def sync_meta(cur, params, table=None):
+    '''sync_token для следующего ?since= (с запасом на долгие транзакции) и id удалённых строк'''
+    meta = {}
+    since = params.get('since')
+    if since and table:
+        cur.execute(f"SELECT row_id FROM {SCHEMA}.deleted_rows WHERE table_name=%s AND deleted_at > %s", (table, since))
+        meta['deleted'] = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT LOCALTIMESTAMP - make_interval(secs => %s)", (SYNC_OVERLAP_SECONDS,))
+    meta['sync_token'] = cur.fetchone()[0].isoformat()
+    return meta
+
+# ===== IMAGES =====
+IMAGE_WIDTHS = (320, 768, 1600)
+IMAGE_FORMATS = (('webp', 'WEBP', 'image/webp'), ('jpg', 'JPEG', 'image/jpeg'))
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', '80'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '3'))
+
+_s3_client = None
+_image_pool = None
+
+def get_s3():
+    '''Один boto3-клиент на тёплый контейнер'''
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client('s3',
+            endpoint_url='https://bucket.poehali.dev',
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+    return _s3_client
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID', '')}/bucket/{key}"
+
+def decode_data_url(b64data: str):
+    '''base64 или data URL -> (байты, content type); тип берётся из заголовка data URL'''
+    content_type = 'image/jpeg'
     if ',' in b64data:
-        b64data = b64data.split(',', 1)[1]
-    data = base64.b64decode(b64data)
-    key = f'{folder}/{filename}'
-    s3.put_object(Bucket='files', Key=key, Body=data, ContentType='image/jpeg')
-    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+        header, b64data = b64data.split(',', 1)
+        if header.startswith('data:') and ';' in header:
+            content_type = header[5:].split(';', 1)[0] or content_type
+    return base64.b64decode(b64data), content_type
+
+def render_variant(raw: bytes, width: int):
+    '''Работает в процессе пула: уменьшает картинку до width по ширине без EXIF; (ширина, [(ext, content type, байты)])'''
+    from PIL import Image, ImageOps
+    img = Image.open(io.BytesIO(raw))
+    img.draft('RGB', (width, width))  # JPEG сразу декодируется в уменьшенном масштабе
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((width, width * 10), Image.LANCZOS)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.mode in ('LA', 'P') else 'RGB')
+    files = []
+    for ext, fmt, content_type in IMAGE_FORMATS:
+        frame = img.convert('RGB') if fmt == 'JPEG' else img
+        buf = io.BytesIO()
+        frame.save(buf, fmt, quality=IMAGE_QUALITY, optimize=True)  # exif не передаём — метаданные и GPS не попадают в файл
+        files.append((ext, content_type, buf.getvalue()))
+    return img.width, files
+
+def image_variants(url):
+    '''Варианты картинки из бакета проекта: {'webp': {'320': url, ...}, 'jpg': {...}}; None — отдаём оригинал'''
+    global _image_pool
+    prefix = cdn_url('')
+    if not isinstance(url, str) or not url.startswith(prefix):
+        return None
+    key = url[len(prefix):]
+    from concurrent.futures.process import ProcessPoolExecutor, BrokenProcessPool
+    try:
+        raw = get_s3().get_object(Bucket='files', Key=key)['Body'].read()
+        if _image_pool is None:
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        rendered = list(_image_pool.map(render_variant, [raw] * len(IMAGE_WIDTHS), IMAGE_WIDTHS))
+    except BrokenProcessPool:
+        _image_pool = None
+        return None
+    except Exception:
+        return None  # не картинка, битый файл или нет Pillow
+    base = key.rsplit('.', 1)[0]
+    variants = {}
+    for width, files in rendered:
+        for ext, content_type, body in files:
+            if str(width) in variants.get(ext, {}):
+                continue  # исходник уже меньше этой ширины
+            vkey = f'{base}_{width}.{ext}'
+            get_s3().put_object(Bucket='files', Key=vkey, Body=body, ContentType=content_type,
+                                CacheControl='public, max-age=31536000, immutable')
+            variants.setdefault(ext, {})[str(width)] = cdn_url(vkey)
+    return variants
+
+def image_variants_json(cur, table: str, row_id, url):
+    '''Значение колонки image_variants: варианты пересчитываются, только если у строки сменилась картинка'''
+    if row_id:
+        cur.execute(f"SELECT image_url, image_variants FROM {SCHEMA}.{table} WHERE id=%s", (int(row_id),))
+        row = cur.fetchone()
+        if row and row[0] == url and row[1]:
+            return json.dumps(row[1])
+    variants = image_variants(url)
+    return json.dumps(variants) if variants else None
+
+def upload_s3(b64data, filename, folder='files'):
+    data, content_type = decode_data_url(b64data)
+    key = f"{folder}/{filename.rsplit('.', 1)[0]}.{UPLOAD_TYPES.get(content_type, 'jpg')}"
+    get_s3().put_object(Bucket='files', Key=key, Body=data, ContentType=content_type)
+    return cdn_url(key)
+
+
+# ===== UPLOADS =====
+UPLOAD_BACKEND = os.environ.get('UPLOAD_BACKEND', 's3')
+UPLOAD_URL_TTL = 900
+UPLOAD_SESSION_TTL_MINUTES = 60
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(15 * 1024 * 1024)))
+UPLOAD_MAX_FILES = 10
+UPLOAD_FOLDERS = ('drivers', 'fleet', 'tariffs', 'news')
+UPLOAD_TYPES = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp', 'application/pdf': 'pdf'}
+
+class S3Storage:
+    '''Бакет проекта: presigned PUT, проверка объекта и публичный CDN-адрес'''
+
+    def client(self):
+        return get_s3()
+
+    def presign_put(self, key: str, content_type: str) -> str:
+        return self.client().generate_presigned_url('put_object', Params={'Bucket': 'files', 'Key': key, 'ContentType': content_type},
+                                                    ExpiresIn=UPLOAD_URL_TTL)
+
+    def size(self, key: str):
+        try:
+            return self.client().head_object(Bucket='files', Key=key)['ContentLength']
+        except Exception:
+            return None
+
+    def public_url(self, key: str) -> str:
+        return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+class LocalStorage:
+    '''Замена S3 для тестов и локального запуска: файлы в UPLOAD_LOCAL_DIR,
+    PUT по подписанной ссылке принимает сама функция (?resource=uploads&action=put)'''
+
+    def __init__(self):
+        self.root = os.environ.get('UPLOAD_LOCAL_DIR', '/tmp/uploads')
+        self.base_url = os.environ.get('UPLOAD_LOCAL_URL', '')
+        self.secret = os.environ.get('UPLOAD_LOCAL_SECRET', 'local').encode()
+
+    def sign(self, key: str, expires: int) -> str:
+        return hmac.new(self.secret, f'{key}:{expires}'.encode(), hashlib.sha256).hexdigest()
+
+    def presign_put(self, key: str, content_type: str) -> str:
+        expires = int(time.time()) + UPLOAD_URL_TTL
+        query = urllib.parse.urlencode({'resource': 'uploads', 'action': 'put', 'key': key, 'expires': expires, 'sig': self.sign(key, expires)})
+        return f'{self.base_url}?{query}'
+
+    def put(self, key: str, expires: str, sig: str, data: bytes) -> bool:
+        if not expires.isdigit() or int(expires) < time.time() or not hmac.compare_digest(self.sign(key, int(expires)), sig):
+            return False
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return True
+
+    def size(self, key: str):
+        path = os.path.join(self.root, key)
+        return os.path.getsize(path) if os.path.isfile(path) else None
+
+    def public_url(self, key: str) -> str:
+        return f'file://{os.path.join(self.root, key)}'
+
+storage = LocalStorage() if UPLOAD_BACKEND == 'local' else S3Storage()
+
+def handle_uploads(method, event, params):
+    '''Прямая загрузка файлов: action=create выдаёт presigned PUT-ссылки, action=confirm проверяет объекты и возвращает адреса'''
+    action = params.get('action', 'create')
+
+    if action == 'put' and method == 'PUT' and isinstance(storage, LocalStorage):
+        body = event.get('body') or ''
+        data = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('latin-1')
+        if len(data) > UPLOAD_MAX_BYTES or not storage.put(params.get('key', ''), params.get('expires', ''), params.get('sig', ''), data):
+            return resp(403, {'error': 'Ссылка недействительна'})
+        return resp(200, {'key': params.get('key')})
+
+    if method != 'POST':
+        return resp(405, {'error': 'Method not allowed'})
+    data = json.loads(event.get('body') or '{}')
+    conn = get_conn(); cur = conn.cursor()
+
+    if action == 'create':
+        folder = data.get('folder')
+        files = data.get('files') or []
+        if folder not in UPLOAD_FOLDERS or not files or len(files) > UPLOAD_MAX_FILES:
+            cur.close(); conn.close()
+            return resp(400, {'error': f'Укажите папку и от 1 до {UPLOAD_MAX_FILES} файлов'})
+        uploads = []
+        for f in files:
+            content_type = f.get('content_type', '')
+            if content_type not in UPLOAD_TYPES or int(f.get('size') or 0) > UPLOAD_MAX_BYTES:
+                cur.close(); conn.close()
+                return resp(400, {'error': f'Недопустимый файл {f.get("name", "")}'})
+            key = f'{folder}/{secrets.token_hex(8)}.{UPLOAD_TYPES[content_type]}'
+            uploads.append({'key': key, 'url': storage.presign_put(key, content_type), 'method': 'PUT',
+                            'headers': {'Content-Type': content_type}})
+        session_id = secrets.token_hex(16)
+        cur.execute(f'''
+            INSERT INTO {SCHEMA}.upload_sessions (id, folder, files, expires_at)
+            VALUES (%s, %s, %s, NOW() + make_interval(mins => %s))
+        ''', (session_id, folder, json.dumps([u['key'] for u in uploads]), UPLOAD_SESSION_TTL_MINUTES))
+        conn.commit(); cur.close(); conn.close()
+        return resp(201, {'session_id': session_id, 'uploads': uploads})
+
+    if action == 'confirm':
+        cur.execute(f"SELECT files FROM {SCHEMA}.upload_sessions WHERE id=%s AND status='open' AND expires_at > NOW()",
+                    (data.get('session_id', ''),))
+        row = cur.fetchone()
+        if not row:
+            cur.close(); conn.close()
+            return resp(404, {'error': 'Сессия загрузки не найдена или истекла'})
+        confirmed, missing = [], []
+        for key in row[0]:
+            size = storage.size(key)
+            if size is None or size > UPLOAD_MAX_BYTES:
+                missing.append(key)
+            else:
+                confirmed.append({'key': key, 'url': storage.public_url(key), 'size': size})
+        cur.execute(f"UPDATE {SCHEMA}.upload_sessions SET status='confirmed', confirmed_at=NOW() WHERE id=%s", (data['session_id'],))
+        conn.commit(); cur.close(); conn.close()
+        return resp(200, {'files': confirmed, 'missing': missing})
+
+    cur.close(); conn.close()
+    return resp(400, {'error': 'Неизвестное действие'})
+
+
+# ===== CATALOG =====
+CATALOG_TABLES = ('tariffs', 'car_classes', 'transfer_types', 'additional_services', 'payment_settings', 'site_settings')
+CATALOG_SETTINGS = ('group_transfer_price_per_person',)
+DEFAULT_PAYMENT_SETTINGS = {'allow_prepay': True, 'prepay_percent': 30, 'allow_full_payment': True, 'payment_provider': 'none'}
+
+def build_catalog(cur) -> dict:
+    '''Публичные справочники формы бронирования: то же, что отдают tariffs, car_classes, transfer_types, services и payment_settings'''
+    def rows(sql):
+        cur.execute(sql)
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+    settings_cache.invalidate()  # версия site_settings уже изменилась — не берём значения из окна проверки кэша
+    payment = rows(f"SELECT allow_prepay, prepay_percent, allow_full_payment, payment_provider, provider_public_key FROM {SCHEMA}.payment_settings ORDER BY id LIMIT 1")
+    return {
+        'tariffs': rows(f"SELECT * FROM {SCHEMA}.tariffs WHERE is_active=true ORDER BY id"),
+        'car_classes': rows(f"SELECT id,value,label,description,icon,price_multiplier,is_active,sort_order FROM {SCHEMA}.car_classes WHERE is_active=true ORDER BY sort_order,id"),
+        'transfer_types': rows(f"SELECT id,value,label,description,icon,is_active,sort_order FROM {SCHEMA}.transfer_types WHERE is_active=true ORDER BY sort_order,id"),
+        'services': rows(f"SELECT id,name,description,price,icon,is_active FROM {SCHEMA}.additional_services WHERE is_active=true ORDER BY id"),
+        'payment_settings': payment[0] if payment else DEFAULT_PAYMENT_SETTINGS,
+        'settings': settings_cache.subset(CATALOG_SETTINGS, cur),
+    }
+
+class CatalogSnapshot:
+    '''Готовый JSON каталога на тёплый контейнер: пересобирается, только когда меняется версия одной из таблиц в cache_versions'''
+
+    def __init__(self):
+        self.body = None
+        self.etag = None
+        self.versions = None
+        self.checked_at = 0.0
+
+    def get(self, cur=None):
+        now = time.monotonic()
+        if self.body is not None and now - self.checked_at < SETTINGS_CHECK_INTERVAL:
+            return self.body, self.etag
+        own = cur is None
+        if own:
+            conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT name, version FROM {SCHEMA}.cache_versions WHERE name = ANY(%s)", (list(CATALOG_TABLES),))
+            versions = dict(cur.fetchall())
+            if self.body is None or versions != self.versions:
+                self.body = json.dumps(build_catalog(cur), default=str)
+                self.etag = '"catalog-' + hashlib.sha1(json.dumps(sorted(versions.items())).encode()).hexdigest()[:16] + '"'
+                self.versions = versions
+            self.checked_at = now
+        finally:
+            if own:
+                cur.close(); conn.close()
+        return self.body, self.etag
+
+catalog_snapshot = CatalogSnapshot()
+
+def handle_catalog(method, event, params):
+    if method != 'GET':
+        return resp(405, {'error': 'Method not allowed'})
+    body, etag = catalog_snapshot.get()
+    if is_not_modified(event, etag):
+        return not_modified(etag, True)
+    return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', **CORS, **cache_headers(etag, True)},
+            'body': body, 'isBase64Encoded': False}
+
+
+# ===== QUOTES =====
+# Та же матрица цен есть в orders/index.py: функции деплоятся по отдельности, правки вносить в обе
+QUOTE_TABLES = ('tariffs', 'car_classes', 'transfer_types', 'additional_services', 'site_settings')
+DEFAULT_GROUP_PRICE_PER_PERSON = 1500
+
+def round_price(value: float) -> int:
+    '''Округление как Math.round в форме бронирования (половина — вверх), а не банковское round()'''
+    return int(math.floor(value + 0.5))
+
+class PriceMatrix:
+    '''Матрица цен на тёплый контейнер: (тариф, класс авто, тип трансфера) -> базовая цена, плюс цены услуг.
+    Пересчитывается, только когда меняется версия одной из таблиц в cache_versions'''
+
+    def __init__(self):
+        self.base = {}
+        self.services = {}
+        self.versions = None
+        self.checked_at = 0.0
+
+    def refresh(self, cur=None):
+        now = time.monotonic()
+        if self.versions is not None and now - self.checked_at < SETTINGS_CHECK_INTERVAL:
+            return self
+        own = cur is None
+        if own:
+            conn = get_conn(); cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT name, version FROM {SCHEMA}.cache_versions WHERE name = ANY(%s)", (list(QUOTE_TABLES),))
+            versions = dict(cur.fetchall())
+            if versions != self.versions:
+                self._build(cur)
+                self.versions = versions
+            self.checked_at = now
+        finally:
+            if own:
+                cur.close(); conn.close()
+        return self
+
+    def _build(self, cur):
+        cur.execute(f"SELECT id, price FROM {SCHEMA}.tariffs WHERE is_active=true")
+        tariffs = cur.fetchall()
+        cur.execute(f"SELECT value, price_multiplier FROM {SCHEMA}.car_classes WHERE is_active=true")
+        classes = cur.fetchall()
+        cur.execute(f"SELECT value FROM {SCHEMA}.transfer_types WHERE is_active=true")
+        types = [r[0] for r in cur.fetchall()]
+        cur.execute(f"SELECT id, price FROM {SCHEMA}.additional_services WHERE is_active=true")
+        services = {sid: float(price or 0) for sid, price in cur.fetchall()}
+        cur.execute(f"SELECT value FROM {SCHEMA}.site_settings WHERE key='group_transfer_price_per_person'")
+        row = cur.fetchone()
+        try:
+            group = float(row[0]) if row and row[0] else DEFAULT_GROUP_PRICE_PER_PERSON
+        except ValueError:
+            group = DEFAULT_GROUP_PRICE_PER_PERSON
+        # Групповой трансфер — цена за пассажира, остальные — тариф × множитель класса
+        base = {}
+        for tariff_id, price in tariffs:
+            for car_class, multiplier in classes:
+                individual = round_price(float(price or 0) * float(multiplier or 1))
+                for transfer_type in types:
+                    base[(tariff_id, car_class, transfer_type)] = (group, True) if transfer_type == 'group' else (individual, False)
+        self.base, self.services = base, services
+
+    def quote(self, tariff_id: int, car_class: str, transfer_type: str, passengers: int = 1, services=()):
+        '''Цена поездки; None — комбинации нет среди активных тарифов, классов, типов или услуг'''
+        entry = self.base.get((tariff_id, car_class, transfer_type))
+        if entry is None or any(sid not in self.services for sid in services):
+            return None
+        price, per_person = entry
+        base = round_price(price * max(1, passengers)) if per_person else price
+        extras = sum(self.services[sid] for sid in services)
+        return {'tariff_id': tariff_id, 'car_class': car_class, 'transfer_type': transfer_type, 'passengers': passengers,
+                'services': list(services), 'base_price': base, 'services_price': extras, 'price': base + extras}
+
+price_matrix = PriceMatrix()
+
+def parse_quote(item: dict) -> tuple:
+    '''Аргументы PriceMatrix.quote из запроса; ValueError на некорректных значениях'''
+    services = item.get('services') or []
+    if isinstance(services, str):
+        services = [s for s in services.split(',') if s.strip()]
+    return (int(item['tariff_id']), str(item.get('car_class', 'comfort')), str(item.get('transfer_type', 'individual')),
+            int(item.get('passengers') or item.get('passengers_count') or 1), tuple(int(s) for s in services))
+QUOTE_BATCH_MAX = 200
+
+def handle_quote(method, event, params):
+    '''GET — одна цена по параметрам запроса, POST {"items": [...]} — пакет; матрица в памяти, БД не читается'''
+    matrix = price_matrix.refresh()
+    if method == 'GET':
+        try:
+            quote = matrix.quote(*parse_quote(params))
+        except (KeyError, ValueError):
+            return resp(400, {'error': 'Укажите tariff_id, car_class, transfer_type, passengers, services'})
+        if quote is None:
+            return resp(404, {'error': 'Тариф, класс авто, тип трансфера или услуга недоступны'})
+        return resp(200, {'quote': quote})
+    if method == 'POST':
+        items = json.loads(event.get('body') or '{}').get('items')
+        if not isinstance(items, list) or len(items) > QUOTE_BATCH_MAX:
+            return resp(400, {'error': f'Нужен список items, не больше {QUOTE_BATCH_MAX}'})
+        quotes = []
+        for item in items:
+            try:
+                quote = matrix.quote(*parse_quote(item))
+            except (KeyError, ValueError, TypeError, AttributeError):
+                quote = None
+            quotes.append(quote)
+        return resp(200, {'quotes': quotes})
+    return resp(405, {'error': 'Method not allowed'})
 
 
 # ===== TARIFFS =====
@@ -37,22 +602,26 @@ def handle_tariffs(method, event, params):
     conn = get_conn(); cur = conn.cursor()
     if method == 'GET':
         active_only = params.get('active', 'false') == 'true'
+        etag = reference_etag(cur, 'tariffs', params)
+        if is_not_modified(event, etag):
+            cur.close(); conn.close(); return not_modified(etag, active_only)
         q = f"SELECT * FROM {SCHEMA}.tariffs" + (" WHERE is_active=true" if active_only else "") + " ORDER BY id"
         cur.execute(q)
         cols = [d[0] for d in cur.description]
         rows = [dict(zip(cols, r)) for r in cur.fetchall()]
         cur.close(); conn.close()
-        return resp(200, {'tariffs': rows})
+        return cached_resp({'tariffs': rows}, etag, active_only)
     elif method == 'POST':
         data = json.loads(event.get('body', '{}'))
-        image_url = None
+        image_url = data.get('image_url')
         if data.get('image_base64'):
             image_url = upload_s3(data['image_base64'], f"tariff_{os.urandom(6).hex()}.jpg", 'tariffs')
         cur.execute(f'''
-            INSERT INTO {SCHEMA}.tariffs (city, price, distance, duration, image_emoji, image_url, is_active)
-            VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING id
+            INSERT INTO {SCHEMA}.tariffs (city, price, distance, duration, image_emoji, image_url, image_variants, is_active)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s) RETURNING id
         ''', (data.get('city'), data.get('price'), data.get('distance'), data.get('duration'),
-              data.get('image_emoji','🚗'), image_url, data.get('is_active', True)))
+              data.get('image_emoji','🚗'), image_url, image_variants_json(cur, 'tariffs', None, image_url),
+              data.get('is_active', True)))
         tid = cur.fetchone()[0]
         conn.commit(); cur.close(); conn.close()
         return resp(201, {'id': tid, 'message': 'Тариф создан'})
@@ -61,12 +630,14 @@ def handle_tariffs(method, event, params):
         image_url = data.get('image_url')
         if data.get('image_base64'):
             image_url = upload_s3(data['image_base64'], f"tariff_{os.urandom(6).hex()}.jpg", 'tariffs')
+        variants = image_variants_json(cur, 'tariffs', data.get('id'), image_url) if image_url else None
         cur.execute(f'''
             UPDATE {SCHEMA}.tariffs SET city=%s, price=%s, distance=%s, duration=%s,
-            image_emoji=%s, is_active=%s, image_url=COALESCE(%s, image_url), updated_at=NOW()
+            image_emoji=%s, is_active=%s, image_url=COALESCE(%s, image_url),
+            image_variants=CASE WHEN %s::text IS NULL THEN image_variants ELSE %s::jsonb END, updated_at=NOW()
             WHERE id=%s
         ''', (data.get('city'), data.get('price'), data.get('distance'), data.get('duration'),
-              data.get('image_emoji'), data.get('is_active'), image_url, data.get('id')))
+              data.get('image_emoji'), data.get('is_active'), image_url, image_url, variants, data.get('id')))
         conn.commit(); cur.close(); conn.close()
         return resp(200, {'message': 'Тариф обновлён'})
     elif method == 'DELETE':
@@ -83,13 +654,9 @@ def handle_settings(method, event, params):
     if method == 'GET':
         keys = params.get('keys', '')
         if keys:
-            ks = [k.strip() for k in keys.split(',') if k.strip()]
-            ph = ','.join([f"'{k}'" for k in ks])
-            cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings WHERE key IN ({ph})")
+            settings = settings_cache.subset([k.strip() for k in keys.split(',') if k.strip()], cur)
         else:
-            cur.execute(f"SELECT key, value FROM {SCHEMA}.site_settings")
-        rows = cur.fetchall()
-        settings = {r[0]: r[1] for r in rows}
+            settings = settings_cache.snapshot(cur)
         cur.close(); conn.close()
         return resp(200, {'settings': settings})
     elif method == 'PUT':
@@ -101,6 +668,7 @@ def handle_settings(method, event, params):
                 ON CONFLICT (key) DO UPDATE SET value=%s, updated_at=NOW()
             ''', (key, str(value) if value is not None else '', str(value) if value is not None else ''))
         conn.commit(); cur.close(); conn.close()
+        settings_cache.invalidate()
         return resp(200, {'message': 'Настройки сохранены'})
     return resp(405, {'error': 'Method not allowed'})
 
@@ -110,12 +678,15 @@ def handle_services(method, event, params):
     conn = get_conn(); cur = conn.cursor()
     if method == 'GET':
         admin = params.get('admin') == 'true'
+        etag = reference_etag(cur, 'additional_services', params)
+        if is_not_modified(event, etag):
+            cur.close(); conn.close(); return not_modified(etag, not admin)
         q = f"SELECT id,name,description,price,icon,is_active FROM {SCHEMA}.additional_services" + ("" if admin else " WHERE is_active=true") + " ORDER BY id"
         cur.execute(q)
         cols = [d[0] for d in cur.description]
         services = [dict(zip(cols, r)) for r in cur.fetchall()]
         cur.close(); conn.close()
-        return resp(200, {'services': services})
+        return cached_resp({'services': services}, etag, not admin)
     elif method == 'POST':
         data = json.loads(event.get('body', '{}'))
         name = data.get('name','').strip()
@@ -150,30 +721,35 @@ def handle_news(method, event, params):
         news_id = params.get('id')
         admin = params.get('admin') == 'true'
         if news_id:
-            cur.execute(f"SELECT id,title,content,image_url,is_published,published_at,created_at FROM {SCHEMA}.news WHERE id={int(news_id)}")
+            cur.execute(f"SELECT id,title,content,image_url,image_variants,is_published,published_at,created_at FROM {SCHEMA}.news WHERE id={int(news_id)}")
             row = cur.fetchone()
             if not row:
                 cur.close(); conn.close(); return resp(404, {'error': 'Не найдено'})
-            cols = ['id','title','content','image_url','is_published','published_at','created_at']
+            cols = ['id','title','content','image_url','image_variants','is_published','published_at','created_at']
             cur.close(); conn.close()
             return resp(200, {'news': dict(zip(cols, row))})
-        q = f"SELECT id,title,content,image_url,is_published,published_at,created_at FROM {SCHEMA}.news" + ("" if admin else " WHERE is_published=true") + " ORDER BY created_at DESC LIMIT 50"
-        cur.execute(q)
+        if admin:
+            cond, vals = since_clause(params, 'updated_at')
+            cur.execute(f"SELECT id,title,content,image_url,image_variants,is_published,published_at,created_at FROM {SCHEMA}.news{cond} ORDER BY created_at DESC LIMIT 50", vals)
+        else:
+            cur.execute(f"SELECT id,title,content,image_url,image_variants,is_published,published_at,created_at FROM {SCHEMA}.news WHERE is_published=true ORDER BY created_at DESC LIMIT 50")
         cols = [d[0] for d in cur.description]
         news = [dict(zip(cols, r)) for r in cur.fetchall()]
+        meta = sync_meta(cur, params, 'news') if admin else {}
         cur.close(); conn.close()
-        return resp(200, {'news': news})
+        return resp(200, {'news': news, **meta})
     elif method == 'POST':
         data = json.loads(event.get('body', '{}'))
-        image_url = None
+        image_url = data.get('image_url')
         # Поддержка обоих вариантов: image_base64 и image_b64
         img_b64 = data.get('image_base64') or data.get('image_b64')
         if img_b64:
             image_url = upload_s3(img_b64, f"news_{os.urandom(6).hex()}.jpg", 'news')
         cur.execute(f'''
-            INSERT INTO {SCHEMA}.news (title,content,image_url,is_published,published_at)
-            VALUES (%s,%s,%s,%s,CASE WHEN %s THEN NOW() ELSE NULL END) RETURNING id
-        ''', (data.get('title'), data.get('content'), image_url, data.get('is_published',False), data.get('is_published',False)))
+            INSERT INTO {SCHEMA}.news (title,content,image_url,image_variants,is_published,published_at)
+            VALUES (%s,%s,%s,%s,%s,CASE WHEN %s THEN NOW() ELSE NULL END) RETURNING id
+        ''', (data.get('title'), data.get('content'), image_url, image_variants_json(cur, 'news', None, image_url),
+              data.get('is_published',False), data.get('is_published',False)))
         nid = cur.fetchone()[0]
         conn.commit(); cur.close(); conn.close()
         return resp(201, {'id': nid, 'message': 'Новость создана'})
@@ -183,11 +759,14 @@ def handle_news(method, event, params):
         img_b64 = data.get('image_base64') or data.get('image_b64')
         if img_b64:
             image_url = upload_s3(img_b64, f"news_{os.urandom(6).hex()}.jpg", 'news')
+        variants = image_variants_json(cur, 'news', data.get('id'), image_url) if image_url else None
         cur.execute(f'''
             UPDATE {SCHEMA}.news SET title=%s,content=%s,is_published=%s,
             published_at=CASE WHEN %s AND published_at IS NULL THEN NOW() ELSE published_at END,
-            image_url=COALESCE(%s,image_url), updated_at=NOW() WHERE id=%s
-        ''', (data.get('title'), data.get('content'), data.get('is_published',False), data.get('is_published',False), image_url, data.get('id')))
+            image_url=COALESCE(%s,image_url),
+            image_variants=CASE WHEN %s::text IS NULL THEN image_variants ELSE %s::jsonb END, updated_at=NOW() WHERE id=%s
+        ''', (data.get('title'), data.get('content'), data.get('is_published',False), data.get('is_published',False),
+              image_url, image_url, variants, data.get('id')))
         conn.commit(); cur.close(); conn.close()
         return resp(200, {'message': 'Новость обновлена'})
     elif method == 'DELETE':
@@ -255,12 +834,15 @@ def handle_transfer_types(method, event, params):
     conn = get_conn(); cur = conn.cursor()
     if method == 'GET':
         active_only = params.get('active', 'false') == 'true'
+        etag = reference_etag(cur, 'transfer_types', params)
+        if is_not_modified(event, etag):
+            cur.close(); conn.close(); return not_modified(etag, active_only)
         q = f"SELECT id,value,label,description,icon,is_active,sort_order FROM {SCHEMA}.transfer_types" + (" WHERE is_active=true" if active_only else "") + " ORDER BY sort_order,id"
         cur.execute(q)
         cols = [d[0] for d in cur.description]
         rows = [dict(zip(cols, r)) for r in cur.fetchall()]
         cur.close(); conn.close()
-        return resp(200, {'transfer_types': rows})
+        return cached_resp({'transfer_types': rows}, etag, active_only)
     elif method == 'POST':
         data = json.loads(event.get('body', '{}'))
         cur.execute(f'''
@@ -290,12 +872,15 @@ def handle_car_classes(method, event, params):
     conn = get_conn(); cur = conn.cursor()
     if method == 'GET':
         active_only = params.get('active', 'false') == 'true'
+        etag = reference_etag(cur, 'car_classes', params)
+        if is_not_modified(event, etag):
+            cur.close(); conn.close(); return not_modified(etag, active_only)
         q = f"SELECT id,value,label,description,icon,price_multiplier,is_active,sort_order FROM {SCHEMA}.car_classes" + (" WHERE is_active=true" if active_only else "") + " ORDER BY sort_order,id"
         cur.execute(q)
         cols = [d[0] for d in cur.description]
         rows = [dict(zip(cols, r)) for r in cur.fetchall()]
         cur.close(); conn.close()
-        return resp(200, {'car_classes': rows})
+        return cached_resp({'car_classes': rows}, etag, active_only)
     elif method == 'POST':
         data = json.loads(event.get('body', '{}'))
         cur.execute(f'''
@@ -321,7 +906,7 @@ def handle_car_classes(method, event, params):
 
 
 def handler(event: dict, context) -> dict:
-    '''Мультироутер: tariffs, settings, services, news, reviews, transfer_types, car_classes'''
+    '''Мультироутер: tariffs, settings, services, news, reviews, transfer_types, car_classes, uploads, catalog, quote'''
     if event.get('httpMethod') == 'OPTIONS':
         return {'statusCode': 200, 'headers': {**CORS, 'Access-Control-Max-Age': '86400'}, 'body': ''}
 
@@ -342,7 +927,17 @@ def handler(event: dict, context) -> dict:
             return handle_transfer_types(method, event, params)
         elif resource == 'car_classes':
             return handle_car_classes(method, event, params)
+        elif resource == 'uploads':
+            return handle_uploads(method, event, params)
+        elif resource == 'catalog':
+            return handle_catalog(method, event, params)
+        elif resource == 'quote':
+            return handle_quote(method, event, params)
         else:
             return handle_tariffs(method, event, params)
+    except PoolExhausted as e:
+        return resp(503, {'error': str(e)})
     except Exception as e:
         return resp(500, {'error': str(e)})
+    finally:
+        release_conns()
@@ -0,0 +1,18 @@
+-- Очередь уведомлений (outbox): пишется в одной транзакции с заказом,
+-- доставляется отдельным воркером ?resource=outbox
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.notification_outbox (
+    id SERIAL PRIMARY KEY,
+    channel VARCHAR(20) NOT NULL,
+    order_id INTEGER REFERENCES t_p8223105_sochi_transfer_websi.orders(id),
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP DEFAULT NOW(),
+    created_at TIMESTAMP DEFAULT NOW(),
+    sent_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_pending
+    ON t_p8223105_sochi_transfer_websi.notification_outbox(next_attempt_at, id)
+    WHERE status = 'pending';
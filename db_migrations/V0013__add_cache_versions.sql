@@ -0,0 +1,25 @@
+-- Счётчики версий для кэшей в тёплых контейнерах функций.
+-- Триггер увеличивает версию при любом изменении таблицы, обработчики
+-- сравнивают её с закэшированной и перечитывают данные только при расхождении
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.bump_cache_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p8223105_sochi_transfer_websi.cache_versions (name, version, updated_at)
+    VALUES (TG_TABLE_NAME, 1, NOW())
+    ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_site_settings_version ON t_p8223105_sochi_transfer_websi.site_settings;
+CREATE TRIGGER trg_site_settings_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.site_settings
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+INSERT INTO t_p8223105_sochi_transfer_websi.cache_versions (name) VALUES ('site_settings')
+ON CONFLICT (name) DO NOTHING;
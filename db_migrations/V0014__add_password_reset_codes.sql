@@ -0,0 +1,17 @@
+-- Коды сброса пароля в отдельной таблице со сроком жизни и счётчиком попыток
+-- (раньше хранились строками reset_code_* в site_settings и не удалялись)
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.password_reset_codes (
+    id SERIAL PRIMARY KEY,
+    account_type VARCHAR(20) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    code VARCHAR(10) NOT NULL,
+    attempts INTEGER DEFAULT 0,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (phone, account_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_reset_codes_expires
+    ON t_p8223105_sochi_transfer_websi.password_reset_codes(expires_at);
+
+DELETE FROM t_p8223105_sochi_transfer_websi.site_settings WHERE key LIKE 'reset\_code\_%';
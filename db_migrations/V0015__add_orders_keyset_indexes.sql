@@ -0,0 +1,12 @@
+-- Индексы для постраничной (keyset) выдачи заказов в админке: порядок (created_at, id)
+-- и составные индексы под каждый фильтр списка
+CREATE INDEX IF NOT EXISTS idx_orders_created_id
+    ON t_p8223105_sochi_transfer_websi.orders(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_id
+    ON t_p8223105_sochi_transfer_websi.orders(status_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_driver_created_id
+    ON t_p8223105_sochi_transfer_websi.orders(driver_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_car_class_created_id
+    ON t_p8223105_sochi_transfer_websi.orders(car_class, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_payment_type_created_id
+    ON t_p8223105_sochi_transfer_websi.orders(payment_type, created_at DESC, id DESC);
@@ -0,0 +1,44 @@
+-- Инкрементальная синхронизация списков (?since=): updated_at поддерживается
+-- триггерами и проиндексирован, удаления фиксируются в deleted_rows
+ALTER TABLE t_p8223105_sochi_transfer_websi.reviews ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+UPDATE t_p8223105_sochi_transfer_websi.reviews SET updated_at = created_at WHERE updated_at IS NULL OR updated_at > created_at;
+
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = LOCALTIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.deleted_rows (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(100) NOT NULL,
+    row_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP DEFAULT LOCALTIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_table_time
+    ON t_p8223105_sochi_transfer_websi.deleted_rows(table_name, deleted_at);
+
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.record_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p8223105_sochi_transfer_websi.deleted_rows (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['orders', 'drivers', 'reviews', 'withdrawal_requests', 'deposit_requests', 'news', 'rideshares'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_touch ON t_p8223105_sochi_transfer_websi.%I', t, t);
+        EXECUTE format('CREATE TRIGGER trg_%s_touch BEFORE UPDATE ON t_p8223105_sochi_transfer_websi.%I
+                        FOR EACH ROW EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.touch_updated_at()', t, t);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS idx_%s_updated_at ON t_p8223105_sochi_transfer_websi.%I(updated_at)', t, t);
+    END LOOP;
+    FOREACH t IN ARRAY ARRAY['news', 'rideshares', 'reviews'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_tombstone ON t_p8223105_sochi_transfer_websi.%I', t, t);
+        EXECUTE format('CREATE TRIGGER trg_%s_tombstone AFTER DELETE ON t_p8223105_sochi_transfer_websi.%I
+                        FOR EACH ROW EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.record_tombstone()', t, t);
+    END LOOP;
+END $$;
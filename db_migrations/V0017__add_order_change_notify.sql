@@ -0,0 +1,31 @@
+-- Лента изменений заказов и бронирований попуток: триггеры публикуют NOTIFY order_changes,
+-- функция orders (?resource=feed) раздаёт события водителям и менеджерам через long-poll/SSE
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.notify_order_change() RETURNS trigger AS $$
+DECLARE
+    payload JSONB;
+BEGIN
+    IF TG_TABLE_NAME = 'orders' THEN
+        payload := jsonb_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', NEW.id,
+            'status_id', NEW.status_id, 'car_class', NEW.car_class,
+            'driver_id', NEW.driver_id, 'updated_at', NEW.updated_at);
+    ELSE
+        payload := jsonb_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', NEW.id,
+            'rideshare_id', NEW.rideshare_id, 'status', NEW.status,
+            'seats_count', NEW.seats_count);
+    END IF;
+    PERFORM pg_notify('order_changes', payload::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_notify ON t_p8223105_sochi_transfer_websi.orders;
+CREATE TRIGGER trg_orders_notify
+    AFTER INSERT OR UPDATE ON t_p8223105_sochi_transfer_websi.orders
+    FOR EACH ROW EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.notify_order_change();
+
+DROP TRIGGER IF EXISTS trg_rideshare_bookings_notify ON t_p8223105_sochi_transfer_websi.rideshare_bookings;
+CREATE TRIGGER trg_rideshare_bookings_notify
+    AFTER INSERT OR UPDATE ON t_p8223105_sochi_transfer_websi.rideshare_bookings
+    FOR EACH ROW EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.notify_order_change();
@@ -0,0 +1,4 @@
+-- Частичный индекс по свободным новым заказам: лента available_orders и захват заказа водителем
+CREATE INDEX IF NOT EXISTS idx_orders_unassigned_new
+    ON t_p8223105_sochi_transfer_websi.orders(created_at, id)
+    WHERE driver_id IS NULL AND status_id = 1;
@@ -0,0 +1,12 @@
+-- Индекс для отмены бронирования по cancel_token и запрет отрицательного остатка мест
+CREATE INDEX IF NOT EXISTS idx_rideshare_bookings_cancel_token
+    ON t_p8223105_sochi_transfer_websi.rideshare_bookings(cancel_token)
+    WHERE cancel_token IS NOT NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'chk_rideshares_seats_available') THEN
+        ALTER TABLE t_p8223105_sochi_transfer_websi.rideshares
+            ADD CONSTRAINT chk_rideshares_seats_available CHECK (seats_available >= 0) NOT VALID;
+    END IF;
+END $$;
@@ -0,0 +1,11 @@
+-- Индексы для публичного поиска поездок: keyset по времени отправления и префиксный поиск по маршруту
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_rideshares_status_departure
+    ON t_p8223105_sochi_transfer_websi.rideshares(status, departure_datetime, id);
+
+CREATE INDEX IF NOT EXISTS idx_rideshares_route_from_trgm
+    ON t_p8223105_sochi_transfer_websi.rideshares USING gin (route_from gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_rideshares_route_to_trgm
+    ON t_p8223105_sochi_transfer_websi.rideshares USING gin (route_to gin_trgm_ops);
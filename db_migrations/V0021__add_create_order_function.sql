@@ -0,0 +1,46 @@
+-- Создание заказа одной транзакцией на стороне БД: блокировка строки пользователя,
+-- проверка и списание баланса, заказ, запись в журнале баланса и уведомления в outbox
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.create_order(p_user_id INTEGER, p_order JSONB, p_notify JSONB)
+RETURNS TABLE (order_id INTEGER, prepay_amount INTEGER) AS $$
+DECLARE
+    v_price NUMERIC := COALESCE((p_order->>'price')::NUMERIC, 0);
+    v_from_balance BOOLEAN := COALESCE((p_order->>'payment_from_balance')::BOOLEAN, false);
+    v_prepay INTEGER := CASE WHEN p_order->>'payment_type' = 'prepay' THEN round(v_price * 0.3) ELSE 0 END;
+    v_balance NUMERIC;
+    v_id INTEGER;
+BEGIN
+    IF v_from_balance THEN
+        SELECT balance INTO v_balance FROM t_p8223105_sochi_transfer_websi.users WHERE id = p_user_id FOR UPDATE;
+        IF v_balance IS NULL OR v_balance < v_price THEN
+            -- Недостаточно средств: пустой order_id, вызывающий откатывает транзакцию
+            RETURN QUERY SELECT NULL::INTEGER, 0;
+            RETURN;
+        END IF;
+        UPDATE t_p8223105_sochi_transfer_websi.users SET balance = balance - v_price WHERE id = p_user_id;
+    END IF;
+
+    INSERT INTO t_p8223105_sochi_transfer_websi.orders (
+        from_location, to_location, pickup_datetime, flight_number,
+        passenger_name, passenger_phone, passenger_email,
+        passengers_count, luggage_count, tariff_id, fleet_id,
+        status_id, price, notes, transfer_type, car_class, payment_type, prepay_amount, user_id, payment_from_balance
+    ) VALUES (
+        p_order->>'from_location', p_order->>'to_location', (p_order->>'pickup_datetime')::TIMESTAMP, p_order->>'flight_number',
+        p_order->>'passenger_name', p_order->>'passenger_phone', p_order->>'passenger_email',
+        (p_order->>'passengers_count')::INTEGER, (p_order->>'luggage_count')::INTEGER,
+        (p_order->>'tariff_id')::INTEGER, (p_order->>'fleet_id')::INTEGER,
+        (p_order->>'status_id')::INTEGER, v_price, p_order->>'notes',
+        p_order->>'transfer_type', p_order->>'car_class', p_order->>'payment_type', v_prepay, p_user_id, v_from_balance
+    ) RETURNING id INTO v_id;
+
+    IF v_from_balance THEN
+        INSERT INTO t_p8223105_sochi_transfer_websi.balance_transactions (user_id, amount, type, description, status)
+        VALUES (p_user_id, -v_price, 'payment', 'Оплата заказа #' || v_id, 'completed');
+    END IF;
+
+    INSERT INTO t_p8223105_sochi_transfer_websi.notification_outbox (channel, order_id, payload)
+    VALUES ('telegram', v_id, p_notify), ('email', v_id, p_notify);
+
+    RETURN QUERY SELECT v_id, v_prepay;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,8 @@
+-- Версия справочника статусов для кэша имён статусов в тёплых контейнерах
+DROP TRIGGER IF EXISTS trg_order_statuses_version ON t_p8223105_sochi_transfer_websi.order_statuses;
+CREATE TRIGGER trg_order_statuses_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.order_statuses
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+INSERT INTO t_p8223105_sochi_transfer_websi.cache_versions (name) VALUES ('order_statuses')
+ON CONFLICT (name) DO NOTHING;
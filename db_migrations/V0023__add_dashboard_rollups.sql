@@ -0,0 +1,97 @@
+-- Агрегаты для дашборда админки: день × статус × класс авто × тариф по заказам
+-- и день × тип × статус × вид счёта по операциям баланса. Поддерживаются
+-- построчными триггерами (вычитаем старый вклад строки, добавляем новый)
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.order_stats_daily (
+    day DATE NOT NULL,
+    status_id INTEGER NOT NULL DEFAULT 0,
+    car_class VARCHAR(20) NOT NULL DEFAULT '',
+    tariff_id INTEGER NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    revenue NUMERIC(14,2) NOT NULL DEFAULT 0,
+    commission NUMERIC(14,2) NOT NULL DEFAULT 0,
+    driver_amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status_id, car_class, tariff_id)
+);
+
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.balance_stats_daily (
+    day DATE NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    status VARCHAR(50) NOT NULL DEFAULT '',
+    account VARCHAR(10) NOT NULL,
+    tx_count INTEGER NOT NULL DEFAULT 0,
+    amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, type, status, account)
+);
+
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.rollup_order_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO t_p8223105_sochi_transfer_websi.order_stats_daily AS s
+            (day, status_id, car_class, tariff_id, orders_count, revenue, commission, driver_amount)
+        VALUES (OLD.created_at::date, COALESCE(OLD.status_id, 0), COALESCE(OLD.car_class, ''), COALESCE(OLD.tariff_id, 0),
+                -1, -COALESCE(OLD.price, 0), -COALESCE(OLD.commission_amount, 0), -COALESCE(OLD.driver_amount, 0))
+        ON CONFLICT (day, status_id, car_class, tariff_id) DO UPDATE SET
+            orders_count = s.orders_count + EXCLUDED.orders_count, revenue = s.revenue + EXCLUDED.revenue,
+            commission = s.commission + EXCLUDED.commission, driver_amount = s.driver_amount + EXCLUDED.driver_amount;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO t_p8223105_sochi_transfer_websi.order_stats_daily AS s
+            (day, status_id, car_class, tariff_id, orders_count, revenue, commission, driver_amount)
+        VALUES (NEW.created_at::date, COALESCE(NEW.status_id, 0), COALESCE(NEW.car_class, ''), COALESCE(NEW.tariff_id, 0),
+                1, COALESCE(NEW.price, 0), COALESCE(NEW.commission_amount, 0), COALESCE(NEW.driver_amount, 0))
+        ON CONFLICT (day, status_id, car_class, tariff_id) DO UPDATE SET
+            orders_count = s.orders_count + EXCLUDED.orders_count, revenue = s.revenue + EXCLUDED.revenue,
+            commission = s.commission + EXCLUDED.commission, driver_amount = s.driver_amount + EXCLUDED.driver_amount;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p8223105_sochi_transfer_websi.rollup_balance_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO t_p8223105_sochi_transfer_websi.balance_stats_daily AS s (day, type, status, account, tx_count, amount)
+        VALUES (OLD.created_at::date, OLD.type, COALESCE(OLD.status, ''),
+                CASE WHEN OLD.driver_id IS NOT NULL THEN 'driver' ELSE 'user' END, -1, -OLD.amount)
+        ON CONFLICT (day, type, status, account) DO UPDATE SET
+            tx_count = s.tx_count + EXCLUDED.tx_count, amount = s.amount + EXCLUDED.amount;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO t_p8223105_sochi_transfer_websi.balance_stats_daily AS s (day, type, status, account, tx_count, amount)
+        VALUES (NEW.created_at::date, NEW.type, COALESCE(NEW.status, ''),
+                CASE WHEN NEW.driver_id IS NOT NULL THEN 'driver' ELSE 'user' END, 1, NEW.amount)
+        ON CONFLICT (day, type, status, account) DO UPDATE SET
+            tx_count = s.tx_count + EXCLUDED.tx_count, amount = s.amount + EXCLUDED.amount;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггеры создаются до пересчёта: CREATE TRIGGER блокирует запись в таблицы до конца
+-- миграции, поэтому строки не могут попасть ни в оба источника, ни мимо них
+DROP TRIGGER IF EXISTS trg_orders_rollup ON t_p8223105_sochi_transfer_websi.orders;
+CREATE TRIGGER trg_orders_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF created_at, status_id, car_class, tariff_id, price, commission_amount, driver_amount
+    ON t_p8223105_sochi_transfer_websi.orders
+    FOR EACH ROW EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.rollup_order_stats();
+
+DROP TRIGGER IF EXISTS trg_balance_transactions_rollup ON t_p8223105_sochi_transfer_websi.balance_transactions;
+CREATE TRIGGER trg_balance_transactions_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF created_at, type, status, amount, driver_id
+    ON t_p8223105_sochi_transfer_websi.balance_transactions
+    FOR EACH ROW EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.rollup_balance_stats();
+
+TRUNCATE t_p8223105_sochi_transfer_websi.order_stats_daily;
+INSERT INTO t_p8223105_sochi_transfer_websi.order_stats_daily
+    (day, status_id, car_class, tariff_id, orders_count, revenue, commission, driver_amount)
+SELECT created_at::date, COALESCE(status_id, 0), COALESCE(car_class, ''), COALESCE(tariff_id, 0),
+       COUNT(*), COALESCE(SUM(price), 0), COALESCE(SUM(commission_amount), 0), COALESCE(SUM(driver_amount), 0)
+FROM t_p8223105_sochi_transfer_websi.orders
+GROUP BY 1, 2, 3, 4;
+
+TRUNCATE t_p8223105_sochi_transfer_websi.balance_stats_daily;
+INSERT INTO t_p8223105_sochi_transfer_websi.balance_stats_daily (day, type, status, account, tx_count, amount)
+SELECT created_at::date, type, COALESCE(status, ''), CASE WHEN driver_id IS NOT NULL THEN 'driver' ELSE 'user' END,
+       COUNT(*), SUM(amount)
+FROM t_p8223105_sochi_transfer_websi.balance_transactions
+GROUP BY 1, 2, 3, 4;
@@ -0,0 +1,32 @@
+-- Платежи по заказам: ссылки создаёт фоновый воркер, статусы приходят вебхуками
+-- и пакетной сверкой; строка однозначно определяется платежом провайдера
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.order_payments (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES t_p8223105_sochi_transfer_websi.orders(id),
+    provider VARCHAR(20) NOT NULL,
+    provider_payment_id VARCHAR(100),
+    idempotence_key VARCHAR(64) NOT NULL,
+    amount NUMERIC(12,2) NOT NULL,
+    description TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending_link',
+    payment_url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP DEFAULT NOW(),
+    paid_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_order_payments_provider_payment
+    ON t_p8223105_sochi_transfer_websi.order_payments(provider, provider_payment_id)
+    WHERE provider_payment_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_order_payments_order
+    ON t_p8223105_sochi_transfer_websi.order_payments(order_id);
+
+CREATE INDEX IF NOT EXISTS idx_order_payments_open
+    ON t_p8223105_sochi_transfer_websi.order_payments(status, next_attempt_at)
+    WHERE status IN ('pending_link', 'pending');
+
+ALTER TABLE t_p8223105_sochi_transfer_websi.orders ADD COLUMN IF NOT EXISTS payment_status VARCHAR(20) DEFAULT 'unpaid';
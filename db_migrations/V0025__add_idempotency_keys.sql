@@ -0,0 +1,15 @@
+-- Ключи идемпотентности POST-запросов (заголовок Idempotency-Key): ключ занимается
+-- в транзакции бизнес-операции, повтор получает сохранённый ответ
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.idempotency_keys (
+    scope VARCHAR(50) NOT NULL,
+    key VARCHAR(200) NOT NULL,
+    fingerprint VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    response TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires
+    ON t_p8223105_sochi_transfer_websi.idempotency_keys(expires_at);
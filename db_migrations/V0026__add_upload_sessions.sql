@@ -0,0 +1,14 @@
+-- Сессии прямой загрузки в хранилище: функция выдаёт presigned PUT-ссылки,
+-- клиент загружает файлы сам и подтверждает ключи
+CREATE TABLE IF NOT EXISTS t_p8223105_sochi_transfer_websi.upload_sessions (
+    id VARCHAR(32) PRIMARY KEY,
+    folder VARCHAR(50) NOT NULL,
+    files JSONB NOT NULL DEFAULT '[]'::jsonb,
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    created_at TIMESTAMP DEFAULT NOW(),
+    confirmed_at TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires
+    ON t_p8223105_sochi_transfer_websi.upload_sessions(expires_at);
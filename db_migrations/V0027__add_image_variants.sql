@@ -0,0 +1,5 @@
+-- Уменьшенные копии картинок (320/768/1600 px, WebP и JPEG без EXIF):
+-- {"webp": {"320": url, ...}, "jpg": {...}}; витрина выбирает самый лёгкий подходящий вариант
+ALTER TABLE t_p8223105_sochi_transfer_websi.fleet ADD COLUMN IF NOT EXISTS image_variants JSONB;
+ALTER TABLE t_p8223105_sochi_transfer_websi.tariffs ADD COLUMN IF NOT EXISTS image_variants JSONB;
+ALTER TABLE t_p8223105_sochi_transfer_websi.news ADD COLUMN IF NOT EXISTS image_variants JSONB;
@@ -0,0 +1,30 @@
+-- Версии справочников для ETag / If-None-Match: любое изменение таблицы поднимает версию,
+-- GET отвечает 304 без чтения строк, пока версия не изменилась
+DROP TRIGGER IF EXISTS trg_tariffs_version ON t_p8223105_sochi_transfer_websi.tariffs;
+CREATE TRIGGER trg_tariffs_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.tariffs
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+DROP TRIGGER IF EXISTS trg_car_classes_version ON t_p8223105_sochi_transfer_websi.car_classes;
+CREATE TRIGGER trg_car_classes_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.car_classes
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+DROP TRIGGER IF EXISTS trg_transfer_types_version ON t_p8223105_sochi_transfer_websi.transfer_types;
+CREATE TRIGGER trg_transfer_types_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.transfer_types
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+DROP TRIGGER IF EXISTS trg_additional_services_version ON t_p8223105_sochi_transfer_websi.additional_services;
+CREATE TRIGGER trg_additional_services_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.additional_services
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+DROP TRIGGER IF EXISTS trg_fleet_version ON t_p8223105_sochi_transfer_websi.fleet;
+CREATE TRIGGER trg_fleet_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.fleet
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+INSERT INTO t_p8223105_sochi_transfer_websi.cache_versions (name)
+VALUES ('tariffs'), ('car_classes'), ('transfer_types'), ('additional_services'), ('fleet')
+ON CONFLICT (name) DO NOTHING;
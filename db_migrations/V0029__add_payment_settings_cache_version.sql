@@ -0,0 +1,8 @@
+-- Версия настроек оплаты для снимка каталога бронирования (?resource=catalog в tariffs)
+DROP TRIGGER IF EXISTS trg_payment_settings_version ON t_p8223105_sochi_transfer_websi.payment_settings;
+CREATE TRIGGER trg_payment_settings_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p8223105_sochi_transfer_websi.payment_settings
+    FOR EACH STATEMENT EXECUTE PROCEDURE t_p8223105_sochi_transfer_websi.bump_cache_version();
+
+INSERT INTO t_p8223105_sochi_transfer_websi.cache_versions (name) VALUES ('payment_settings')
+ON CONFLICT (name) DO NOTHING;
@@ -144,6 +144,8 @@ const BookingForm = () => {
   const [isLoggedIn, setIsLoggedIn] = useState(false);
   const [services, setServices] = useState<Service[]>([]);
   const [selectedServices, setSelectedServices] = useState<number[]>([]);
+  const [prepayPercent, setPrepayPercent] = useState(30);
+  const [groupPricePerPerson, setGroupPricePerPerson] = useState(1500);
 
   const [formData, setFormData] = useState({
     from_location: 'Аэропорт Сочи',
@@ -165,10 +167,8 @@ const BookingForm = () => {
   // ── Init ──────────────────────────────────────────────────────────────────
 
   useEffect(() => {
-    loadTariffs();
-    loadTransferConfig();
+    loadCatalog();
     checkAuth();
-    loadServices();
   }, []);
 
   const checkAuth = async () => {
@@ -188,37 +188,26 @@ const BookingForm = () => {
     }
   };
 
-  const loadTariffs = async () => {
+  // Tariffs, transfer types, car classes, services and payment settings in one cached document
+  const loadCatalog = async (): Promise<{ tariffs?: Tariff[] } | null> => {
     try {
-      const r = await fetch(`${API_URLS.tariffs}?active=true`);
+      const r = await fetch(API_URLS.catalog);
       const data = await r.json();
       setTariffs(data.tariffs || []);
+      if (data.transfer_types?.length) setTransferTypes(data.transfer_types);
+      if (data.car_classes?.length) setCarClasses(data.car_classes);
+      setServices(data.services || []);
+      const percent = Number(data.payment_settings?.prepay_percent);
+      if (percent > 0) setPrepayPercent(percent);
+      const groupPrice = Number(data.settings?.group_transfer_price_per_person);
+      if (groupPrice > 0) setGroupPricePerPerson(groupPrice);
+      return data;
     } catch (e) {
-      console.error('[BookingForm] loadTariffs error:', e);
+      console.error('[BookingForm] loadCatalog error:', e);
+      return null;
     }
   };
 
-  const loadTransferConfig = async () => {
-    try {
-      const [ttRes, ccRes] = await Promise.all([
-        fetch(`${API_URLS.transferTypes}&active=true`),
-        fetch(`${API_URLS.carClasses}&active=true`),
-      ]);
-      const ttData = await ttRes.json();
-      const ccData = await ccRes.json();
-      if (ttData.transfer_types?.length) setTransferTypes(ttData.transfer_types);
-      if (ccData.car_classes?.length) setCarClasses(ccData.car_classes);
-    } catch { /* use defaults */ }
-  };
-
-  const loadServices = async () => {
-    try {
-      const r = await fetch(`${API_URLS.services}&active=true`);
-      const d = await r.json();
-      setServices(d.services || []);
-    } catch { /* silent */ }
-  };
-
   const servicesTotal = selectedServices.reduce((sum, sid) => {
     const svc = services.find(s => s.id === sid);
     return sum + (svc ? svc.price : 0);
@@ -239,14 +228,14 @@ const BookingForm = () => {
     pCount?: number,
   ) => {
     if (type === 'group') {
-      return Math.round(1500 * (pCount ?? parseInt(formData.passengers_count) ?? 1));
+      return Math.round(groupPricePerPerson * (pCount ?? parseInt(formData.passengers_count) ?? 1));
     }
     const multiplier = parseFloat(String(carClasses.find(c => c.value === cls)?.price_multiplier ?? 1));
     return Math.round(base * multiplier);
   };
 
   const totalPrice = formData.price + servicesTotal;
-  const prepayAmount = Math.round(totalPrice * 0.3);
+  const prepayAmount = Math.round(totalPrice * prepayPercent / 100);
   const canPayByBalance = isLoggedIn && userBalance >= totalPrice && totalPrice > 0;
 
   // ── Field handlers ────────────────────────────────────────────────────────
@@ -329,6 +318,18 @@ const BookingForm = () => {
           window.location.href = data.payment_url;
           return;
         }
+        if (data.status === 'awaiting_link' && data.id) {
+          for (let attempt = 0; attempt < 5; attempt++) {
+            const payRes = await fetch(`${API_URLS.orders}?resource=payments&order_id=${data.id}`);
+            const payData = await payRes.json();
+            if (payData.payment?.payment_url) {
+              window.location.href = payData.payment.payment_url;
+              return;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1500));
+          }
+          toast({ title: 'Оплата позже', description: 'Ссылка на оплату появится в личном кабинете' });
+        }
         setSuccessOrderId(data.order_id ?? data.id ?? null);
         setIsSuccessDialogOpen(true);
         // Reset form
@@ -351,6 +352,18 @@ const BookingForm = () => {
         setBasePrice(0);
         setTransferType('individual');
         setCarClass('comfort');
+      } else if (response.status === 409 && data.quote) {
+        // Prices changed since the catalog was loaded — show the server quote and let the user resubmit
+        setFormData(prev => ({ ...prev, price: data.quote.base_price }));
+        // Later class/type/passenger changes recalculate from basePrice, so refresh it from the new catalog too
+        const catalog = await loadCatalog();
+        const freshTariff = catalog?.tariffs?.find(t => t.id.toString() === formData.tariff_id);
+        if (freshTariff) setBasePrice(freshTariff.price);
+        toast({
+          variant: 'destructive',
+          title: 'Цена изменилась',
+          description: `Актуальная стоимость: ${fmt(data.quote.price)} ₽`,
+        });
       } else {
         toast({
           variant: 'destructive',
@@ -782,7 +795,7 @@ const BookingForm = () => {
                     <PayOption
                       active={formData.payment_type === 'prepay' && !formData.payment_from_balance}
                       onClick={() => setFormData(prev => ({ ...prev, payment_type: 'prepay', payment_from_balance: false }))}
-                      label="Предоплата 30%"
+                      label={`Предоплата ${prepayPercent}%`}
                       price={`${fmt(prepayAmount)} ₽`}
                       sub={`+${fmt(totalPrice - prepayAmount)} ₽ при посадке`}
                     />
@@ -0,0 +1,27 @@
+import type { ImgHTMLAttributes } from 'react';
+
+export type ImageVariants = Partial<Record<'webp' | 'jpg', Record<string, string>>> | null;
+
+const toSrcSet = (urls?: Record<string, string>) =>
+  Object.entries(urls || {}).map(([width, url]) => `${url} ${width}w`).join(', ');
+
+interface ResponsiveImageProps extends Omit<ImgHTMLAttributes<HTMLImageElement>, 'src' | 'srcSet'> {
+  src: string;
+  variants?: ImageVariants;
+  sizes: string;
+}
+
+// Картинка с уменьшенными копиями из image_variants: браузер сам берёт самый лёгкий вариант под ширину экрана
+const ResponsiveImage = ({ src, variants, sizes, ...props }: ResponsiveImageProps) => {
+  if (!variants?.webp && !variants?.jpg) {
+    return <img src={src} loading="lazy" decoding="async" {...props} />;
+  }
+  return (
+    <picture>
+      {variants.webp && <source type="image/webp" srcSet={toSrcSet(variants.webp)} sizes={sizes} />}
+      <img src={src} srcSet={toSrcSet(variants.jpg) || undefined} sizes={sizes} loading="lazy" decoding="async" {...props} />
+    </picture>
+  );
+};
+
+export default ResponsiveImage;
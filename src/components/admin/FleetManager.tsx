@@ -10,6 +10,7 @@ import { Switch } from '@/components/ui/switch';
 import { Badge } from '@/components/ui/badge';
 import { useToast } from '@/hooks/use-toast';
 import { API_URLS } from '@/config/api';
+import { uploadFile } from '@/lib/uploads';
 import Icon from '@/components/ui/icon';
 
 interface Fleet {
@@ -131,28 +132,13 @@ const FleetManager = ({ onUpdate }: FleetManagerProps) => {
     if (!file.type.startsWith('image/')) { toast({ variant: 'destructive', title: 'Ошибка', description: 'Выберите изображение' }); return; }
     setIsUploading(true);
     try {
-      const reader = new FileReader();
-      reader.onload = async () => {
-        const base64 = (reader.result as string).split(',')[1];
-        const res = await fetch(API_URLS.fleet, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ action: 'upload_photo', filename: file.name, content_type: file.type, data: base64 }),
-        });
-        const data = await res.json();
-        if (data.url) {
-          setFormData(prev => ({ ...prev, image_url: data.url }));
-          toast({ title: 'Фото загружено!' });
-        } else {
-          toast({ variant: 'destructive', title: 'Ошибка', description: data.error || 'Не удалось загрузить фото' });
-        }
-        setIsUploading(false);
-      };
-      reader.readAsDataURL(file);
-    } catch {
-      toast({ variant: 'destructive', title: 'Ошибка', description: 'Не удалось загрузить фото' });
-      setIsUploading(false);
+      const url = await uploadFile(file, 'fleet');
+      setFormData(prev => ({ ...prev, image_url: url }));
+      toast({ title: 'Фото загружено!' });
+    } catch (err) {
+      toast({ variant: 'destructive', title: 'Ошибка', description: err instanceof Error ? err.message : 'Не удалось загрузить фото' });
     }
+    setIsUploading(false);
   };
 
   const resetForm = () => {
@@ -10,6 +10,7 @@ import { Badge } from '@/components/ui/badge';
 import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
 import { API_URLS } from '@/config/api';
+import { uploadFile } from '@/lib/uploads';
 
 interface NewsItem {
   id: number;
@@ -27,7 +28,7 @@ const NewsManager = () => {
   const [loading, setLoading] = useState(true);
   const [open, setOpen] = useState(false);
   const [editing, setEditing] = useState<NewsItem | null>(null);
-  const [form, setForm] = useState({ title: '', content: '', is_published: false, image_base64: '' });
+  const [form, setForm] = useState({ title: '', content: '', is_published: false, image_url: '' });
   const [saving, setSaving] = useState(false);
 
   useEffect(() => { loadNews(); }, []);
@@ -44,22 +45,25 @@ const NewsManager = () => {
 
   const openCreate = () => {
     setEditing(null);
-    setForm({ title: '', content: '', is_published: false, image_base64: '' });
+    setForm({ title: '', content: '', is_published: false, image_url: '' });
     setOpen(true);
   };
 
   const openEdit = (item: NewsItem) => {
     setEditing(item);
-    setForm({ title: item.title, content: item.content, is_published: item.is_published, image_base64: '' });
+    setForm({ title: item.title, content: item.content, is_published: item.is_published, image_url: item.image_url || '' });
     setOpen(true);
   };
 
-  const handleImageUpload = (e: React.ChangeEvent<HTMLInputElement>) => {
+  const handleImageUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0];
     if (!file) return;
-    const reader = new FileReader();
-    reader.onload = () => setForm(f => ({ ...f, image_base64: reader.result as string }));
-    reader.readAsDataURL(file);
+    try {
+      const url = await uploadFile(file, 'news');
+      setForm(f => ({ ...f, image_url: url }));
+    } catch (err) {
+      toast({ title: err instanceof Error ? err.message : 'Не удалось загрузить изображение', variant: 'destructive' });
+    }
   };
 
   const handleSave = async () => {
@@ -68,8 +72,8 @@ const NewsManager = () => {
     try {
       const method = editing ? 'PUT' : 'POST';
       const body = editing
-        ? { id: editing.id, title: form.title, content: form.content, is_published: form.is_published, image_base64: form.image_base64, image_url: editing.image_url }
-        : { title: form.title, content: form.content, is_published: form.is_published, image_base64: form.image_base64 };
+        ? { id: editing.id, title: form.title, content: form.content, is_published: form.is_published, image_url: form.image_url || editing.image_url }
+        : { title: form.title, content: form.content, is_published: form.is_published, image_url: form.image_url };
       const r = await fetch(API_URLS.news, { method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) });
       if (!r.ok) throw new Error();
       toast({ title: editing ? 'Новость обновлена' : 'Новость создана' });
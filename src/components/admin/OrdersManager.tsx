@@ -62,6 +62,8 @@ const PAYMENT_LABELS: Record<string, string> = { full: 'Полная', prepay: '
 
 const OrdersManager = ({ onUpdate }: OrdersManagerProps) => {
   const [orders, setOrders] = useState<Order[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [statuses, setStatuses] = useState<Status[]>([]);
   const [drivers, setDrivers] = useState<Driver[]>([]);
   const [selectedOrder, setSelectedOrder] = useState<Order | null>(null);
@@ -81,11 +83,26 @@ const OrdersManager = ({ onUpdate }: OrdersManagerProps) => {
       const response = await fetch(API_URLS.orders);
       const data = await response.json();
       setOrders(data.orders || []);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       toast({ variant: 'destructive', title: 'Ошибка', description: 'Не удалось загрузить заявки' });
     }
   };
 
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(`${API_URLS.orders}?cursor=${encodeURIComponent(nextCursor)}`);
+      const data = await response.json();
+      setOrders(prev => [...prev, ...(data.orders || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch {
+      toast({ variant: 'destructive', title: 'Ошибка', description: 'Не удалось загрузить заявки' });
+    }
+    setLoadingMore(false);
+  };
+
   const loadStatuses = async () => {
     try {
       const response = await fetch(API_URLS.statuses);
@@ -265,6 +282,13 @@ const OrdersManager = ({ onUpdate }: OrdersManagerProps) => {
               ))}
             </TableBody>
           </Table>
+          {nextCursor && (
+            <div className="flex justify-center pt-4">
+              <Button variant="outline" size="sm" onClick={loadMoreOrders} disabled={loadingMore}>
+                {loadingMore ? 'Загрузка...' : 'Загрузить ещё'}
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
 
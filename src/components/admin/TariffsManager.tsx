@@ -8,6 +8,7 @@ import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@
 import { Switch } from '@/components/ui/switch';
 import { useToast } from '@/hooks/use-toast';
 import { API_URLS } from '@/config/api';
+import { uploadFile } from '@/lib/uploads';
 import Icon from '@/components/ui/icon';
 
 interface Tariff {
@@ -36,7 +37,7 @@ const TariffsManager = ({ onUpdate }: TariffsManagerProps) => {
     duration: '',
     image_emoji: '🚗',
     is_active: true,
-    image_base64: ''
+    image_url: ''
   });
   const { toast } = useToast();
 
@@ -105,22 +106,26 @@ const TariffsManager = ({ onUpdate }: TariffsManagerProps) => {
       distance: tariff.distance || '',
       duration: tariff.duration || '',
       image_emoji: tariff.image_emoji,
-      is_active: tariff.is_active
+      is_active: tariff.is_active,
+      image_url: tariff.image_url || ''
     });
     setIsDialogOpen(true);
   };
 
   const resetForm = () => {
     setEditingTariff(null);
-    setFormData({ city: '', price: '', distance: '', duration: '', image_emoji: '🚗', is_active: true, image_base64: '' });
+    setFormData({ city: '', price: '', distance: '', duration: '', image_emoji: '🚗', is_active: true, image_url: '' });
   };
 
-  const handleImageUpload = (e: React.ChangeEvent<HTMLInputElement>) => {
+  const handleImageUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0];
     if (!file) return;
-    const reader = new FileReader();
-    reader.onload = () => setFormData(f => ({ ...f, image_base64: reader.result as string }));
-    reader.readAsDataURL(file);
+    try {
+      const url = await uploadFile(file, 'tariffs');
+      setFormData(f => ({ ...f, image_url: url }));
+    } catch (err) {
+      toast({ variant: 'destructive', title: 'Ошибка', description: err instanceof Error ? err.message : 'Не удалось загрузить изображение' });
+    }
   };
 
   return (
@@ -156,7 +161,7 @@ const TariffsManager = ({ onUpdate }: TariffsManagerProps) => {
               <div className="space-y-2">
                 <Label>Фото направления</Label>
                 <Input type="file" accept="image/*" onChange={handleImageUpload} />
-                {formData.image_base64 && <p className="text-xs text-green-600">✓ Изображение выбрано</p>}
+                {formData.image_url && <p className="text-xs text-green-600">✓ Изображение загружено</p>}
               </div>
               <div className="grid grid-cols-2 gap-4">
                 <div className="space-y-2">
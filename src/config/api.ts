@@ -7,6 +7,8 @@ export const API_URLS = {
   rideshares: `${ORDERS_BASE}?resource=rideshares`,
   paymentSettings: `${ORDERS_BASE}?resource=payment_settings`,
   tariffs: TARIFFS_BASE,
+  // Справочники формы бронирования одним запросом
+  catalog: `${TARIFFS_BASE}?resource=catalog`,
   fleet: 'https://functions.poehali.dev/cbf23917-dd96-4252-96bd-d85969ab5d2b',
   auth: `${AUTH_BASE}?resource=admin`,
   statuses: 'https://functions.poehali.dev/b59cb5c9-4937-4c43-b5ad-a535c69620cf',
@@ -30,6 +32,9 @@ export const API_URLS = {
   transferTypes: `${TARIFFS_BASE}?resource=transfer_types`,
   carClasses: `${TARIFFS_BASE}?resource=car_classes`,
 
+  // Прямая загрузка файлов в хранилище — через tariffs
+  uploads: `${TARIFFS_BASE}?resource=uploads`,
+
   // Managers — через auth
   managers: `${AUTH_BASE}?resource=managers`,
 };
\ No newline at end of file
@@ -0,0 +1,42 @@
+import { API_URLS } from '@/config/api';
+
+export type UploadFolder = 'drivers' | 'fleet' | 'tariffs' | 'news';
+
+interface UploadTicket {
+  key: string;
+  url: string;
+  method: string;
+  headers: Record<string, string>;
+}
+
+// Файлы идут напрямую в хранилище по presigned-ссылкам, функции получают только адреса.
+// Возвращает адреса в порядке файлов, null — файл не загрузился
+export async function uploadFiles(files: File[], folder: UploadFolder): Promise<(string | null)[]> {
+  if (!files.length) return [];
+  const createRes = await fetch(`${API_URLS.uploads}&action=create`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ folder, files: files.map(f => ({ name: f.name, content_type: f.type, size: f.size })) }),
+  });
+  const session = await createRes.json();
+  if (!createRes.ok) throw new Error(session.error || 'Не удалось начать загрузку');
+
+  const tickets: UploadTicket[] = session.uploads;
+  await Promise.allSettled(tickets.map((t, i) => fetch(t.url, { method: t.method, headers: t.headers, body: files[i] })));
+
+  const confirmRes = await fetch(`${API_URLS.uploads}&action=confirm`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ session_id: session.session_id }),
+  });
+  const confirmed = await confirmRes.json();
+  if (!confirmRes.ok) throw new Error(confirmed.error || 'Не удалось подтвердить загрузку');
+  const urls = new Map<string, string>((confirmed.files || []).map((f: { key: string; url: string }) => [f.key, f.url]));
+  return tickets.map(t => urls.get(t.key) ?? null);
+}
+
+export async function uploadFile(file: File, folder: UploadFolder): Promise<string> {
+  const [url] = await uploadFiles([file], folder);
+  if (!url) throw new Error('Не удалось загрузить файл');
+  return url;
+}
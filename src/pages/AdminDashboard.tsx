@@ -70,13 +70,13 @@ const AdminDashboard = () => {
   const loadStats = async () => {
     try {
       const [ordersRes, tariffsRes, fleetRes, driversRes, ridesharesRes] = await Promise.all([
-        fetch(API_URLS.orders),
+        fetch(`${API_URLS.orders}?resource=stats`),
         fetch(`${API_URLS.tariffs}?active=true`),
         fetch(`${API_URLS.fleet}?active=true`),
         fetch(`${API_URLS.drivers}&action=list`),
         fetch('https://functions.poehali.dev/bb30d9f0-aad2-4e73-a102-04fb8211f7ae?resource=rideshares&admin=true')
       ]);
-      const ordersData = await ordersRes.json();
+      const ordersStats = await ordersRes.json();
       const tariffsData = await tariffsRes.json();
       const fleetData = await fleetRes.json();
       const driversData = await driversRes.json();
@@ -84,8 +84,8 @@ const AdminDashboard = () => {
       const pending = (driversData.drivers || []).filter((d: { status: string }) => d.status === 'pending').length;
       const activeRideshares = (ridesharesData.rideshares || []).filter((r: { status: string }) => r.status === 'active').length;
       setStats({
-        totalOrders: ordersData.orders?.length || 0,
-        newOrders: ordersData.orders?.filter((o: { status_id: number }) => o.status_id === 1).length || 0,
+        totalOrders: ordersStats.totals?.orders_count || 0,
+        newOrders: (ordersStats.by_status || []).find((s: { status_id: number }) => s.status_id === 1)?.orders_count || 0,
         activeTariffs: tariffsData.tariffs?.length || 0,
         activeFleet: fleetData.fleet?.length || 0,
         pendingDrivers: pending,
@@ -8,6 +8,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@
 import { Badge } from '@/components/ui/badge';
 import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
+import { uploadFiles } from '@/lib/uploads';
 import { API_URLS } from '@/config/api';
 
 // ─── Static data ──────────────────────────────────────────────────────────────
@@ -320,8 +321,28 @@ const DriverRegister = () => {
 
     setLoading(true);
     try {
-      // Build payload WITHOUT base64 blobs to keep payload small
-      // Files field stays empty — backend handles file uploads separately
+      // Files go straight to storage; the function receives only their URLs
+      const docEntries = Object.entries(docFiles).filter(
+        (e): e is [string, { preview: string; name: string; file: File }] => Boolean(e[1]),
+      );
+      let fileUrls: Record<string, string> = {};
+      let carPhotoUrls: string[] = [];
+      if (docEntries.length || carPhotoFiles.length) {
+        try {
+          const urls = await uploadFiles([...docEntries.map(([, d]) => d.file), ...carPhotoFiles], 'drivers');
+          fileUrls = Object.fromEntries(
+            docEntries.map(([key], i) => [key, urls[i]]).filter(([, url]) => url),
+          ) as Record<string, string>;
+          carPhotoUrls = urls.slice(docEntries.length).filter((u): u is string => Boolean(u));
+          if (urls.some(u => !u)) {
+            toast({ title: 'Часть файлов не загрузилась', description: 'Их можно будет прислать позже' });
+          }
+        } catch (e) {
+          console.error('[DriverRegister] upload error:', e);
+          toast({ title: 'Документы не загрузились', description: 'Их можно будет прислать позже' });
+        }
+      }
+
       const payload: Record<string, unknown> = {
         action: 'register',
         name: form.name.trim(),
@@ -335,8 +356,8 @@ const DriverRegister = () => {
         car_number_country: form.car_number_country,
         driver_type: form.driver_type,
         car_category: form.car_category,
-        files: {},
-        car_photos: [],
+        file_urls: fileUrls,
+        car_photo_urls: carPhotoUrls,
       };
 
       const r = await fetch(API_URLS.drivers, {
@@ -9,6 +9,7 @@ import { Label } from '@/components/ui/label';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
 import Icon from '@/components/ui/icon';
 import BookingForm from '@/components/BookingForm';
+import ResponsiveImage, { type ImageVariants } from '@/components/ResponsiveImage';
 import { API_URLS } from '@/config/api';
 
 const Index = () => {
@@ -562,7 +563,13 @@ const Index = () => {
               >
                 <CardHeader className="text-center pb-3 md:pb-4">
                   {tariff.image_url ? (
-                    <img src={String(tariff.image_url)} alt={String(tariff.city)} className="w-full h-28 md:h-32 object-cover rounded-lg mb-3" />
+                    <ResponsiveImage
+                      src={String(tariff.image_url)}
+                      variants={tariff.image_variants as ImageVariants}
+                      sizes="(min-width: 1024px) 25vw, (min-width: 640px) 50vw, 100vw"
+                      alt={String(tariff.city)}
+                      className="w-full h-28 md:h-32 object-cover rounded-lg mb-3"
+                    />
                   ) : (
                     <div className="text-4xl md:text-6xl mb-3">{String(tariff.image_emoji || '🚗')}</div>
                   )}
@@ -632,8 +639,10 @@ const Index = () => {
               >
                 <CardHeader className="text-center p-3 md:p-6">
                   {car.image_url ? (
-                    <img
+                    <ResponsiveImage
                       src={String(car.image_url)}
+                      variants={car.image_variants as ImageVariants}
+                      sizes="(min-width: 1024px) 25vw, 50vw"
                       alt={String(car.name)}
                       className="w-full h-28 md:h-40 object-cover rounded-lg mb-2 md:mb-3"
                     />
@@ -877,8 +886,10 @@ const Index = () => {
                   onClick={() => navigate('/news')}
                 >
                   {n.image_url && (
-                    <img
+                    <ResponsiveImage
                       src={String(n.image_url)}
+                      variants={n.image_variants as ImageVariants}
+                      sizes="(min-width: 768px) 33vw, 100vw"
                       alt={String(n.title)}
                       className="w-full h-36 md:h-40 object-cover rounded-t-lg"
                     />
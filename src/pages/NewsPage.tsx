@@ -6,12 +6,14 @@ import { Button } from '@/components/ui/button';
 import { Skeleton } from '@/components/ui/skeleton';
 import Icon from '@/components/ui/icon';
 import { API_URLS } from '@/config/api';
+import ResponsiveImage, { type ImageVariants } from '@/components/ResponsiveImage';
 
 interface NewsItem {
   id: number;
   title: string;
   content: string;
   image_url: string | null;
+  image_variants?: ImageVariants;
   is_published: boolean;
   published_at: string | null;
   created_at: string;
@@ -51,7 +53,8 @@ const NewsPage = () => {
         </nav>
         <div className="container mx-auto px-4 py-8 max-w-3xl">
           {selected.image_url && (
-            <img src={selected.image_url} alt={selected.title} className="w-full h-64 object-cover rounded-2xl mb-6" />
+            <ResponsiveImage src={selected.image_url} variants={selected.image_variants} sizes="(min-width: 768px) 768px, 100vw"
+              alt={selected.title} className="w-full h-64 object-cover rounded-2xl mb-6" />
           )}
           <div className="flex items-center gap-2 mb-3 text-muted-foreground text-sm">
             <Icon name="Calendar" className="h-4 w-4" />
@@ -121,7 +124,8 @@ const NewsPage = () => {
               <Card key={item.id} className="overflow-hidden hover:shadow-xl transition-all cursor-pointer group" onClick={() => setSelected(item)}>
                 {item.image_url ? (
                   <div className="h-48 overflow-hidden">
-                    <img src={item.image_url} alt={item.title} className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300" />
+                    <ResponsiveImage src={item.image_url} variants={item.image_variants} sizes="(min-width: 640px) 384px, 100vw"
+                      alt={item.title} className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300" />
                   </div>
                 ) : (
                   <div className="h-48 bg-gradient-to-br from-primary/20 to-primary/5 flex items-center justify-center">
@@ -44,6 +44,8 @@ const Rideshares = () => {
   const { toast } = useToast();
   const [rides, setRides] = useState<Rideshare[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showCreateDialog, setShowCreateDialog] = useState(false);
   const [showBookDialog, setShowBookDialog] = useState(false);
   const [showCancelDialog, setShowCancelDialog] = useState(false);
@@ -79,6 +81,7 @@ const Rideshares = () => {
       const res = await fetch(API_URLS.rideshares);
       const data = await res.json();
       setRides(data.rideshares || []);
+      setNextCursor(data.next_cursor || null);
     } catch {
       toast({ variant: 'destructive', title: 'Ошибка', description: 'Не удалось загрузить поездки' });
     } finally {
@@ -86,6 +89,20 @@ const Rideshares = () => {
     }
   };
 
+  const loadMoreRides = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const res = await fetch(`${API_URLS.rideshares}&cursor=${encodeURIComponent(nextCursor)}`);
+      const data = await res.json();
+      setRides(prev => [...prev, ...(data.rideshares || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch {
+      toast({ variant: 'destructive', title: 'Ошибка', description: 'Не удалось загрузить поездки' });
+    }
+    setLoadingMore(false);
+  };
+
   const handleCreate = async (e: React.FormEvent) => {
     e.preventDefault();
     setIsSubmitting(true);
@@ -288,6 +305,13 @@ const Rideshares = () => {
             ))}
           </div>
         )}
+        {!loading && nextCursor && (
+          <div className="flex justify-center mt-8">
+            <Button variant="outline" onClick={loadMoreRides} disabled={loadingMore}>
+              {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+            </Button>
+          </div>
+        )}
       </div>
 
       {/* Диалог создания поездки */}